@@ -2,6 +2,8 @@ import os
 import json
 import time
 import asyncio
+import shutil
+import tempfile
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, List, Optional
@@ -11,6 +13,9 @@ from bs4 import BeautifulSoup
 import ast
 import re
 import cssutils
+from agentLoop.event_bus import AgentEventType, publish_event
+from utils.report_registry import get_report_registry
+from utils.report_serving import is_compressed_sibling
 
 # Simple imports for Python execution
 SAFE_BUILTINS = {
@@ -28,6 +33,9 @@ SAFE_BUILTINS = {
     }
 }
 
+# Raced code variants each write here (one directory per variant) until a winner is promoted
+RACE_STAGING_ROOT = Path("media/staging")
+
 def log_step(message, symbol="🔧"):
     """Simple logging with timestamp"""
     timestamp = datetime.now().strftime("%H:%M:%S")
@@ -67,11 +75,13 @@ async def process_direct_files(files_dict: Dict[str, str], session_id: str) -> D
             filepath = output_dir / safe_filename
             
             # Write file with UTF-8 encoding (handles Unicode)
+            encoded = content.encode('utf-8')
             with open(filepath, 'w', encoding='utf-8') as f:
                 f.write(content)
+            get_report_registry().register(session_id, filepath, encoded)
             
             # Track results
-            file_size = len(content.encode('utf-8'))
+            file_size = len(encoded)
             results["created_files"].append(str(filepath))
             results["total_size"] += file_size
             
@@ -94,25 +104,62 @@ async def process_direct_files(files_dict: Dict[str, str], session_id: str) -> D
 def make_tool_proxy(tool_name: str, mcp):
     """Create async proxy function for MCP tools"""
     async def _tool_fn(*args):
-        return await mcp.function_wrapper(tool_name, *args)
+        start = time.perf_counter()
+        try:
+            result = await mcp.function_wrapper(tool_name, *args)
+        except Exception as e:
+            publish_event(AgentEventType.TOOL_CALLED, tool=tool_name, success=False, error=str(e),
+                          duration=time.perf_counter() - start, message=f"Tool {tool_name} failed: {e}")
+            raise
+        publish_event(AgentEventType.TOOL_CALLED, tool=tool_name, success=True,
+                      duration=time.perf_counter() - start, message=f"Tool {tool_name} called")
+        return result
     return _tool_fn
 
-def create_file_utilities(session_id: str):
-    """Create file utility functions for the execution context"""
+def snapshot_files(directory: Path) -> Dict[str, float]:
+    """{path: mtime} of every file in a directory (compressed report siblings excluded)"""
+    if not directory.exists():
+        return {}
+    return {str(f): f.stat().st_mtime for f in directory.iterdir() if f.is_file() and not is_compressed_sibling(f)}
+
+def snapshot_session_files(session_id: str) -> Dict[str, float]:
+    """{path: mtime} of every file in the session's output directory"""
+    return snapshot_files(Path(f"media/generated/{session_id}"))
+
+def publish_created_files(session_id: str, before: Dict[str, float]):
+    """Publish file_created for files added or rewritten since `before` was taken"""
+    for path, mtime in snapshot_session_files(session_id).items():
+        if before.get(path) != mtime:
+            publish_event(AgentEventType.FILE_CREATED, session_id, path=path, filename=Path(path).name,
+                          size=Path(path).stat().st_size, message=f"File created: {path}")
+            # Reports written by plain open() in user code; a no-op for ones already registered by the writers
+            get_report_registry().register(session_id, path)
+
+def create_file_utilities(session_id: str, write_dir: Path = None):
+    """
+    Create file utility functions for the execution context; writes go to
+    write_dir (a raced variant's staging directory) when given, reads see it
+    first and then the session directory
+    """
     session_dir = Path(f"media/generated/{session_id}")
+    write_dir = write_dir or session_dir
+    staged = write_dir != session_dir
     
     def find_file(filename: str) -> str:
         """Find a file in the session directory"""
-        file_path = session_dir / filename
-        if file_path.exists():
-            return str(file_path)
+        for directory in (write_dir, session_dir):
+            file_path = directory / filename
+            if file_path.exists():
+                return str(file_path)
         raise FileNotFoundError(f"File '{filename}' not found in session {session_id}")
     
     def get_session_files() -> list:
         """Get all files in the session directory"""
-        if session_dir.exists():
-            return [str(f) for f in session_dir.iterdir() if f.is_file()]
-        return []
+        files = {}
+        for directory in (session_dir, write_dir):
+            if directory.exists():
+                files.update({f.name: str(f) for f in directory.iterdir() if f.is_file()})
+        return list(files.values())
     
     def read_session_file(filename: str) -> str:
         """Read a file from the session directory"""
@@ -122,10 +169,12 @@ def create_file_utilities(session_id: str):
     
     def write_session_file(filename: str, content: str) -> str:
         """Write a file to the session directory"""
-        session_dir.mkdir(parents=True, exist_ok=True)
-        file_path = session_dir / filename
+        write_dir.mkdir(parents=True, exist_ok=True)
+        file_path = write_dir / filename
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(content)
+        if not staged:  # Staged files are registered when their variant is promoted
+            get_report_registry().register(session_id, file_path, content.encode('utf-8'))
         return str(file_path)
     
     return {
@@ -135,15 +184,18 @@ def create_file_utilities(session_id: str):
         'write_session_file': write_session_file
     }
 
-async def execute_python_code_variant(code: str, multi_mcp, session_id: str, inputs: dict = None) -> dict:
+async def execute_python_code_variant(code: str, multi_mcp, session_id: str, inputs: dict = None,
+                                      output_dir: Path = None) -> dict:
     """
-    Execute a single Python code variant with safety
+    Execute a single Python code variant with safety; output_dir defaults to the session directory
     """
     start_time = time.perf_counter()
     
     # Setup execution environment
-    output_dir = Path(f"media/generated/{session_id}")
+    session_dir = Path(f"media/generated/{session_id}")
+    output_dir = Path(output_dir) if output_dir else session_dir
     output_dir.mkdir(parents=True, exist_ok=True)
+    files_before = snapshot_files(output_dir)
     
     # Create tool proxies using function_wrapper
     tool_funcs = {}
@@ -152,7 +204,7 @@ async def execute_python_code_variant(code: str, multi_mcp, session_id: str, inp
             tool_funcs[tool.name] = make_tool_proxy(tool.name, multi_mcp)
     
     # Build safe execution context
-    file_utils = create_file_utilities(session_id)
+    file_utils = create_file_utilities(session_id, output_dir)
     safe_globals = {
         **SAFE_BUILTINS,
         **tool_funcs,
@@ -213,10 +265,8 @@ async def execute_python_code_variant(code: str, multi_mcp, session_id: str, inp
         # Execute the async function
         result = await local_vars['__async_exec']()
         
-        # Find created files
-        created_files = []
-        if output_dir.exists():
-            created_files = [str(f) for f in output_dir.iterdir() if f.is_file()]
+        # Files this variant added or rewrote (not everything earlier steps left in the directory)
+        created_files = [path for path, mtime in snapshot_files(output_dir).items() if files_before.get(path) != mtime]
         
         # Extract result
         if result is None:
@@ -292,6 +342,96 @@ async def execute_code_variants(code_variants: dict, multi_mcp, session_id: str,
         "all_errors": all_errors
     }
 
+def _rebase_paths(value, old: str, new: str):
+    """Point paths inside a variant's result at where its files were promoted to"""
+    if isinstance(value, str):
+        return value.replace(old, new)
+    if isinstance(value, dict):
+        return {key: _rebase_paths(item, old, new) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rebase_paths(item, old, new) for item in value]
+    return value
+
+def promote_variant_files(result: dict, variant_dir: Path, session_id: str) -> dict:
+    """Move the winning variant's files into the session directory and register them"""
+    session_dir = Path(f"media/generated/{session_id}")
+    session_dir.mkdir(parents=True, exist_ok=True)
+    promoted = []
+    for path in result["created_files"]:
+        target = session_dir / Path(path).name
+        os.replace(path, target)
+        get_report_registry().register(session_id, target)
+        promoted.append(str(target))
+    result = _rebase_paths({**result, "created_files": []}, str(variant_dir), str(session_dir))
+    result["created_files"] = promoted
+    return result
+
+async def race_code_variants(code_variants: dict, multi_mcp, session_id: str, inputs: dict = None) -> dict:
+    """
+    Execute all code variants concurrently - first success wins, the rest are cancelled.
+    Each variant writes to its own staging directory (output_dir / write_session_file),
+    so only the winner's files reach the session directory.
+    """
+    start_time = time.perf_counter()
+    
+    sorted_variants = sorted(code_variants.items())
+    log_step(f"🏁 Racing {len(sorted_variants)} Python code variants", symbol="🧪")
+    
+    RACE_STAGING_ROOT.mkdir(parents=True, exist_ok=True)
+    staging_dir = Path(tempfile.mkdtemp(prefix=f"{session_id}_", dir=RACE_STAGING_ROOT))
+    variant_dirs = {variant_name: staging_dir / variant_name for variant_name, _ in sorted_variants}
+    tasks = {
+        asyncio.create_task(execute_python_code_variant(code, multi_mcp, session_id, inputs,
+                                                        output_dir=variant_dirs[variant_name])): variant_name
+        for variant_name, code in sorted_variants
+    }
+    all_errors = []
+    
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            
+            # Break ties between variants finishing together by priority order
+            for task in sorted(done, key=lambda t: tasks[t]):
+                variant_name = tasks[task]
+                result = task.result()
+                
+                if result["status"] == "success":
+                    # Stop the losers before promoting, so none of them writes after the winner's files land
+                    for loser in pending:
+                        loser.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    result = promote_variant_files(result, variant_dirs[variant_name], session_id)
+                    result["successful_variant"] = variant_name
+                    result["total_variants_tried"] = len(sorted_variants)
+                    result["cancelled_variants"] = len(pending)
+                    result["all_errors"] = all_errors
+                    
+                    log_step(f"✅ {variant_name} won the race ({len(pending)} cancelled)", symbol="🎉")
+                    return result
+                
+                error_msg = f"{variant_name}: {result['error']}"
+                all_errors.append(error_msg)
+                log_step(f"❌ {variant_name} failed: {result['error']}", symbol="🚨")
+    finally:
+        losers = [task for task in tasks if not task.done()]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    log_step(f"💀 All {len(sorted_variants)} variants failed", symbol="❌")
+    return {
+        "status": "failed",
+        "result": {},
+        "created_files": [],
+        "execution_time": time.perf_counter() - start_time,
+        "error": f"All code variants failed. Errors: {'; '.join(all_errors)}",
+        "failed_variants": len(sorted_variants),
+        "all_errors": all_errors
+    }
+
 async def process_ast_updates(ast_updates: dict, session_id: str) -> dict:
     """Process AST-based file updates"""
     results = {
@@ -393,7 +533,7 @@ def apply_js_operations(content: str, operations: list) -> str:
     
     return content
 
-async def run_user_code(output_data: dict, multi_mcp, session_id: str = "default_session", inputs: dict = None) -> dict:
+async def run_user_code(output_data: dict, multi_mcp, session_id: str = "default_session", inputs: dict = None, race_variants: bool = False) -> dict:
     """
     Main execution function: handles direct files, Python code, or both
     
@@ -402,6 +542,7 @@ async def run_user_code(output_data: dict, multi_mcp, session_id: str = "default
         multi_mcp: MCP client for tool calls
         session_id: Session identifier
         inputs: Input data for current task (from output_chain)
+        race_variants: Run code variants concurrently, first success wins
         
     Returns:
         Combined results from file creation and/or code execution
@@ -429,6 +570,7 @@ async def run_user_code(output_data: dict, multi_mcp, session_id: str = "default
     }
     
     log_step(f"🚀 Executor starting for session {session_id}", symbol="⚡")
+    files_before = snapshot_session_files(session_id)
     
     try:
         # Phase 1: Process Direct Files (if present)
@@ -448,7 +590,8 @@ async def run_user_code(output_data: dict, multi_mcp, session_id: str = "default
         if "code_variants" in output_data and output_data["code_variants"]:
             log_step("🐍 Phase 2: Python code execution", symbol="⚙️")
             
-            code_results = await execute_code_variants(
+            run_variants = race_code_variants if race_variants else execute_code_variants
+            code_results = await run_variants(
                 output_data["code_variants"], multi_mcp, session_id, inputs
             )
             results["code_results"] = code_results
@@ -490,6 +633,7 @@ async def run_user_code(output_data: dict, multi_mcp, session_id: str = "default
             variant_info = f" ({results['code_results']['successful_variant']} succeeded)"
         
         log_step(f"🏁 Completed: {ops} | {file_count} files{variant_info} | {results['total_time']:.2f}s", symbol="✅")
+        publish_created_files(session_id, files_before)
         
         # 🚨 DEBUG: Print final executor result
         print(f"\n🚨 EXECUTOR FINAL RESULT:")
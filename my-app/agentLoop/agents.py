@@ -1,14 +1,27 @@
 import yaml
-import json
 from pathlib import Path
 from typing import Optional, List
 from agentLoop.model_manager import ModelManager
+from agentLoop.rate_limiter import get_rate_limiter, estimate_tokens
+from agentLoop.event_bus import AgentEventType, publish_event
+from agentLoop.prompt_templates import get_prompt_templates
+from agentLoop.response_cache import (ResponseCache, abstract_file_paths, get_response_cache, normalize_request,
+                                      restore_file_paths)
+from agentLoop.usage_tracker import empty_usage
+from agentLoop.prompt_compaction import compact_context, render_value
 from utils.json_parser import parse_llm_json
 from utils.utils import log_step, log_error
 from PIL import Image
 import os
+import time
 
 
+# Streaming agents publish their accumulated output at most this often
+TOKEN_FLUSH_INTERVAL_SECONDS = 0.05
+
+# Usage reported for a response replayed from the response cache
+NO_USAGE = {**empty_usage(), "total_tokens": 0, "estimated": False}
+
 class AgentRunner:
     def __init__(self, multi_mcp):
         self.multi_mcp = multi_mcp
@@ -18,6 +31,27 @@ class AgentRunner:
         with open(config_path, "r", encoding="utf-8") as f:
             self.agent_configs = yaml.safe_load(f)["agents"]
 
+    async def _stream_response(self, pieces, agent_type, session_id, step_id):
+        """Publish agent_token events while the model generates; returns the assembled text like generate_text"""
+        parts = []
+        pending = ""
+        offset = 0
+        flushed_at = time.monotonic()
+        async for piece in pieces:
+            parts.append(piece)
+            pending += piece
+            # Batch per-token streams (Ollama) so the bus sees a few events per second, not one per token
+            if time.monotonic() - flushed_at >= TOKEN_FLUSH_INTERVAL_SECONDS:
+                publish_event(AgentEventType.AGENT_TOKEN, session_id, agent=agent_type, step_id=step_id,
+                              delta=pending, offset=offset)
+                offset += len(pending)
+                pending = ""
+                flushed_at = time.monotonic()
+        if pending:
+            publish_event(AgentEventType.AGENT_TOKEN, session_id, agent=agent_type, step_id=step_id,
+                          delta=pending, offset=offset)
+        return "".join(parts).strip()
+
     def _analyze_file_strategy(self, uploaded_files):
         """Analyze files to determine best upload strategy"""
         total_size = 0
@@ -161,36 +195,10 @@ class AgentRunner:
                 return {"success": False, "error": f"Unknown agent: {agent_type}"}
             
             agent_config = self.agent_configs[agent_type]
-            
-            # ✅ UNIFIED FILE DETECTION - Check multiple input sources
-            all_files = self._detect_files_in_inputs(input_data)
-            file_contents = []
-            
-            # Process files if found
-            if all_files:
-                strategy = self._analyze_file_strategy(all_files)
-                # log_step(f"📁 File strategy: {strategy} for {len(all_files)} files")
-                
-                # Initialize model manager for Files API uploads
-                model_manager = ModelManager(agent_config.get("model", "gemini-2.5-pro"))
-                
-                # Process files based on strategy
-                for file_path in all_files:
-                    if strategy == "inline_batch":
-                        # Load as inline data
-                        content = self._load_file_content(file_path, strategy)
-                        if content:
-                            file_contents.append(content)
-                    else:
-                        # Upload to Files API
-                        uploaded_file = model_manager.client.files.upload(
-                            file=file_path
-                        )
-                        file_contents.append(uploaded_file)
-                        # log_step(f"📤 Uploaded {file_path} to Files API")
-            else:
-                # Initialize model manager for text-only requests
-                model_manager = ModelManager(agent_config.get("model", "gemini-2.5-pro"))
+            session_id = input_data.get("session_context", {}).get("session_id")
+            step_id = input_data.get("step_id")
+            model_key = agent_config.get("model", "gemini-2.5-pro")
+            model_manager = ModelManager(model_key, session_id=session_id, step_id=step_id)
 
             # Load system prompt
             prompt_file_path = agent_config.get('prompt_file')
@@ -201,41 +209,70 @@ class AgentRunner:
             if not system_prompt_path.exists():
                 return {"success": False, "error": f"Prompt file not found: {prompt_file_path}"}
                 
-            with open(system_prompt_path, "r", encoding="utf-8") as f:
-                system_prompt = f.read()
+            system_prompt = get_prompt_templates().text(system_prompt_path)
 
             # Build the full prompt
-            full_prompt = self._build_prompt(system_prompt, input_data)
+            full_prompt, compaction = self._build_prompt(system_prompt, input_data, agent_config.get("input_token_budget"))
+            if compaction.raw_tokens:
+                truncated = f", values cut to {compaction.truncated_to_chars} chars" if compaction.truncated_to_chars else ""
+                log_step(f"🗜️ {agent_type} context ~{compaction.raw_tokens} → ~{compaction.compact_tokens} tokens{truncated}")
+            
+            # ✅ UNIFIED FILE DETECTION - Check multiple input sources
+            all_files = self._detect_files_in_inputs(input_data)
 
-            # Replace the simple sleep with animated timer
-            #await self._show_timer_animation(30, f"🤖 {agent_type} Waiting before calling Gemini")
+            # ✅ Identical request answered before: no uploads, no rate limit budget, no model call
+            response_cache = get_response_cache()
+            cache_key = None
+            response = None
+            if response_cache.enabled and agent_config.get("cache"):
+                request = normalize_request(system_prompt, input_data, agent_config.get("input_token_budget"), all_files)
+                cache_key = ResponseCache.make_key(model_key, model_manager.model_info.get("model"),
+                                                   model_manager.generation_config, request, all_files)
+                response = response_cache.get(cache_key)
+            cached = response is not None
+            if cached:
+                response = restore_file_paths(response, all_files)
             
-            # ✅ TRACK RESPONSE AND METADATA
-            if file_contents:
-                # Files present - send files + prompt
-                log_step(f"🤖 {agent_type} (with {len(file_contents)} files)")
-                response = await model_manager.generate_content([*file_contents, full_prompt])
+            if cached:
+                log_step(f"♻️ {agent_type} (cached response)")
+                publish_event(AgentEventType.AGENT_EXECUTING, session_id, agent=agent_type, step_id=step_id,
+                              message=f"{agent_type} (cached response)")
+                if agent_config.get("stream"):
+                    publish_event(AgentEventType.AGENT_TOKEN, session_id, agent=agent_type, step_id=step_id,
+                                  delta=response, offset=0)
             else:
-                # Text only
-                log_step(f"💬 {agent_type} (text only)")
-                response = await model_manager.generate_text(full_prompt)
+                started = time.monotonic()
+                response = await self._generate(agent_type, agent_config, model_manager, full_prompt, all_files,
+                                                session_id, step_id)
+                generation_seconds = time.monotonic() - started
 
             # ✅ PARSE JSON AND INCLUDE METADATA (like original)
             try:
                 # Try to parse as JSON first
                 parsed_output = parse_llm_json(response)
                 
-                # ✅ FIXED: Correct Gemini 2.0 Flash pricing
-                input_token_count = len(full_prompt.split()) * 1.5  # Fixed: 1.5 not 1.3
-                output_token_count = len(response.split()) * 1.5   # Fixed: 1.5 not 1.3
-                estimated_cost = (input_token_count * 0.00000015) + (output_token_count * 0.0000006)  # Correct Gemini pricing
+                # Only responses that parse are worth replaying
+                if cache_key and not cached:
+                    response_cache.set(cache_key, abstract_file_paths(response, all_files),
+                                       agent_config.get("cache_ttl_seconds"), generation_seconds)
+                
+                # ✅ Provider-reported usage priced from models.json (a cached response used no tokens)
+                usage = NO_USAGE if cached else model_manager.last_usage
+                
+                publish_event(AgentEventType.TOKEN_USAGE, session_id, agent=agent_type, model=model_key,
+                              step_id=step_id, input_tokens=usage["input_tokens"],
+                              output_tokens=usage["output_tokens"], cached_tokens=usage["cached_tokens"],
+                              thinking_tokens=usage["thinking_tokens"], cost=usage["cost"],
+                              estimated=usage["estimated"], cached=cached,
+                              context_tokens_raw=compaction.raw_tokens, context_tokens_compact=compaction.compact_tokens)
                 
                 result_with_metadata = {
                     **parsed_output,
-                    "cost": estimated_cost,
-                    "input_tokens": input_token_count,
-                    "output_tokens": output_token_count,
-                    "total_tokens": input_token_count + output_token_count
+                    "cost": usage["cost"],
+                    "input_tokens": usage["input_tokens"],
+                    "output_tokens": usage["output_tokens"],
+                    "total_tokens": usage["total_tokens"],
+                    "cached": cached
                 }
                 
                 return {"success": True, "output": result_with_metadata}
@@ -249,8 +286,73 @@ class AgentRunner:
             log_error(f"Agent {agent_type} failed: {e}")
             return {"success": False, "error": str(e)}
 
-    def _build_prompt(self, system_prompt, input_data):
-        """Build the complete prompt from system prompt and input data"""
+    async def _generate(self, agent_type, agent_config, model_manager, full_prompt, all_files, session_id, step_id):
+        """Attach files, wait for rate limit budget, call the model and settle the budget with the real usage"""
+        file_contents = []
+        
+        # Process files if found
+        if all_files:
+            strategy = self._analyze_file_strategy(all_files)
+            # log_step(f"📁 File strategy: {strategy} for {len(all_files)} files")
+            
+            # Process files based on strategy
+            for file_path in all_files:
+                if strategy == "inline_batch":
+                    # Load as inline data
+                    content = self._load_file_content(file_path, strategy)
+                    if content:
+                        file_contents.append(content)
+                else:
+                    # Upload to Files API
+                    uploaded_file = model_manager.client.files.upload(
+                        file=file_path
+                    )
+                    file_contents.append(uploaded_file)
+                    # log_step(f"📤 Uploaded {file_path} to Files API")
+
+        # ✅ Shared RPM/TPM budget - only waits when the model's bucket is empty
+        model_key = agent_config.get("model", "gemini-2.5-pro")
+        limiter = get_rate_limiter(model_key)
+        estimated_tokens = estimate_tokens(full_prompt)
+        waited = await limiter.acquire(estimated_tokens)
+        if waited > 0:
+            log_step(f"⏳ {agent_type} waited {waited:.1f}s for {model_key} rate limit")
+        
+        response = await self._call_model(agent_type, agent_config, model_manager, full_prompt, file_contents,
+                                          session_id, step_id)
+        
+        # Tokens-per-minute quotas count prompt tokens: settle the estimate against the real count
+        if not model_manager.last_usage["estimated"]:
+            await limiter.reconcile(estimated_tokens, model_manager.last_usage["input_tokens"])
+        return response
+
+    async def _call_model(self, agent_type, agent_config, model_manager, full_prompt, file_contents, session_id, step_id):
+        """Send files + prompt (or the prompt alone), streaming for `stream: true` agents"""
+        # ✅ TRACK RESPONSE AND METADATA
+        if file_contents:
+            # Files present - send files + prompt
+            log_step(f"🤖 {agent_type} (with {len(file_contents)} files)")
+            publish_event(AgentEventType.AGENT_EXECUTING, session_id, agent=agent_type, step_id=step_id,
+                          message=f"{agent_type} (with {len(file_contents)} files)")
+            if agent_config.get("stream"):
+                return await self._stream_response(model_manager.generate_content_stream([*file_contents, full_prompt]),
+                                                   agent_type, session_id, step_id)
+            return await model_manager.generate_content([*file_contents, full_prompt])
+        
+        # Text only
+        log_step(f"💬 {agent_type} (text only)")
+        publish_event(AgentEventType.AGENT_EXECUTING, session_id, agent=agent_type, step_id=step_id,
+                      message=f"{agent_type} (text only)")
+        if agent_config.get("stream"):
+            return await self._stream_response(model_manager.generate_text_stream(full_prompt),
+                                               agent_type, session_id, step_id)
+        return await model_manager.generate_text(full_prompt)
+
+    def _build_prompt(self, system_prompt, input_data, input_token_budget=None):
+        """Build the complete prompt from system prompt and input data; returns (prompt, CompactionStats)"""
+        # Previous-step outputs: internal keys stripped, compact JSON, fitted to the agent's budget
+        compacted, compaction = compact_context(input_data or {}, input_token_budget)
+        
         # Start with system prompt
         prompt_parts = [system_prompt]
         
@@ -261,12 +363,11 @@ class AgentRunner:
                 if key == 'inputs' and isinstance(value, dict):
                     # ✅ HANDLE GRAPH INPUTS - Include the actual data from previous nodes
                     prompt_parts.append("\n--- Context from Previous Steps ---")
-                    for input_key, input_value in value.items():
-                        if isinstance(input_value, (dict, list)):
-                            prompt_parts.append(f"{input_key}: {json.dumps(input_value, indent=2)}")
-                        else:
-                            prompt_parts.append(f"{input_key}: {input_value}")
+                    for input_key, input_value in compacted.get('inputs', {}).items():
+                        prompt_parts.append(f"{input_key}: {render_value(input_value)}")
+                elif key in compacted:
+                    prompt_parts.append(f"{key}: {render_value(compacted[key])}")
                 elif key not in ['files', 'image']:  # Only exclude file-related data
                     prompt_parts.append(f"{key}: {value}")
         
-        return "\n".join(prompt_parts)
\ No newline at end of file
+        return "\n".join(prompt_parts), compaction
\ No newline at end of file
@@ -9,10 +9,22 @@ import asyncio
 from action.executor import run_user_code
 from agentLoop.session_serializer import SessionSerializer
 from agentLoop.graph_validator import GraphValidator
+from agentLoop.event_bus import AgentEventType, publish_event
+from agentLoop.usage_tracker import empty_usage, get_usage_tracker
 from utils.utils import log_step, log_error
 import pdb
 import uuid
 
+# Node states that will never change again during a run
+TERMINAL_STATUSES = ('completed', 'failed', 'skipped')
+
+# Per-node token/cost counters (copied from the usage tracker when a step finishes)
+NODE_USAGE_FIELDS = ('llm_calls', 'input_tokens', 'output_tokens', 'cached_tokens', 'thinking_tokens', 'cost')
+
+def generate_session_id():
+    """Session ID: last 8 digits of the epoch time + 8 random hex chars"""
+    return f"{str(int(time.time()))[-8:]}{str(uuid.uuid4()).replace('-', '')[:8]}"
+
 class ExecutionContextManager:
     def __init__(self, plan_graph: dict, session_id: str = None, original_query: str = None, file_manifest: list = None, debug_mode: bool = False):
         # Build NetworkX graph
@@ -20,7 +32,7 @@ class ExecutionContextManager:
         
         # Store metadata
         #self.plan_graph.graph['session_id'] = session_id or str(int(time.time()))[-8:]
-        self.plan_graph.graph['session_id'] = session_id or f"{str(int(time.time()))[-8:]}{str(uuid.uuid4()).replace('-', '')[:8]}"
+        self.plan_graph.graph['session_id'] = session_id or generate_session_id()
         #self.plan_graph.graph['session_id'] = session_id or str(int(time.time()))
         self.plan_graph.graph['original_query'] = original_query
         self.plan_graph.graph['file_manifest'] = file_manifest or []
@@ -38,7 +50,7 @@ class ExecutionContextManager:
         for node in plan_graph.get("nodes", []):
             self.plan_graph.add_node(node["id"], **node, 
                 status='pending', output=None, error=None, cost=0.0,
-                start_time=None, end_time=None, execution_time=0.0)
+                start_time=None, end_time=None, execution_time=0.0, queue_wait_time=0.0)
             
         for edge in plan_graph.get("edges", []):
             self.plan_graph.add_edge(edge["source"], edge["target"])
@@ -51,18 +63,49 @@ class ExecutionContextManager:
         
         self.plan_graph.graph['validation_results'] = validation_results
         self.debug_mode = debug_mode
+        self.rebuild_ready_state()
+
+    def rebuild_ready_state(self):
+        """Rebuild in-degree counters and the ready queue from current node statuses.
+
+        Called once per graph (and after statuses are edited externally); after that
+        mark_done / mark_failed keep the counters up to date in O(out-degree).
+        """
+        graph = self.plan_graph
+        self._waiting_on = {}   # node -> number of predecessors not yet completed
+        self._ready = {}        # insertion-ordered set of pending nodes with no waiting predecessors
+        self._finished = set()  # nodes in a terminal state
 
-    def get_ready_steps(self):
-        """Return steps ready to run"""
         try:
-            topo_order = list(nx.topological_sort(self.plan_graph))
-            return [node for node in topo_order 
-                    if node != "ROOT" and 
-                    self.plan_graph.nodes[node]['status'] == 'pending' and
-                    all(self.plan_graph.nodes[pred]['status'] == 'completed' 
-                       for pred in self.plan_graph.predecessors(node))]
+            order = list(nx.topological_sort(graph))
         except nx.NetworkXError:
-            return []
+            order = list(graph.nodes)
+
+        for node_id in order:
+            if node_id == "ROOT":
+                continue
+            status = graph.nodes[node_id].get('status', 'pending')
+            if status in TERMINAL_STATUSES:
+                self._finished.add(node_id)
+            self._waiting_on[node_id] = sum(1 for pred in graph.predecessors(node_id)
+                                            if graph.nodes[pred].get('status') != 'completed')
+            if status == 'pending' and self._waiting_on[node_id] == 0:
+                self._ready[node_id] = None
+
+        self._unfinished = len(self._waiting_on) - len(self._finished)
+
+    def _finish(self, step_id):
+        """Record that a step reached a terminal state; returns False if it already had"""
+        self._ready.pop(step_id, None)
+        if step_id in self._finished:
+            return False
+        self._finished.add(step_id)
+        self._unfinished -= 1
+        return True
+
+    def get_ready_steps(self):
+        """Return steps ready to run"""
+        return list(self._ready)
 
     def get_inputs(self, reads):
         """SIMPLE: Just pass previous outputs - NO COMPLEX EXTRACTION!"""
@@ -77,10 +120,17 @@ class ExecutionContextManager:
         
         return inputs
 
-    def mark_running(self, step_id):
-        """Mark step as running"""
+    def mark_running(self, step_id, queue_wait_time=None):
+        """Mark step as running, recording how long it waited for a free agent slot"""
         self.plan_graph.nodes[step_id]['status'] = 'running'
         self.plan_graph.nodes[step_id]['start_time'] = datetime.utcnow().isoformat()
+        if queue_wait_time is not None:
+            self.plan_graph.nodes[step_id]['queue_wait_time'] = queue_wait_time
+        self._ready.pop(step_id, None)
+        agent = self.plan_graph.nodes[step_id].get('agent')
+        publish_event(AgentEventType.NODE_STARTED, self.plan_graph.graph['session_id'],
+                      step_id=step_id, agent=agent, queue_wait_time=queue_wait_time,
+                      message=f"{step_id} started ({agent})")
         self._auto_save()
 
     def _has_executable_code(self, output):
@@ -159,16 +209,26 @@ class ExecutionContextManager:
         
         # Update node status
         node_data = self.plan_graph.nodes[step_id]
+        usage = self._node_usage(step_id)
         node_data.update({
             'status': 'completed',
             'output': final_output,
-            'cost': cost or 0.0,
-            'input_tokens': input_tokens or 0,
-            'output_tokens': output_tokens or 0,
+            **usage,
+            'cost': cost if cost is not None else usage['cost'],
+            'input_tokens': input_tokens if input_tokens is not None else usage['input_tokens'],
+            'output_tokens': output_tokens if output_tokens is not None else usage['output_tokens'],
             'end_time': datetime.utcnow().isoformat(),
             'execution_result': execution_result  # ← FIXED: Store execution result in node
         })
         
+        # Release successors whose last pending predecessor was this step
+        if self._finish(step_id):
+            for successor in self.plan_graph.successors(step_id):
+                self._waiting_on[successor] -= 1
+                if (self._waiting_on[successor] == 0 and
+                        self.plan_graph.nodes[successor]['status'] == 'pending'):
+                    self._ready[successor] = None
+        
         if node_data['start_time']:
             start = datetime.fromisoformat(node_data['start_time'])
             end = datetime.fromisoformat(node_data['end_time'])
@@ -192,16 +252,26 @@ class ExecutionContextManager:
                 print(f"   Starting PDB debugger...")
 
         log_step(f"✅ {step_id} completed - output stored in chain", symbol="📦")
+        publish_event(AgentEventType.NODE_COMPLETED, self.plan_graph.graph['session_id'],
+                      step_id=step_id, agent=node_data.get('agent'), execution_time=node_data.get('execution_time', 0.0),
+                      message=f"{step_id} completed")
         self._auto_save()
 
+    def _node_usage(self, step_id):
+        """Every LLM call made for this step so far (CALL_SELF iterations and retries included)"""
+        usage = get_usage_tracker().node_usage(self.plan_graph.graph['session_id'], step_id) or empty_usage()
+        return {'llm_calls': usage['calls'], **{field: usage[field] for field in NODE_USAGE_FIELDS[1:]}}
+
     def mark_failed(self, step_id, error=None):
         """Mark step as failed"""
         node_data = self.plan_graph.nodes[step_id]
         node_data.update({
             'status': 'failed',
+            **self._node_usage(step_id),  # Failed calls were still billed
             'end_time': datetime.utcnow().isoformat(),
             'error': str(error) if error else None
         })
+        self._finish(step_id)
         
         if node_data['start_time']:
             start = datetime.fromisoformat(node_data['start_time'])
@@ -209,6 +279,24 @@ class ExecutionContextManager:
             node_data['execution_time'] = (end - start).total_seconds()
             
         log_error(f"❌ {step_id} failed: {error}")
+        publish_event(AgentEventType.NODE_FAILED, self.plan_graph.graph['session_id'],
+                      step_id=step_id, agent=node_data.get('agent'), error=node_data['error'],
+                      message=f"{step_id} failed: {error}")
+        self._auto_save()
+
+    def mark_skipped(self, step_id, reason=None):
+        """Mark a pending step as skipped because an upstream dependency failed"""
+        node_data = self.plan_graph.nodes[step_id]
+        node_data.update({
+            'status': 'skipped',
+            'end_time': datetime.utcnow().isoformat(),
+            'error': str(reason) if reason else None
+        })
+        self._finish(step_id)
+        log_step(f"⏭️ {step_id} skipped: {reason}", symbol="⏭️")
+        publish_event(AgentEventType.NODE_SKIPPED, self.plan_graph.graph['session_id'],
+                      step_id=step_id, agent=node_data.get('agent'), reason=node_data['error'],
+                      message=f"{step_id} skipped: {reason}")
         self._auto_save()
 
     def get_step_data(self, step_id):
@@ -217,8 +305,7 @@ class ExecutionContextManager:
 
     def all_done(self):
         """Check if execution is complete"""
-        return all(self.plan_graph.nodes[node_id]['status'] in ['completed', 'failed']
-                  for node_id in self.plan_graph.nodes if node_id != "ROOT")
+        return self._unfinished == 0
 
     def get_execution_summary(self):
         """Get execution summary"""
@@ -228,6 +315,9 @@ class ExecutionContextManager:
         failed = sum(1 for node_id in self.plan_graph.nodes 
                     if node_id != "ROOT" and 
                     self.plan_graph.nodes[node_id].get('status') == 'failed')
+        skipped = sum(1 for node_id in self.plan_graph.nodes 
+                     if node_id != "ROOT" and 
+                     self.plan_graph.nodes[node_id].get('status') == 'skipped')
         total = len(self.plan_graph.nodes) - 1
         
         # Calculate costs and tokens
@@ -240,15 +330,34 @@ class ExecutionContextManager:
         total_output_tokens = sum(self.plan_graph.nodes[node_id].get('output_tokens', 0) 
                                 for node_id in self.plan_graph.nodes if node_id != "ROOT")
         
+        queue_wait_times = {node_id: self.plan_graph.nodes[node_id].get('queue_wait_time', 0.0)
+                            for node_id in self.plan_graph.nodes if node_id != "ROOT"}
+        
+        # Per-node usage, and today's totals across all sessions and workers (for quota planning)
+        cost_breakdown = {node_id: {field: self.plan_graph.nodes[node_id].get(field, 0) for field in NODE_USAGE_FIELDS}
+                          for node_id in self.plan_graph.nodes
+                          if node_id != "ROOT" and self.plan_graph.nodes[node_id].get('llm_calls')}
+        try:
+            daily_usage = get_usage_tracker().daily_usage()
+        except Exception as e:
+            log_error(f"Daily usage unavailable: {e}")
+            daily_usage = {}
+        
         return {
             "session_id": self.plan_graph.graph['session_id'],
             "original_query": self.plan_graph.graph['original_query'],
             "completed_steps": completed,
             "failed_steps": failed,
+            "skipped_steps": skipped,
             "total_steps": total,
             "total_cost": total_cost,
             "total_input_tokens": total_input_tokens,
             "total_output_tokens": total_output_tokens,
+            "total_cached_tokens": sum(usage['cached_tokens'] for usage in cost_breakdown.values()),
+            "total_thinking_tokens": sum(usage['thinking_tokens'] for usage in cost_breakdown.values()),
+            "cost_breakdown": cost_breakdown,
+            "daily_usage": daily_usage,
+            "queue_wait_times": queue_wait_times,
             "output_chain": self.plan_graph.graph['output_chain']
         }
 
@@ -277,10 +386,45 @@ class ExecutionContextManager:
         }
 
     @classmethod
-    def load_session(cls, session_file: Path, debug_mode: bool = False):
-        """Load session from disk"""
-        plan_graph = SessionSerializer.load_session(session_file)
+    def from_graph(cls, plan_graph: nx.DiGraph, debug_mode: bool = False):
+        """Wrap an already-built NetworkX plan graph without re-validating it"""
         context = cls.__new__(cls)
         context.plan_graph = plan_graph
         context.debug_mode = debug_mode
+        context.start_time = time.time()
+        context.rebuild_ready_state()
         return context
+
+    @staticmethod
+    def _reset_node(node_data):
+        node_data.update({
+            'status': 'pending',
+            'output': None,
+            'error': None,
+            'start_time': None,
+            'end_time': None,
+            'execution_time': 0.0
+        })
+
+    def reset_interrupted_steps(self):
+        """Return running/failed/skipped steps to pending so a resumed run re-executes them"""
+        reset = []
+        for node_id, node_data in self.plan_graph.nodes(data=True):
+            if node_id != "ROOT" and node_data.get('status') in ('running', 'failed', 'skipped'):
+                self._reset_node(node_data)
+                reset.append(node_id)
+        
+        self.plan_graph.graph['status'] = 'running'
+        self.rebuild_ready_state()
+        return reset
+
+    def reset_step(self, step_id):
+        """Return one step to pending (e.g. a debugger replay); its successors wait for it again"""
+        self._reset_node(self.plan_graph.nodes[step_id])
+        self.rebuild_ready_state()
+
+    @classmethod
+    def load_session(cls, session_file: Path, debug_mode: bool = False):
+        """Load session from disk"""
+        plan_graph = SessionSerializer.load_session(session_file)
+        return cls.from_graph(plan_graph, debug_mode=debug_mode)
@@ -0,0 +1,378 @@
+"""
+In-process async pub/sub for typed execution events
+
+Publishing is synchronous (appended to each subscriber's bounded queue), so events
+reach every subscriber in exactly the order they were published and no task is
+spawned per event.
+
+Sessions with an open EventHistory also get a monotonically increasing event id
+per event and a replay buffer, so a client that drops its SSE connection can
+reconnect with Last-Event-ID - to any worker, when the history is persisted in
+the shared store - and continue where it left off. Persisting happens in batches
+on a background thread (EventWriter), so publishing never waits on SQLite.
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+class AgentEventType(str, Enum):
+    STAGE_COMPLETED = "stage_completed"
+    BATCH_STARTED = "batch_started"
+    AGENT_EXECUTING = "agent_executing"
+    NODE_STARTED = "node_started"
+    NODE_COMPLETED = "node_completed"
+    NODE_FAILED = "node_failed"
+    NODE_SKIPPED = "node_skipped"
+    TOOL_CALLED = "tool_called"
+    FILE_CREATED = "file_created"
+    TOKEN_USAGE = "token_usage"
+    DAG_COMPLETED = "dag_completed"
+    LOG_UPDATE = "log_update"
+    AGENT_TOKEN = "agent_token"
+    ERROR = "error"
+    # Session lifecycle, published by the stream service so they are replayable too
+    PROCESSING_START = "processing_start"
+    QUEUED = "queued"
+    EXECUTION_COMPLETE = "execution_complete"
+    FILE_GENERATED = "file_generated"
+
+@dataclass
+class AgentEvent:
+    type: AgentEventType
+    session_id: Optional[str]
+    data: Dict[str, Any]
+    timestamp: float = field(default_factory=time.time)
+    id: Optional[int] = None  # Per-session sequence number, set when the session has an EventHistory
+
+    def to_dict(self) -> Dict[str, Any]:
+        """SSE payload shape expected by the frontend: {type, data, timestamp}"""
+        return {
+            "type": self.type.value,
+            "data": {**self.data, "session_id": self.session_id},
+            "timestamp": self.timestamp
+        }
+
+# Session whose pipeline is running in the current task (inherited by the tasks it spawns)
+current_session_id: ContextVar[Optional[str]] = ContextVar("current_session_id", default=None)
+
+class EventWriter:
+    """
+    Writes persisted events to the shared store from one background thread
+
+    Everything queued while a batch is being written goes into the next batch,
+    committed as one transaction, so a busy database (busy_timeout) delays the
+    writes instead of the event loop. SharedStore connections are per thread, so
+    these writes never join a transaction the loop thread has open.
+    """
+
+    def __init__(self, max_batch: int = 500):
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    def submit(self, store, session_id: str, event: AgentEvent):
+        # Serialized here: event data may still be mutated by its publisher after publish() returns
+        row = (session_id, event.id, event.type.value, json.dumps(event.data, default=str), event.timestamp)
+        with self._idle:
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((store, row))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            with self._idle:
+                self._pending -= len(batch)
+                if not self._pending:
+                    self._idle.notify_all()
+
+    def _write(self, batch):
+        rows_by_store = {}
+        for store, row in batch:
+            rows_by_store.setdefault(store, []).append(row)
+        for store, rows in rows_by_store.items():
+            try:
+                store.append_events(rows)  # On this thread's own connection
+                self.written += len(rows)
+                self.batches += 1
+            except Exception as e:
+                # Live subscribers already have these events; only cross-worker replay misses them
+                self.failed += len(rows)
+                print(f"⚠️ {len(rows)} session events not persisted: {e}")
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every submitted event is written (or timeout); True when nothing is pending"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    async def aflush(self, timeout: float = None) -> bool:
+        return await asyncio.to_thread(self.flush, timeout)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {"pending": self._pending, "written": self.written, "batches": self.batches, "failed": self.failed}
+
+# Persists every EventHistory with a store in this process
+event_writer = EventWriter()
+
+class EventHistory:
+    """
+    Replay buffer of one session's events: the latest `capacity` in memory and,
+    with a store (utils.shared_store.SharedStore), every event persisted so other
+    workers and later processes can replay and tail it too.
+    """
+
+    def __init__(self, session_id: str, capacity: int = 2000, store=None):
+        self.session_id = session_id
+        self.events = deque(maxlen=capacity)
+        self.closed = False
+        self.store = store
+        # Never reuse ids already handed to clients (e.g. a resumed session)
+        self.last_id = store.last_event_id(session_id) if store else 0
+
+    def append(self, event: AgentEvent):
+        self.last_id += 1
+        event.id = self.last_id
+        self.events.append(event)
+        if self.store:
+            event_writer.submit(self.store, self.session_id, event)
+
+    def since(self, last_event_id: int = 0) -> List[AgentEvent]:
+        """Events with id > last_event_id, from the store when they fell out of the buffer"""
+        if last_event_id >= self.last_id:
+            return []
+        if self.events and self.events[0].id <= last_event_id + 1:
+            return [event for event in self.events if event.id > last_event_id]
+        if self.store:
+            return self.read_store(self.store, self.session_id, last_event_id)
+        return list(self.events)  # Oldest events are gone; replay what is left
+
+    def close(self):
+        self.closed = True
+
+    @staticmethod
+    def read_store(store, session_id: str, last_event_id: int = 0) -> List[AgentEvent]:
+        return [AgentEvent(AgentEventType(record["type"]), session_id, record["data"], record["timestamp"], record["event_id"])
+                for record in store.read_events(session_id, last_event_id)]
+
+# High-frequency progress events a slow client can afford to lose (latest ones win)
+COALESCIBLE_EVENT_TYPES = {AgentEventType.LOG_UPDATE, AgentEventType.AGENT_TOKEN}
+
+# Live-only events: not numbered, recorded or replayed (node_completed carries the assembled output)
+TRANSIENT_EVENT_TYPES = {AgentEventType.AGENT_TOKEN}
+
+class Subscription:
+    """
+    Bounded event queue for one subscriber; iterate with `async for` until end()
+
+    Progress events (COALESCIBLE_EVENT_TYPES) are merged with an identical
+    predecessor (token deltas of the same step are concatenated) and only the
+    latest `max_progress_events` are kept. Other events
+    are never dropped; if they alone fill `max_events` the subscriber is too slow
+    and is cut off with an error event.
+    """
+
+    def __init__(self, bus: "EventBus", session_id: Optional[str], max_events: int = 1000, max_progress_events: int = 100):
+        self.bus = bus
+        self.session_id = session_id
+        self.max_events = max_events
+        self.max_progress_events = max_progress_events
+        self._events = deque()
+        self._progress_count = 0
+        self._waiter: Optional[asyncio.Future] = None
+        self.ended = False
+        self.overflowed = False
+
+        # Metrics
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def deliver(self, event: AgentEvent):
+        # Still accepted after end() so late events (e.g. published while draining) are not lost
+        if self.overflowed:
+            return
+
+        if event.type in COALESCIBLE_EVENT_TYPES:
+            if self._coalesce(event):
+                return
+            if self._progress_count >= self.max_progress_events:
+                self._drop_oldest_progress()
+        if len(self._events) >= self.max_events and not self._drop_oldest_progress():
+            self.overflowed = True
+            self._events.append(AgentEvent(AgentEventType.ERROR, self.session_id,
+                                           {"error": "Event stream overflow - client too slow, reconnect with Last-Event-ID",
+                                            "overflow": True}))
+            self.end()
+            return
+
+        self._events.append(event)
+        self._progress_count += event.type in COALESCIBLE_EVENT_TYPES
+        self.delivered += 1
+        self.max_depth = max(self.max_depth, len(self._events))
+        self._wake()
+
+    def _coalesce(self, event: AgentEvent) -> bool:
+        """Fold a repeat of the newest queued progress event (or the next piece of its token stream) into it"""
+        if not self._events:
+            return False
+        last = self._events[-1]
+        if last.type != event.type:
+            return False
+        # Events are shared between subscribers - replace rather than mutate
+        if event.type == AgentEventType.AGENT_TOKEN:
+            if last.data.get("step_id") != event.data.get("step_id"):
+                return False
+            merged_data = {**last.data, "delta": last.data["delta"] + event.data["delta"]}
+        elif last.data.get("message") != event.data.get("message"):
+            return False
+        else:
+            merged_data = {**last.data, "repeat": last.data.get("repeat", 1) + 1}
+        # The newest id, so a client reconnecting after this frame resumes past both events
+        self._events[-1] = AgentEvent(last.type, last.session_id, merged_data, event.timestamp, id=event.id)
+        self.coalesced += 1
+        return True
+
+    def _drop_oldest_progress(self) -> bool:
+        for queued in self._events:
+            if queued.type in COALESCIBLE_EVENT_TYPES:
+                self._events.remove(queued)
+                self._progress_count -= 1
+                self.dropped += 1
+                return True
+        return False
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def end(self):
+        """No more events will arrive; iteration stops once the queue drains"""
+        self.ended = True
+        self._wake()
+
+    async def get(self) -> Optional[AgentEvent]:
+        """Next event, blocking until one arrives; None once ended and drained"""
+        while not self._events:
+            if self.ended:
+                return None
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        event = self._events.popleft()
+        self._progress_count -= event.type in COALESCIBLE_EVENT_TYPES
+        return event
+
+    def close(self):
+        self.end()
+        self.bus.unsubscribe(self)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "depth": len(self._events),
+            "max_depth": self.max_depth,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "overflowed": self.overflowed
+        }
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> AgentEvent:
+        event = await self.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+class EventBus:
+    def __init__(self, max_retained_histories: int = 50):
+        self._subscribers: Dict[Optional[str], List[Subscription]] = {}
+        self._histories: "OrderedDict[str, EventHistory]" = OrderedDict()
+        self.max_retained_histories = max_retained_histories
+
+    def subscribe(self, session_id: Optional[str] = None, **limits) -> Subscription:
+        """Subscribe to one session's events (or every session's with session_id=None)"""
+        subscription = Subscription(self, session_id, **limits)
+        self._subscribers.setdefault(session_id, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.session_id, [])
+        if subscription in subscribers:
+            subscribers.remove(subscription)
+        if not subscribers:
+            self._subscribers.pop(subscription.session_id, None)
+
+    def open_history(self, session_id: str, capacity: int = 2000, store=None) -> EventHistory:
+        """Start numbering and recording this session's events (continues an existing history)"""
+        history = previous = self._histories.get(session_id)
+        if previous is None or previous.closed:
+            history = EventHistory(session_id, capacity, store)
+            if previous:
+                # Resumed session keeps counting (and replaying) from where its last run stopped
+                history.events.extend(previous.events)
+                history.last_id = max(history.last_id, previous.last_id)
+            self._histories[session_id] = history
+        self._histories.move_to_end(session_id)
+        return history
+
+    def close_history(self, session_id: str):
+        """Session finished: end its live subscriptions once drained and cap how many finished histories stay in memory"""
+        history = self._histories.get(session_id)
+        if history:
+            history.close()
+        for subscription in self._subscribers.get(session_id, []):
+            subscription.end()
+
+        closed = [sid for sid, h in self._histories.items() if h.closed]
+        for sid in closed[:max(0, len(closed) - self.max_retained_histories)]:
+            del self._histories[sid]
+
+    def get_subscriptions(self, session_id: Optional[str]) -> List[Subscription]:
+        return list(self._subscribers.get(session_id, []))
+
+    def get_history(self, session_id: str) -> Optional[EventHistory]:
+        return self._histories.get(session_id)
+
+    def publish(self, event_type: AgentEventType, data: Dict[str, Any], session_id: Optional[str] = None) -> AgentEvent:
+        event = AgentEvent(AgentEventType(event_type), session_id or current_session_id.get(), data)
+        history = self._histories.get(event.session_id)
+        if history and event.type not in TRANSIENT_EVENT_TYPES:
+            history.append(event)
+        for subscription in self._subscribers.get(event.session_id, []) + self._subscribers.get(None, []):
+            subscription.deliver(event)
+        return event
+
+# Shared by every publisher and SSE subscriber in this process
+event_bus = EventBus()
+
+def publish_event(event_type: AgentEventType, session_id: Optional[str] = None, **data) -> AgentEvent:
+    """Publish on the process-wide bus; session defaults to the current pipeline's session"""
+    return event_bus.publish(event_type, data, session_id)
@@ -2,19 +2,177 @@
 
 import networkx as nx
 import asyncio
-from agentLoop.contextManager import ExecutionContextManager
+from agentLoop.contextManager import ExecutionContextManager, generate_session_id
+from agentLoop.session_serializer import SessionSerializer
 from agentLoop.agents import AgentRunner
 from utils.utils import log_step, log_error
 from agentLoop.visualizer import ExecutionVisualizer
+from agentLoop.graph_validator import GraphValidator
+from agentLoop.event_bus import AgentEventType, publish_event, current_session_id
+from agentLoop.scheduling import load_agent_latencies, compute_node_priorities, order_ready_steps
 from rich.console import Console
 from pathlib import Path
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
 from rich.live import Live
 from rich.panel import Panel
 from rich.text import Text
 import time
 import asyncio
+import os
+import re
+import yaml
 from action.executor import run_user_code
+from utils.cache import DiskLRUCache, stable_hash
+
+PROFILE_YAML = Path(__file__).parent.parent / "config" / "profiles.yaml"
+
+def load_profile_section(section, defaults):
+    """Load one section of profiles.yaml on top of defaults"""
+    config = dict(defaults)
+    try:
+        profile = yaml.safe_load(PROFILE_YAML.read_text()) or {}
+        config.update(profile.get(section) or {})
+    except Exception as e:
+        log_error(f"Could not load {section} config, using defaults: {e}")
+    return config
+
+def load_execution_config():
+    """Load DAG scheduler settings from profiles.yaml, falling back to defaults"""
+    return load_profile_section("execution", {
+        "max_concurrent_agents_per_session": 4,
+        "max_concurrent_agents_global": 8,
+        "default_agent_timeout_seconds": 240,
+        "scheduling_policy": "critical_path",
+        "weight_by_agent_latency": True,
+        "max_concurrent_sessions": 2,
+    })
+
+# Multi-digit numbers not embedded in identifiers like T001 (single digits stay part of the key)
+NUMBER_PATTERN = re.compile(r"(?<![\w.])\d{2,}(?:\.\d+)?(?!\w)(?!\.\d)")
+
+# Plan node fields the planner writes from the query text - the only place query values are templated
+TEMPLATED_NODE_FIELDS = ("agent_prompt", "description")
+
+class PlanCache:
+    """
+    PlannerAgent plan_graph cache keyed by planner prompt version + query with numbers abstracted.
+
+    Queries differing only in numeric form values (amounts, ages, horizons) share an entry;
+    those values are stored as <<NUM_i>> placeholders in the nodes' agent_prompt/description
+    text and filled back in on a hit. A plan that carries a query value anywhere else (node
+    config, ids, edges) could not be re-parameterized, so it is stored unmodified under the
+    exact query instead.
+    """
+
+    def __init__(self, config, agent_config):
+        self.enabled = config["enabled"]
+        self.cache = DiskLRUCache(config["directory"], max_entries=config["max_entries"],
+                                  ttl_seconds=config["ttl_hours"] * 3600)
+        prompt_file = Path(agent_config.get("prompt_file", ""))
+        self.prompt_version = stable_hash(prompt_file.read_text(encoding="utf-8")) if prompt_file.exists() else None
+        self.model = agent_config.get("model")
+
+    @staticmethod
+    def normalize_query(query):
+        """Return (normalized query, distinct numeric params in order of first appearance)"""
+        params = []
+
+        def abstract(match):
+            value = match.group(0)
+            if value not in params:
+                params.append(value)
+            return f"<NUM_{params.index(value)}>"
+
+        normalized = NUMBER_PATTERN.sub(abstract, " ".join(query.split()))
+        return normalized, params
+
+    def _key(self, kind, query, strategy):
+        return stable_hash(self.prompt_version, self.model, strategy, kind, query)
+
+    @staticmethod
+    def _number_literals(value):
+        """Every multi-digit number in a plan value, as it would appear in the query"""
+        if isinstance(value, str):
+            return set(NUMBER_PATTERN.findall(value))
+        if isinstance(value, bool):
+            return set()
+        if isinstance(value, (int, float)):
+            return {str(int(value)) if float(value).is_integer() else str(value)}
+        if isinstance(value, (list, dict)):
+            items = value.values() if isinstance(value, dict) else value
+            return set().union(*(PlanCache._number_literals(item) for item in items))
+        return set()
+
+    @staticmethod
+    def _map_strings(value, fn):
+        if isinstance(value, str):
+            return fn(value)
+        if isinstance(value, list):
+            return [PlanCache._map_strings(v, fn) for v in value]
+        if isinstance(value, dict):
+            return {k: PlanCache._map_strings(v, fn) for k, v in value.items()}
+        return value
+
+    def get(self, query, strategy):
+        if not self.enabled or not self.prompt_version:
+            return None
+        exact = self.cache.get(self._key("exact", " ".join(query.split()), strategy))
+        if exact is not None:
+            return exact
+        normalized, params = self.normalize_query(query)
+        template = self.cache.get(self._key("template", normalized, strategy))
+        if template is None:
+            return None
+
+        def fill(text):
+            return re.sub(r"<<NUM_(\d+)>>", lambda m: params[int(m.group(1))], text)
+        return self._map_strings(template, fill)
+
+    def put(self, query, strategy, plan_graph):
+        if not self.enabled or not self.prompt_version:
+            return
+        normalized, params = self.normalize_query(query)
+
+        def templatize(text):
+            return NUMBER_PATTERN.sub(
+                lambda m: f"<<NUM_{params.index(m.group(0))}>>" if m.group(0) in params else m.group(0), text)
+
+        nodes = plan_graph.get("nodes", [])
+        untemplated = {**plan_graph, "nodes": [{key: value for key, value in node.items() if key not in TEMPLATED_NODE_FIELDS}
+                                               for node in nodes]}
+        try:
+            if self._number_literals(untemplated) & set(params):
+                self.cache.set(self._key("exact", " ".join(query.split()), strategy), plan_graph)
+                return
+            template = {**plan_graph, "nodes": [
+                {key: templatize(value) if key in TEMPLATED_NODE_FIELDS and isinstance(value, str) else value
+                 for key, value in node.items()}
+                for node in nodes
+            ]}
+            self.cache.set(self._key("template", normalized, strategy), template)
+        except Exception as e:
+            log_error(f"Plan cache write failed: {e}")
+
+def worker_share(limit):
+    """This worker's part of a host-wide limit - each uvicorn worker (WEB_CONCURRENCY) enforces its own share"""
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, limit // workers)
+
+# Process-wide agent slots shared by every session running in this process: (limit, event loop, semaphore)
+_global_agent_slots = None
+
+def get_global_agent_slots(limit):
+    """
+    Return the process-wide semaphore bounding concurrent agent executions.
+
+    A new limit (config reload) or a new event loop gets a fresh semaphore; agents
+    already holding a slot of the old one release it there, so the new limit
+    applies fully once they finish.
+    """
+    global _global_agent_slots
+    loop = asyncio.get_running_loop()
+    if _global_agent_slots is None or _global_agent_slots[:2] != (limit, loop):
+        _global_agent_slots = (limit, loop, asyncio.Semaphore(limit))
+    return _global_agent_slots[2]
 
 class AgentLoop4:
     def __init__(self, multi_mcp, strategy="conservative"):
@@ -22,211 +180,306 @@ class AgentLoop4:
         self.strategy = strategy
         self.agent_runner = AgentRunner(multi_mcp)
         self.console = Console()
+        self.execution_config = load_execution_config()
+        self.agent_latencies = load_agent_latencies() if self.execution_config["weight_by_agent_latency"] else None
+        self.plan_cache = PlanCache(
+            load_profile_section("plan_cache", {
+                "enabled": True, "directory": "memory/plan_cache", "max_entries": 200, "ttl_hours": 24
+            }),
+            self.agent_runner.agent_configs.get("PlannerAgent", {})
+        )
 
-    async def _show_timer_animation(self, duration=30, message="Waiting before calling Gemini"):
-            """Show an animated timer for the specified duration"""
-            with Progress(
-                SpinnerColumn(),
-                TextColumn("[progress.description]{task.description}"),
-                BarColumn(),
-                TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                TimeElapsedColumn(),
-                console=self.console,
-                transient=True
-            ) as progress:
-                task = progress.add_task(f"[cyan]{message}...", total=duration)
-                
-                for i in range(duration):
-                    progress.update(task, advance=1)
-                    await asyncio.sleep(1)
-
-    async def run(self, query, file_manifest, uploaded_files):
-        # Phase 1: File Profiling (if files exist)
-        file_profiles = {}
-        if uploaded_files:
-            file_list_text = "\n".join([f"- File {i+1}: {Path(f).name} (full path: {f})" 
-                                       for i, f in enumerate(uploaded_files)])
-            
-            grounded_instruction = f"""Profile and summarize each file's structure, columns, content type.
+    async def run(self, query, file_manifest, uploaded_files, status_callback=None, session_id=None):
+        """Run a new query through the staged pipeline: file profiling -> planning -> execution"""
+        checkpoint = {
+            "session_id": session_id or generate_session_id(),
+            "original_query": query,
+            "file_manifest": file_manifest,
+            "uploaded_files": uploaded_files,
+            "strategy": self.strategy,
+            "completed_stages": [],
+            "file_profiles": {},
+            "plan_graph": None
+        }
+        return await self._run_pipeline(checkpoint, status_callback)
 
-IMPORTANT: Use these EXACT file names in your response:
-{file_list_text}
+    async def run_with_status_callback(self, query, file_manifest, uploaded_files, status_callback=None):
+        """Kept for callers of the old API - same pipeline as run()"""
+        return await self.run(query, file_manifest, uploaded_files, status_callback=status_callback)
 
-Profile each file separately and return details."""
-            
-            await self._show_timer_animation(30, f"🤖 DistillerAgent Waiting before calling Gemini")
-
-            file_result = await self.agent_runner.run_agent(
-                "DistillerAgent",
-                {
-                    "task": "profile_files",
-                    "files": uploaded_files,
-                    "instruction": grounded_instruction,
-                    "writes": ["file_profiles"]
-                }
-            )
-            if file_result["success"]:
-                file_profiles = file_result["output"]
-
-        # Phase 2: Planning
-        await self._show_timer_animation(30, f"🤖 PlannerAgent Waiting before calling Gemini")
-
-        plan_result = await self.agent_runner.run_agent(
-            "PlannerAgent",
-            {
-                "original_query": query,
-                "planning_strategy": self.strategy,
-                "file_manifest": file_manifest,
-                "file_profiles": file_profiles
-            }
-        )
+    async def resume(self, session_id, status_callback=None):
+        """Resume a crashed/terminated session from its last checkpoint without re-running finished stages"""
+        checkpoint = SessionSerializer.load_checkpoint(session_id)
+        if checkpoint is None:
+            raise ValueError(f"No checkpoint found for session {session_id}")
+        
+        log_step(f"Resuming session {session_id} (completed stages: {checkpoint['completed_stages'] or 'none'})", symbol="♻️")
+        return await self._run_pipeline(checkpoint, status_callback)
 
-        if not plan_result["success"]:
-            raise RuntimeError(f"Planning failed: {plan_result['error']}")
+    async def _run_pipeline(self, checkpoint, status_callback=None):
+        """Run every pipeline stage not yet recorded in the checkpoint"""
+        completed = checkpoint["completed_stages"]
 
-        if 'plan_graph' not in plan_result['output']:
-            raise RuntimeError(f"PlannerAgent output missing 'plan_graph' key")
-        
-        plan_graph = plan_result["output"]["plan_graph"]
+        # Events published anywhere below (agents, code, tools) are tagged with this session
+        current_session_id.set(checkpoint["session_id"])
 
-        # Phase 3: Simple Output Chain Execution
-        context = ExecutionContextManager(
-            plan_graph,
-            session_id=None,
-            original_query=query,
-            file_manifest=file_manifest
-        )
-        
-        context.set_multi_mcp(self.multi_mcp)
-        
-        # Store initial files in output chain
-        if file_profiles:
-            context.plan_graph.graph['output_chain']['file_profiles'] = file_profiles
+        # Stage 1: File Profiling (if files exist)
+        if "file_profiling" not in completed:
+            checkpoint["file_profiles"] = await self._profile_files(checkpoint["uploaded_files"])
+            self._complete_stage(checkpoint, "file_profiling")
 
-        # Store uploaded files directly
-        for file_info in file_manifest:
-            context.plan_graph.graph['output_chain'][file_info['name']] = file_info['path']
+        # Stage 2: Planning
+        if "planning" not in completed:
+            checkpoint["plan_graph"] = await self._plan(
+                checkpoint["original_query"], checkpoint["file_manifest"], checkpoint["file_profiles"]
+            )
+            self._complete_stage(checkpoint, "planning")
+
+        # Stage 3: Simple Output Chain Execution
+        context = self._create_execution_context(checkpoint)
+
+        # Call status_callback with context BEFORE execution starts
+        if status_callback:
+            status_callback(context)
 
-        # Phase 4: Execute with simple output chaining
         await self._execute_dag(context)
+        if "execution" not in completed:
+            self._complete_stage(checkpoint, "execution")
         return context
 
-    async def run_with_status_callback(self, query, file_manifest, uploaded_files, status_callback=None):
-        # Phase 1: File Profiling (if files exist)
-        file_profiles = {}
-        if uploaded_files:
-            file_list_text = "\n".join([f"- File {i+1}: {Path(f).name} (full path: {f})"
-                                       for i, f in enumerate(uploaded_files)])
-            grounded_instruction = f"""Profile and summarize each file's structure, columns, content type.
+    def _complete_stage(self, checkpoint, stage):
+        checkpoint["completed_stages"].append(stage)
+        publish_event(AgentEventType.STAGE_COMPLETED, checkpoint["session_id"],
+                      stage=stage, message=f"Stage completed: {stage}")
+        try:
+            SessionSerializer.save_checkpoint(checkpoint)
+        except Exception as e:
+            log_error(f"Checkpoint save failed after {stage}: {e}")
+
+    async def _profile_files(self, uploaded_files):
+        if not uploaded_files:
+            return {}
+
+        file_list_text = "\n".join([f"- File {i+1}: {Path(f).name} (full path: {f})" 
+                                   for i, f in enumerate(uploaded_files)])
+        
+        grounded_instruction = f"""Profile and summarize each file's structure, columns, content type.
 
 IMPORTANT: Use these EXACT file names in your response:
 {file_list_text}
 
 Profile each file separately and return details."""
-            await self._show_timer_animation(30, f"🤖 DistillerAgent Waiting before calling Gemini")
-            file_result = await self.agent_runner.run_agent(
-                "DistillerAgent",
-                {
-                    "task": "profile_files",
-                    "files": uploaded_files,
-                    "instruction": grounded_instruction,
-                    "writes": ["file_profiles"]
-                }
+        
+        try:
+            file_result = await asyncio.wait_for(
+                self.agent_runner.run_agent(
+                    "DistillerAgent",
+                    {
+                        "task": "profile_files",
+                        "files": uploaded_files,
+                        "instruction": grounded_instruction,
+                        "writes": ["file_profiles"]
+                    }
+                ),
+                timeout=self._agent_timeout("DistillerAgent")
             )
-            if file_result["success"]:
-                file_profiles = file_result["output"]
-
-        # Phase 2: Planning
-        await self._show_timer_animation(30, f"🤖 PlannerAgent Waiting before calling Gemini")
-        plan_result = await self.agent_runner.run_agent(
-            "PlannerAgent",
-            {
-                "original_query": query,
-                "planning_strategy": self.strategy,
-                "file_manifest": file_manifest,
-                "file_profiles": file_profiles
-            }
-        )
+        except asyncio.TimeoutError:
+            log_error(f"DistillerAgent timed out after {self._agent_timeout('DistillerAgent')}s - continuing without file profiles")
+            return {}
+        return file_result["output"] if file_result["success"] else {}
+
+    async def _plan(self, query, file_manifest, file_profiles):
+        # Plans built from uploaded files depend on their profiles - only cache file-less queries
+        cacheable = not file_manifest
+        if cacheable:
+            cached_plan = self.plan_cache.get(query, self.strategy)
+            if cached_plan is not None:
+                log_step("Plan cache hit - skipping PlannerAgent", symbol="⚡")
+                return cached_plan
+
+        try:
+            plan_result = await asyncio.wait_for(
+                self.agent_runner.run_agent(
+                    "PlannerAgent",
+                    {
+                        "original_query": query,
+                        "planning_strategy": self.strategy,
+                        "file_manifest": file_manifest,
+                        "file_profiles": file_profiles
+                    }
+                ),
+                timeout=self._agent_timeout("PlannerAgent")
+            )
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Planning timed out after {self._agent_timeout('PlannerAgent')}s")
+
         if not plan_result["success"]:
             raise RuntimeError(f"Planning failed: {plan_result['error']}")
+
         if 'plan_graph' not in plan_result['output']:
             raise RuntimeError(f"PlannerAgent output missing 'plan_graph' key")
+        
         plan_graph = plan_result["output"]["plan_graph"]
+        if cacheable:
+            self.plan_cache.put(query, self.strategy, plan_graph)
+        return plan_graph
 
-        # Phase 3: Create ExecutionContextManager
-        context = ExecutionContextManager(
-            plan_graph,
-            session_id=None,
-            original_query=query,
-            file_manifest=file_manifest
-        )
-        context.set_multi_mcp(self.multi_mcp)
-        if file_profiles:
-            context.plan_graph.graph['output_chain']['file_profiles'] = file_profiles
-        for file_info in file_manifest:
-            context.plan_graph.graph['output_chain'][file_info['name']] = file_info['path']
+    def _agent_timeout(self, agent_type):
+        """Per-agent deadline from agent_config.yaml, else the execution default"""
+        return self.agent_runner.agent_configs.get(agent_type, {}).get(
+            "timeout_seconds", self.execution_config["default_agent_timeout_seconds"])
 
-        # Call status_callback with context BEFORE execution starts
-        if status_callback:
-            status_callback(context)
+    def _create_execution_context(self, checkpoint):
+        """Fresh context from the plan, or the last saved graph state when the session already started executing"""
+        session_id = checkpoint["session_id"]
+        session_file = SessionSerializer.find_session_file(session_id)
 
-        # Phase 4: Execute with simple output chaining
-        await self._execute_dag(context)
+        if session_file:
+            context = ExecutionContextManager.load_session(session_file)
+            reset = context.reset_interrupted_steps()
+            log_step(f"Restored {session_id} from {session_file} - re-running {len(reset)} interrupted step(s)", symbol="♻️")
+        else:
+            context = ExecutionContextManager(
+                checkpoint["plan_graph"],
+                session_id=session_id,
+                original_query=checkpoint["original_query"],
+                file_manifest=checkpoint["file_manifest"]
+            )
+            
+            # Store initial files in output chain
+            if checkpoint["file_profiles"]:
+                context.plan_graph.graph['output_chain']['file_profiles'] = checkpoint["file_profiles"]
+
+            # Store uploaded files directly
+            for file_info in checkpoint["file_manifest"]:
+                context.plan_graph.graph['output_chain'][file_info['name']] = file_info['path']
+
+        context.set_multi_mcp(self.multi_mcp)
         return context
 
     async def _execute_dag(self, context):
-        """Execute DAG with simple output chaining"""
+        """Event-driven DAG execution: every ready node starts as soon as its predecessors complete"""
         visualizer = ExecutionVisualizer(context)
         #console = Console()
         console = self.console
-        
-        MAX_CONCURRENT_AGENTS = 1
-        max_iterations = 20
-        iteration = 0
 
-        while not context.all_done() and iteration < max_iterations:
-            iteration += 1
-            console.print(visualizer.get_layout())
-            
-            ready_steps = context.get_ready_steps()
-            if not ready_steps:
-                if any(context.plan_graph.nodes[n]['status'] == 'failed' 
-                       for n in context.plan_graph.nodes):
+        # Re-read per run so edited concurrency limits in profiles.yaml apply to the next session
+        self.execution_config = load_execution_config()
+        session_slots = asyncio.Semaphore(self.execution_config["max_concurrent_agents_per_session"])
+        global_slots = get_global_agent_slots(worker_share(self.execution_config["max_concurrent_agents_global"]))
+
+        # Longest remaining chain first when slots are scarce
+        policy = self.execution_config["scheduling_policy"]
+        priorities = compute_node_priorities(context.plan_graph, self.agent_latencies) if policy == "critical_path" else {}
+
+        ready_since = {}   # step_id -> perf_counter() when the step became ready
+        launched = set()
+        running = {}       # asyncio.Task -> step_id
+
+        async def execute_and_record(step_id):
+            result = await self._execute_step(step_id, context)
+            if result["success"]:
+                # mark_done runs any code left in the output, so it stays under the deadline and the slot
+                await context.mark_done(step_id, result["output"])
+            return result
+
+        async def run_node(step_id):
+            try:
+                async with global_slots:
+                    queue_wait = time.perf_counter() - ready_since[step_id]
+                    context.mark_running(step_id, queue_wait_time=queue_wait)
+                    log_step(f"⏱️ {step_id} started after {queue_wait:.2f}s in queue")
+                    
+                    # Deadline covers the whole step (LLM calls, code variants, CALL_SELF, mark_done's code execution)
+                    timeout = self._agent_timeout(context.get_step_data(step_id)["agent"])
+                    try:
+                        return await asyncio.wait_for(execute_and_record(step_id), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        return {"success": False, "error": f"Timed out after {timeout}s"}
+            finally:
+                session_slots.release()
+
+        try:
+            while True:
+                # Launch every ready step while this session has free slots
+                new_batch = []
+                for step_id in order_ready_steps(context.get_ready_steps(), priorities, policy):
+                    if step_id in launched:
+                        continue
+                    ready_since.setdefault(step_id, time.perf_counter())
+                    if session_slots.locked():
+                        continue
+                    await session_slots.acquire()
+                    launched.add(step_id)
+                    running[asyncio.create_task(run_node(step_id))] = step_id
+                    new_batch.append(step_id)
+
+                if new_batch:
+                    print(f"🚀 Executing batch: {new_batch}")
+                    publish_event(AgentEventType.BATCH_STARTED, context.plan_graph.graph['session_id'],
+                                  steps=new_batch, message=f"Executing batch: {new_batch}")
+
+                # Frontier is empty - nothing running and nothing left to launch
+                if not running:
                     break
-                await asyncio.sleep(0.3)
-                continue
 
-            # Rate limiting
-            batch_size = min(len(ready_steps), MAX_CONCURRENT_AGENTS)
-            current_batch = ready_steps[:batch_size]
-            
-            print(f"🚀 Executing batch: {current_batch}")
+                console.print(visualizer.get_layout())
 
-            # Mark running
-            for step_id in current_batch:
-                context.mark_running(step_id)
-            
-            # Execute batch
-            tasks = [self._execute_step(step_id, context) for step_id in current_batch]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # Process results - SIMPLE!
-            for step_id, result in zip(current_batch, results):
-                if isinstance(result, Exception):
-                    context.mark_failed(step_id, str(result))
-                elif result["success"]:
-                    await context.mark_done(step_id, result["output"])
-                else:
-                    context.mark_failed(step_id, result["error"])
+                # Wake up on the first completion instead of polling
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    step_id = running.pop(task)
+                    try:
+                        result = task.result()
+                    except asyncio.CancelledError:
+                        result = Exception("Cancelled")
+                    except Exception as e:
+                        result = e
+
+                    # Successful steps were already marked done inside run_node
+                    if isinstance(result, Exception):
+                        context.mark_failed(step_id, str(result))
+                        self._skip_blocked_steps(context)
+                    elif not result["success"]:
+                        context.mark_failed(step_id, result["error"])
+                        self._skip_blocked_steps(context)
+        finally:
+            # Aborted (task cancelled) - cancel in-flight nodes so they stop holding slots and LLM calls
+            if running:
+                for task in running:
+                    task.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
+                for step_id in running.values():
+                    context.mark_failed(step_id, "Cancelled")
+
+        console.print(visualizer.get_layout())
+        summary = context.get_execution_summary()
+        log_step(f"DAG finished: {summary['completed_steps']} completed, "
+                 f"{summary['failed_steps']} failed, {summary['skipped_steps']} skipped "
+                 f"of {summary['total_steps']} steps", symbol="🏁")
+        publish_event(AgentEventType.DAG_COMPLETED, summary['session_id'],
+                      completed=summary['completed_steps'], failed=summary['failed_steps'],
+                      skipped=summary['skipped_steps'], total=summary['total_steps'],
+                      message=f"DAG finished: {summary['completed_steps']}/{summary['total_steps']} steps completed")
 
-            if len(ready_steps) > batch_size:
-                await asyncio.sleep(5)
+    def _skip_blocked_steps(self, context):
+        """Skip every pending descendant of a failed step so no LLM calls are spent on doomed branches"""
+        blocked = GraphValidator(console=self.console).find_blocked_nodes(context.plan_graph)
+        for node_id, failed_ancestors in blocked.items():
+            if context.plan_graph.nodes[node_id]['status'] == 'pending':
+                context.mark_skipped(node_id, f"upstream failure in {', '.join(sorted(failed_ancestors))}")
 
     async def _execute_step(self, step_id, context):
         """SIMPLE: Execute step with direct output passing and code execution"""
         step_data = context.get_step_data(step_id)
         agent_type = step_data["agent"]
         
+        # Opt-in latency/cost trade-offs (see agent_config.yaml)
+        agent_config = self.agent_runner.agent_configs.get(agent_type, {})
+        race_variants = agent_config.get("race_code_variants", False)
+        speculative_call_self = agent_config.get("speculative_call_self", False)
+        
         # SIMPLE: Get raw outputs from previous steps
         inputs = context.get_inputs(step_data.get("reads", []))
         
@@ -248,9 +501,32 @@ Profile each file separately and return details."""
 
         # Execute first iteration
         agent_input = build_agent_input()
-        await self._show_timer_animation(30, f"🤖 {agent_type} Waiting before calling Gemini")
         result = await self.agent_runner.run_agent(agent_type, agent_input)
         
+        # SPECULATIVE: Issue the CALL_SELF second iteration as soon as the first response is parsed,
+        # overlapping it with the first iteration's code execution. Its previous_output is the raw first
+        # response, without execution_result - only for agents whose second pass does not read code results
+        second_task = None
+        if speculative_call_self and result["success"] and result["output"].get("call_self"):
+            log_step(f"🔮 {step_id}: Speculatively starting CALL_SELF second iteration", symbol="🔄")
+            second_task = asyncio.create_task(self.agent_runner.run_agent(
+                agent_type,
+                build_agent_input(
+                    instruction=result["output"].get("next_instruction", "Continue"),
+                    previous_output=result["output"]
+                )
+            ))
+        
+        try:
+            return await self._finish_step(step_id, context, step_data, agent_type, result, inputs,
+                                           build_agent_input, race_variants, second_task)
+        finally:
+            if second_task and not second_task.done():
+                second_task.cancel()
+
+    async def _finish_step(self, step_id, context, step_data, agent_type, result, inputs,
+                           build_agent_input, race_variants, second_task):
+        """Run code variants, CALL_SELF and clarification handling for a step's first response"""
         # NEW: Handle code execution if agent returned code variants
         if result["success"] and "code" in result["output"]:
             log_step(f"🔧 {step_id}: Agent returned code variants, executing...", symbol="⚙️")
@@ -260,13 +536,14 @@ Profile each file separately and return details."""
                 "code_variants": result["output"]["code"],  # CODE_1, CODE_2, etc.
             }
             
-            # Execute code variants sequentially until one succeeds
+            # Execute code variants sequentially until one succeeds (or race them when race_code_variants)
             try:
                 execution_result = await run_user_code(
                     executor_input, 
                     self.multi_mcp, 
                     context.plan_graph.graph['session_id'] or "default_session",
-                    inputs  # Pass inputs to code execution
+                    inputs,  # Pass inputs to code execution
+                    race_variants=race_variants
                 )
                 
                 # Handle execution results
@@ -312,18 +589,20 @@ Profile each file separately and return details."""
                 result["error"] = f"Code execution exception: {str(e)}"
         
         # Handle call_self if needed
-        if result["success"] and result["output"].get("call_self"):
+        if result["success"] and (second_task or result["output"].get("call_self")):
             log_step(f"🔄 CALL_SELF triggered for {step_id}", symbol="🔄")
             
-            # Second iteration with previous output
-            second_input = build_agent_input(
-                instruction=result["output"].get("next_instruction", "Continue"),
-                previous_output=result["output"]
-            )
-
-            await self._show_timer_animation(30, f"🤖 {agent_type} Waiting before calling Gemini")
-            
-            second_result = await self.agent_runner.run_agent(agent_type, second_input)
+            if second_task:
+                # Already in flight since the first response was parsed
+                second_result = await second_task
+            else:
+                # Second iteration with previous output
+                second_input = build_agent_input(
+                    instruction=result["output"].get("next_instruction", "Continue"),
+                    previous_output=result["output"]
+                )
+                
+                second_result = await self.agent_runner.run_agent(agent_type, second_input)
             
             # Handle code execution for second iteration too
             if second_result["success"] and "code" in second_result["output"]:
@@ -338,7 +617,8 @@ Profile each file separately and return details."""
                         executor_input,
                         self.multi_mcp,
                         context.plan_graph.graph['session_id'] or "default_session",
-                        inputs
+                        inputs,
+                        race_variants=race_variants
                     )
                     
                     if execution_result["status"] == "success":
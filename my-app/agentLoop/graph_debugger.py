@@ -154,6 +154,8 @@ class GraphDebugger:
                 status_display = "[red]❌ failed[/red]"
             elif status == 'pending':
                 status_display = "[yellow]🔲 pending[/yellow]"
+            elif status == 'skipped':
+                status_display = "[dim]⏭️ skipped[/dim]"
             else:
                 status_display = f"[dim]{status}[/dim]"
             
@@ -254,9 +256,8 @@ class GraphDebugger:
             border_style="yellow"
         ))
         
-        # Reset node status
-        node_data['status'] = 'pending'
-        node_data['output'] = None
+        # Reset node status (through the context so its ready set and counters follow)
+        self.context.reset_step(node_id)
         
         # 🔧 SPECIAL HANDLING FOR FORMATTERAGENT - Send ALL output_chain data
         if node_data["agent"] == "FormatterAgent":
@@ -296,7 +297,7 @@ class GraphDebugger:
         
         # Update the graph with new results
         if result["success"]:
-            self.context.mark_done(node_id, result["output"])
+            await self.context.mark_done(node_id, result["output"])
             new_output = result["output"]
             
             # 💾 Save exact input/output to temp.json
@@ -351,6 +352,8 @@ class GraphDebugger:
             
             return new_output
         else:
+            self.context.mark_failed(node_id, result["error"])
+            
             # 💾 Save inputs and error for debugging
             error_output = {"error": result["error"], "success": False}
             self._save_debug_data(node_id, inputs, [error_output])
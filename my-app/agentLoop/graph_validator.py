@@ -232,6 +232,23 @@ class GraphValidator:
         except Exception as e:
             return {"error": f"Critical path analysis failed: {e}"}
 
+    def compute_remaining_path_lengths(self, graph: nx.DiGraph, node_weights: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """
+        Longest weighted path from each node to any sink, counting the node itself
+        
+        Args:
+            graph: Execution DAG
+            node_weights: Expected duration per node (defaults to 1 per node, ROOT weighs 0)
+            
+        Returns:
+            dict: node_id -> remaining critical-path length
+        """
+        remaining = {}
+        for node in reversed(list(nx.topological_sort(graph))):
+            weight = 0.0 if node == "ROOT" else (node_weights or {}).get(node, 1.0)
+            remaining[node] = weight + max((remaining[succ] for succ in graph.successors(node)), default=0.0)
+        return remaining
+
     def find_blocked_nodes(self, graph: nx.DiGraph) -> Dict[str, List[str]]:
         """Find nodes that cannot execute due to failed dependencies"""
         blocked_nodes = {}
@@ -1,11 +1,18 @@
 import os
 import json
+import asyncio
+import importlib.util
+import httpx
 import yaml
 import requests
 from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
 from google import genai
+from google.genai import types
 from google.genai.errors import ServerError
 from dotenv import load_dotenv
+from agentLoop.rate_limiter import estimate_tokens
+from agentLoop.usage_tracker import get_usage_tracker
 
 load_dotenv()
 
@@ -13,31 +20,221 @@ ROOT = Path(__file__).parent.parent
 MODELS_JSON = ROOT / "config" / "models.json"
 PROFILE_YAML = ROOT / "config" / "profiles.yaml"
 
+# google-genai only comes in transitively (uv.lock pins 1.13.0), so pool options and explicit
+# close() are used only on versions that have them; older ones keep the SDK's own clients
+GENAI_POOL_ARGS = tuple(arg for arg in ("client_args", "async_client_args")
+                        if arg in getattr(types.HttpOptions, "model_fields", {}))
+
+class ModelClientRegistry:
+    """
+    Model config parsed once plus long-lived clients shared by every ModelManager in the process:
+    one genai.Client per API key (its httpx pool keeps connections alive; pool limits and HTTP/2,
+    when h2 is installed, apply on google-genai versions that accept client args) and one
+    aiohttp session per event loop for Ollama-style HTTP endpoints.
+    """
+
+    def __init__(self, models_path: Path = MODELS_JSON, profile_path: Path = PROFILE_YAML):
+        self.models_path = Path(models_path)
+        self.profile_path = Path(profile_path)
+        self._genai_clients: Dict[tuple, genai.Client] = {}
+        self._retired_clients = []  # Replaced by reload(); closed at shutdown so in-flight calls can finish
+        self._http_sessions: Dict[asyncio.AbstractEventLoop, Any] = {}
+        self.load()
+
+    def load(self):
+        self.config = json.loads(self.models_path.read_text())
+        self.profile = yaml.safe_load(self.profile_path.read_text())
+        self.pool_config = {
+            "http2": True,
+            "max_connections": 20,
+            "max_keepalive_connections": 10,
+            "keepalive_expiry_seconds": 60,
+            **(self.profile.get("model_clients") or {})
+        }
+
+    def reload(self):
+        """Re-read models.json / profiles.yaml; clients whose settings are unchanged keep their connections"""
+        self.load()
+        wanted = {self._client_key(info) for info in self.config["models"].values() if info.get("type") == "gemini"}
+        for key in [key for key in self._genai_clients if key not in wanted]:
+            self._retired_clients.append(self._genai_clients.pop(key))
+
+    @property
+    def http2_enabled(self) -> bool:
+        # httpx speaks HTTP/2 only with the optional h2 package
+        return bool(self.pool_config["http2"]) and importlib.util.find_spec("h2") is not None
+
+    @property
+    def default_model_key(self) -> str:
+        return self.profile["llm"]["text_generation"]
+
+    def model_info(self, model_key: str) -> Dict[str, Any]:
+        if model_key not in self.config["models"]:
+            available_models = list(self.config["models"].keys())
+            raise ValueError(f"Model '{model_key}' not found in models.json. Available: {available_models}")
+        return self.config["models"][model_key]
+
+    def _client_key(self, model_info: Dict[str, Any]) -> tuple:
+        api_key = os.getenv(model_info.get("api_key_env", "GEMINI_API_KEY"))
+        return (api_key, model_info.get("base_url"), tuple(sorted(self.pool_config.items())))
+
+    def genai_client(self, model_info: Dict[str, Any]) -> genai.Client:
+        key = self._client_key(model_info)
+        client = self._genai_clients.get(key)
+        if client is None:
+            api_key, base_url, _ = key
+            pool = {
+                "limits": httpx.Limits(max_connections=self.pool_config["max_connections"],
+                                       max_keepalive_connections=self.pool_config["max_keepalive_connections"],
+                                       keepalive_expiry=self.pool_config["keepalive_expiry_seconds"]),
+                "http2": self.http2_enabled
+            }
+            http_options = {"base_url": base_url} if base_url else {}
+            http_options.update({arg: pool for arg in GENAI_POOL_ARGS})
+            client = genai.Client(api_key=api_key,
+                                  http_options=types.HttpOptions(**http_options) if http_options else None)
+            self._genai_clients[key] = client
+        return client
+
+    async def http_session(self):
+        """Keep-alive aiohttp session for the running event loop"""
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        session = self._http_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_config["max_connections"],
+                                             keepalive_timeout=self.pool_config["keepalive_expiry_seconds"])
+            session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None))
+            self._http_sessions[loop] = session
+        return session
+
+    async def aclose(self):
+        """Close pooled connections (application shutdown)"""
+        for client in [*self._genai_clients.values(), *self._retired_clients]:
+            if hasattr(client.aio, "aclose"):
+                await client.aio.aclose()
+            if hasattr(client, "close"):
+                client.close()
+        self._genai_clients.clear()
+        self._retired_clients.clear()
+        loop = asyncio.get_running_loop()
+        session = self._http_sessions.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "genai_clients": len(self._genai_clients),
+            "retired_clients": len(self._retired_clients),
+            "http_sessions": sum(1 for session in self._http_sessions.values() if not session.closed),
+            "http2": self.http2_enabled,
+            "genai_pool_args": list(GENAI_POOL_ARGS)
+        }
+
+_model_clients: Optional[ModelClientRegistry] = None
+
+def get_model_clients() -> ModelClientRegistry:
+    """Process-wide model config and client pool"""
+    global _model_clients
+    if _model_clients is None:
+        _model_clients = ModelClientRegistry()
+    return _model_clients
+
 class ModelManager:
-    def __init__(self, model_name: str = None):
-        self.config = json.loads(MODELS_JSON.read_text())
-        self.profile = yaml.safe_load(PROFILE_YAML.read_text())
+    def __init__(self, model_name: str = None, clients: ModelClientRegistry = None,
+                 session_id: str = None, step_id: str = None):
+        # Cheap to construct per call: config and connections come from the shared registry
+        self.clients = clients or get_model_clients()
+
+        # Usage of every call is attributed to this session/node; last_usage is the most recent call's
+        self.session_id = session_id
+        self.step_id = step_id
+        self.last_usage: Optional[Dict[str, Any]] = None
+        self.config = self.clients.config
+        self.profile = self.clients.profile
 
         # 🎯 NEW: Use provided model_name or fall back to profile default
-        if model_name:
-            self.text_model_key = model_name
-        else:
-            self.text_model_key = self.profile["llm"]["text_generation"]
+        self.text_model_key = model_name or self.clients.default_model_key
         
         # Validate that the model exists in config
-        if self.text_model_key not in self.config["models"]:
-            available_models = list(self.config["models"].keys())
-            raise ValueError(f"Model '{self.text_model_key}' not found in models.json. Available: {available_models}")
-            
-        self.model_info = self.config["models"][self.text_model_key]
+        self.model_info = self.clients.model_info(self.text_model_key)
         self.model_type = self.model_info["type"]
 
         # Initialize client based on model type
         if self.model_type == "gemini":
-            api_key = os.getenv("GEMINI_API_KEY")
-            self.client = genai.Client(api_key=api_key)
+            self.client = self.clients.genai_client(self.model_info)
         # Add other model types as needed
 
+    @property
+    def generation_config(self) -> Dict[str, Any]:
+        """models.json `generation_config` (temperature, thinking_budget, response_schema - all optional)"""
+        return self.model_info.get("generation_config") or {}
+
+    def _gemini_config(self) -> Optional[types.GenerateContentConfig]:
+        params = self.generation_config
+        if not params:
+            return None
+        config = {}
+        if "temperature" in params:
+            config["temperature"] = params["temperature"]
+        if "thinking_budget" in params:
+            config["thinking_config"] = types.ThinkingConfig(thinking_budget=params["thinking_budget"])
+        if "response_schema" in params:
+            config["response_schema"] = params["response_schema"]
+            config["response_mime_type"] = "application/json"
+        return types.GenerateContentConfig(**config)
+
+    def _ollama_payload(self, prompt: str, stream: bool) -> Dict[str, Any]:
+        payload = {"model": self.model_info["model"], "prompt": prompt, "stream": stream}
+        params = self.generation_config
+        if "temperature" in params:
+            payload["options"] = {"temperature": params["temperature"]}
+        if "response_schema" in params:
+            payload["format"] = params["response_schema"]
+        return payload
+
+    def cost(self, usage: Dict[str, Any]) -> float:
+        """USD for one call from models.json `pricing` (per million tokens); unpriced models cost 0"""
+        pricing = self.model_info.get("pricing")
+        if not pricing:
+            return 0.0
+        long_context = pricing.get("long_context")
+        if long_context and usage["input_tokens"] > long_context["threshold_tokens"]:
+            pricing = {**pricing, **long_context}
+        input_rate = pricing.get("input_per_million", 0.0)
+        # Thinking tokens are billed as output
+        return ((usage["input_tokens"] - usage["cached_tokens"]) * input_rate
+                + usage["cached_tokens"] * pricing.get("cached_input_per_million", input_rate)
+                + (usage["output_tokens"] + usage["thinking_tokens"]) * pricing.get("output_per_million", 0.0)) / 1_000_000
+
+    def _record_usage(self, contents, text: str, input_tokens: int = None, output_tokens: int = None,
+                      cached_tokens: int = 0, thinking_tokens: int = 0) -> Dict[str, Any]:
+        """Price and record a call's provider-reported usage; counts the provider omits are estimated from text"""
+        estimated = input_tokens is None or output_tokens is None
+        if input_tokens is None:
+            prompt = contents if isinstance(contents, str) else "".join(c for c in contents if isinstance(c, str))
+            input_tokens = estimate_tokens(prompt)
+        if output_tokens is None:
+            output_tokens = estimate_tokens(text)
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cached_tokens": cached_tokens,
+            "thinking_tokens": thinking_tokens,
+            "total_tokens": input_tokens + output_tokens + thinking_tokens,
+            "estimated": estimated
+        }
+        usage["cost"] = self.cost(usage)
+        self.last_usage = usage
+        get_usage_tracker().record(self.text_model_key, usage, self.session_id, self.step_id)
+        return usage
+
+    def _record_gemini_usage(self, contents, text: str, metadata) -> Dict[str, Any]:
+        if metadata is None or metadata.prompt_token_count is None:
+            return self._record_usage(contents, text)
+        return self._record_usage(contents, text, metadata.prompt_token_count, metadata.candidates_token_count or 0,
+                                  metadata.cached_content_token_count or 0, metadata.thoughts_token_count or 0)
+
     async def generate_text(self, prompt: str) -> str:
         if self.model_type == "gemini":
             return await self._gemini_generate(prompt)
@@ -61,13 +258,39 @@ class ModelManager:
         
         raise NotImplementedError(f"Unsupported model type: {self.model_type}")
 
+    async def generate_text_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yield the response in pieces as the model produces them"""
+        if self.model_type == "gemini":
+            async for piece in self._gemini_generate_stream(prompt):
+                yield piece
+        elif self.model_type == "ollama":
+            async for piece in self._ollama_generate_stream(prompt):
+                yield piece
+        else:
+            raise NotImplementedError(f"Unsupported model type: {self.model_type}")
+
+    async def generate_content_stream(self, contents: list) -> AsyncIterator[str]:
+        """Streaming generate_content (text and images)"""
+        if self.model_type == "gemini":
+            async for piece in self._gemini_generate_stream(contents):
+                yield piece
+        elif self.model_type == "ollama":
+            # Ollama doesn't support images, fall back to text-only
+            text_content = "".join(content for content in contents if isinstance(content, str))
+            async for piece in self._ollama_generate_stream(text_content):
+                yield piece
+        else:
+            raise NotImplementedError(f"Unsupported model type: {self.model_type}")
+
     async def _gemini_generate(self, prompt: str) -> str:
         try:
             # ✅ CORRECT: Use truly async method
             response = await self.client.aio.models.generate_content(
                 model=self.model_info["model"],
-                contents=prompt
+                contents=prompt,
+                config=self._gemini_config()
             )
+            self._record_gemini_usage(prompt, response.text or "", response.usage_metadata)
             return response.text.strip()
 
         except ServerError as e:
@@ -83,8 +306,10 @@ class ModelManager:
             # ✅ Use async method with contents array (text + images)
             response = await self.client.aio.models.generate_content(
                 model=self.model_info["model"],
-                contents=contents
+                contents=contents,
+                config=self._gemini_config()
             )
+            self._record_gemini_usage(contents, response.text or "", response.usage_metadata)
             return response.text.strip()
 
         except ServerError as e:
@@ -94,32 +319,72 @@ class ModelManager:
             # ✅ Handle other potential errors
             raise RuntimeError(f"Gemini content generation failed: {str(e)}")
 
+    async def _gemini_generate_stream(self, contents) -> AsyncIterator[str]:
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_info["model"],
+                contents=contents,
+                config=self._gemini_config()
+            )
+            pieces = []
+            metadata = None
+            async for chunk in stream:
+                # Counts are cumulative; the last chunk carries the totals
+                metadata = chunk.usage_metadata or metadata
+                if chunk.text:
+                    pieces.append(chunk.text)
+                    yield chunk.text
+            self._record_gemini_usage(contents, "".join(pieces), metadata)
+        except ServerError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Gemini streaming generation failed: {str(e)}")
+
+    async def _ollama_generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        try:
+            session = await self.clients.http_session()
+            async with session.post(
+                self.model_info["url"]["generate"],
+                json=self._ollama_payload(prompt, stream=True)
+            ) as response:
+                response.raise_for_status()
+                # One JSON object per line: {"response": "<piece>", "done": false}; the done line has the counts
+                pieces = []
+                piece = {}
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    piece = json.loads(line)
+                    if piece.get("response"):
+                        pieces.append(piece["response"])
+                        yield piece["response"]
+                    if piece.get("done"):
+                        break
+                self._record_usage(prompt, "".join(pieces), piece.get("prompt_eval_count"), piece.get("eval_count"))
+        except Exception as e:
+            raise RuntimeError(f"Ollama streaming generation failed: {str(e)}")
+
     async def _ollama_generate(self, prompt: str) -> str:
         try:
-            # ✅ Use aiohttp for truly async requests
-            import aiohttp
-            timeout = aiohttp.ClientTimeout(total=None)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    self.model_info["url"]["generate"],
-                    json={"model": self.model_info["model"], "prompt": prompt, "stream": False}
-                ) as response:
-                    response.raise_for_status()
-                    result = await response.json()
-                    return result["response"].strip()
+            # ✅ Pooled keep-alive session shared by all calls on this event loop
+            session = await self.clients.http_session()
+            async with session.post(
+                self.model_info["url"]["generate"],
+                json=self._ollama_payload(prompt, stream=False)
+            ) as response:
+                response.raise_for_status()
+                result = await response.json()
+                self._record_usage(prompt, result["response"], result.get("prompt_eval_count"), result.get("eval_count"))
+                return result["response"].strip()
         except Exception as e:
             raise RuntimeError(f"Ollama generation failed: {str(e)}")
 
-    async def generate_text_with_usage(self, prompt):
-        """Generate text and return usage metadata"""
+    async def generate_text_with_usage(self, prompt: str):
+        """Generate text and return (text, usage) with the provider's token counts and the call's cost"""
         response = await self.generate_text(prompt)
-        
-        # Calculate usage (implement based on your model's API)
-        usage_metadata = {
-            "cost": self._calculate_cost(prompt, response),
-            "input_tokens": self._count_tokens(prompt),
-            "output_tokens": self._count_tokens(response),
-            "total_tokens": self._count_tokens(prompt) + self._count_tokens(response)
-        }
-        
-        return response, usage_metadata
+        return response, self.last_usage
+
+    async def generate_content_with_usage(self, contents: list):
+        """generate_content returning (text, usage)"""
+        response = await self.generate_content(contents)
+        return response, self.last_usage
@@ -25,6 +25,8 @@ except ImportError:
     # If we're running standalone and still can't import, define a minimal stub
     ExecutionContextManager = None
 
+from agentLoop.prompt_compaction import INTERNAL_OUTPUT_KEYS
+
 class ImageValidator:
     """Fast and safe image URL validation using async HTTP HEAD requests"""
     
@@ -195,6 +197,8 @@ class OutputAnalyzer:
                     status = f"[green]✅ {status}[/green]"
                 elif status == 'failed':
                     status = f"[red]❌ {status}[/red]"
+                elif status == 'skipped':
+                    status = f"[dim]⏭️ {status}[/dim]"
                 
                 table.add_row(
                     node_id,
@@ -1200,8 +1204,7 @@ def get_meaningful_keys(output):
     if not isinstance(output, dict):
         return []
     
-    skip_keys = {'cost', 'input_tokens', 'output_tokens', 'total_tokens', 'execution_result', 'execution_status', 'execution_error', 'execution_time', 'executed_variant'}
-    return [k for k in output.keys() if k not in skip_keys]
+    return [k for k in output.keys() if k not in INTERNAL_OUTPUT_KEYS]
 
 # Usage in main.py
 def analyze_results(context):
@@ -0,0 +1,126 @@
+"""
+Compaction of previous-step outputs before they are inlined into agent prompts
+
+Upstream outputs carry bookkeeping (token/cost metadata, execution_result
+blobs) that downstream agents never need, and were rendered as indented JSON.
+Here they are stripped of internal keys and rendered as compact JSON; agents
+with an `input_token_budget` in agent_config.yaml additionally get their
+longest strings and lists cut down until the context fits that budget.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from agentLoop.rate_limiter import estimate_tokens
+
+# Bookkeeping that run_agent / mark_done add to every step output (shared with output_analyzer.get_meaningful_keys)
+INTERNAL_OUTPUT_KEYS = frozenset({
+    'cost', 'input_tokens', 'output_tokens', 'total_tokens', 'cached',
+    'execution_result', 'execution_status', 'execution_error', 'execution_time', 'executed_variant'
+})
+
+# input_data entries holding step outputs: {step_id: output} maps and a single output
+STEP_OUTPUT_MAPS = ("inputs", "all_outputs")
+STEP_OUTPUT_VALUES = ("previous_output",)
+
+# Truncation never goes below this many characters per string
+MIN_VALUE_CHARS = 64
+
+# A truncated list keeps one item per this many characters of the per-value cap
+CHARS_PER_LIST_ITEM = 32
+
+@dataclass
+class CompactionStats:
+    raw_tokens: int  # Context as previously rendered (indented JSON, internal keys included)
+    compact_tokens: int
+    budget_tokens: Optional[int] = None
+    truncated_to_chars: Optional[int] = None  # Per-value cap applied to fit the budget
+
+def strip_internal_keys(output):
+    if not isinstance(output, dict):
+        return output
+    return {key: value for key, value in output.items() if key not in INTERNAL_OUTPUT_KEYS}
+
+def compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def render_value(value) -> str:
+    return compact_json(value) if isinstance(value, (dict, list)) else str(value)
+
+def _shrink(value, max_chars: int):
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        return f"{value[:max_chars]}…[{len(value) - max_chars} chars truncated]"
+    if isinstance(value, dict):
+        return {key: _shrink(item, max_chars) for key, item in value.items()}
+    if isinstance(value, list):
+        max_items = max(1, max_chars // CHARS_PER_LIST_ITEM)
+        shrunk = [_shrink(item, max_chars) for item in value[:max_items]]
+        if len(value) > max_items:
+            shrunk.append(f"…[{len(value) - max_items} more items]")
+        return shrunk
+    return value
+
+def _longest(value) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return max((_longest(item) for item in value.values()), default=0)
+    if isinstance(value, list):
+        return max([len(value) * CHARS_PER_LIST_ITEM, *(_longest(item) for item in value)])
+    return 0
+
+def _tokens(values: Dict[Any, Any]) -> int:
+    return sum(estimate_tokens(render_value(value)) for value in values.values())
+
+def fit_to_budget(values: Dict[Any, Any], budget_tokens: int) -> Tuple[Dict[Any, Any], Optional[int]]:
+    """Largest per-value character cap whose rendering fits the budget (binary search); None if it already fits"""
+    if _tokens(values) <= budget_tokens:
+        return values, None
+    low, high = MIN_VALUE_CHARS, _longest(values)
+    best = None
+    while low <= high:
+        cap = (low + high) // 2
+        shrunk = _shrink(values, cap)
+        if _tokens(shrunk) <= budget_tokens:
+            best, low = (shrunk, cap), cap + 1
+        else:
+            high = cap - 1
+    # Even the minimum cap is over budget (many small values): send the smallest version
+    return best or (_shrink(values, MIN_VALUE_CHARS), MIN_VALUE_CHARS)
+
+def compact_context(input_data: Dict[str, Any], budget_tokens: int = None) -> Tuple[Dict[str, Any], CompactionStats]:
+    """
+    Compacted step outputs of input_data, keyed like input_data (`inputs` and
+    `all_outputs` stay {step_id: output} maps), plus before/after token counts
+    """
+    raw_tokens = 0
+    values = {}  # (input_data key, step_id or None) -> stripped output
+    for key in STEP_OUTPUT_MAPS:
+        if isinstance(input_data.get(key), dict):
+            for step_id, output in input_data[key].items():
+                # `inputs` were rendered as indented JSON, everything else with str()
+                if key == "inputs" and isinstance(output, (dict, list)):
+                    raw_tokens += estimate_tokens(json.dumps(output, indent=2, default=str))
+                else:
+                    raw_tokens += estimate_tokens(str(output))
+                values[(key, step_id)] = strip_internal_keys(output)
+    for key in STEP_OUTPUT_VALUES:
+        if key in input_data:
+            raw_tokens += estimate_tokens(str(input_data[key]))
+            values[(key, None)] = strip_internal_keys(input_data[key])
+
+    stats = CompactionStats(raw_tokens=raw_tokens, compact_tokens=0, budget_tokens=budget_tokens)
+    if budget_tokens:
+        values, stats.truncated_to_chars = fit_to_budget(values, budget_tokens)
+    stats.compact_tokens = _tokens(values)
+
+    compacted = {}
+    for (key, step_id), value in values.items():
+        if step_id is None:
+            compacted[key] = value
+        else:
+            compacted.setdefault(key, {})[step_id] = value
+    return compacted, stats
@@ -0,0 +1,148 @@
+"""
+Process-wide cache of prompt templates
+
+Orchestrator templates are compiled by Jinja2 once and agent prompt files are
+read once; both are re-read only when the file's mtime changes (checked at
+most every `check_interval_seconds`, for editing prompts on a running server).
+Templates are immutable once built and the registry swaps a whole new dict in
+on reload, so a render in flight always sees one consistent version.
+"""
+
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from jinja2 import Environment, Template, meta
+
+@dataclass
+class PromptTemplate:
+    path: Path
+    source: str
+    mtime: float
+    compiled: Optional[Template] = None  # None for plain-text agent prompts
+    required: frozenset = frozenset()
+    variables: frozenset = frozenset()
+    loaded_at: float = field(default_factory=time.time)
+
+@dataclass
+class RenderStats:
+    renders: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    loads: int = 0
+
+class PromptTemplateRegistry:
+    def __init__(self, auto_reload: bool = True, check_interval_seconds: float = 1.0):
+        self.auto_reload = auto_reload
+        self.check_interval_seconds = check_interval_seconds
+        self.env = Environment()
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._specs: Dict[str, tuple] = {}  # name -> (path, required, jinja)
+        self._checked_at: Dict[str, float] = {}
+        self._stats: Dict[str, RenderStats] = {}
+
+    def register(self, name: str, path, required: Iterable[str] = ()) -> PromptTemplate:
+        """Compile a Jinja2 template now; fails if it does not parse or never uses a required variable"""
+        self._specs[name] = (Path(path), frozenset(required), True)
+        template = self._load(name)
+        self._templates = {**self._templates, name: template}
+        return template
+
+    def _load(self, name: str) -> PromptTemplate:
+        path, required, jinja = self._specs[name]
+        stat = path.stat()
+        source = path.read_text(encoding="utf-8")
+        template = PromptTemplate(path, source, stat.st_mtime, required=required)
+        if jinja:
+            parsed = self.env.parse(source, name=name, filename=str(path))
+            template.variables = frozenset(meta.find_undeclared_variables(parsed))
+            unused = required - template.variables
+            if unused:
+                raise ValueError(f"Template {path} does not use required variables: {', '.join(sorted(unused))}")
+            template.compiled = self.env.from_string(source)
+        self._stats.setdefault(name, RenderStats()).loads += 1
+        return template
+
+    def _get(self, name: str) -> PromptTemplate:
+        if name not in self._specs:
+            raise KeyError(f"Unknown prompt template: {name}")
+        template = self._templates.get(name)
+        if template is None or not self.auto_reload:
+            return template if template is not None else self._refresh(name)
+
+        now = time.monotonic()
+        if now - self._checked_at.get(name, 0.0) >= self.check_interval_seconds:
+            self._checked_at[name] = now
+            try:
+                if template.path.stat().st_mtime != template.mtime:
+                    return self._refresh(name, template)
+            except OSError:
+                pass  # Deleted mid-edit: keep serving the last good version
+        return template
+
+    def _refresh(self, name: str, previous: PromptTemplate = None) -> PromptTemplate:
+        try:
+            template = self._load(name)
+        except Exception as e:
+            if previous is None:
+                raise
+            print(f"⚠️ Keeping previous version of prompt template {name}: {e}")
+            return previous
+        self._templates = {**self._templates, name: template}
+        if previous is not None:
+            print(f"🔄 Prompt template reloaded: {template.path}")
+        return template
+
+    def render(self, name: str, context: Dict[str, Any]) -> str:
+        template = self._get(name)
+        missing = template.required - context.keys()
+        if missing:
+            raise ValueError(f"Missing variables for template {name}: {', '.join(sorted(missing))}")
+
+        started = time.perf_counter()
+        rendered = template.compiled.render(context)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stats = self._stats[name]
+        stats.renders += 1
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        return rendered
+
+    def text(self, path) -> str:
+        """Contents of a plain prompt file (agent system prompts), cached until the file changes"""
+        name = str(path)
+        if name not in self._specs:
+            self._specs[name] = (Path(path), frozenset(), False)
+        return self._get(name).source
+
+    def reload(self) -> int:
+        """Re-read every known template and swap them all in at once; the old set stays live on any failure"""
+        templates = {name: self._load(name) for name in self._specs}
+        self._templates = templates
+        return len(templates)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = {}
+        for name, template in self._templates.items():
+            counters = self._stats.get(name, RenderStats())
+            stats[name] = {
+                "path": str(template.path),
+                "loads": counters.loads,
+                "loaded_at": template.loaded_at,
+                "renders": counters.renders,
+                "avg_render_ms": round(counters.total_ms / counters.renders, 3) if counters.renders else None,
+                "max_render_ms": round(counters.max_ms, 3)
+            }
+        return stats
+
+_registry: Optional[PromptTemplateRegistry] = None
+
+def get_prompt_templates() -> PromptTemplateRegistry:
+    """Process-wide template registry configured by profiles.yaml prompt_templates"""
+    global _registry
+    if _registry is None:
+        from agentLoop.flow import load_profile_section
+        config = load_profile_section("prompt_templates", {"auto_reload": True, "check_interval_seconds": 1.0})
+        _registry = PromptTemplateRegistry(config["auto_reload"], config["check_interval_seconds"])
+    return _registry
@@ -0,0 +1,187 @@
+"""
+Token-bucket rate limiting for LLM calls
+
+The buckets live in the shared store (utils.shared_store), so every uvicorn
+worker draws from one budget per model; a refill-and-take is one write
+transaction, run off the event loop. Without a store (tools, benchmarks) the
+buckets are in memory and only cover this process.
+"""
+
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).parent.parent
+MODELS_JSON = ROOT / "config" / "models.json"
+
+class TokenBucket:
+    """Bucket that refills continuously up to `per_minute` units"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.refill_rate = self.capacity / 60.0  # units per second
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (oversized requests wait for a full bucket)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Take (or, when negative, give back) units after the fact; the bucket may go into debt"""
+        self._refill()
+        self.available = min(self.capacity, self.available - amount)
+
+    def remaining(self) -> float:
+        self._refill()
+        return max(0.0, self.available)
+
+class ModelRateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for a single model"""
+
+    def __init__(self, model_key: str, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 store=None):
+        self.model_key = model_key
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.store = store
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute and not store else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute and not store else None
+        self._lock = None  # Created lazily inside the running event loop
+
+        # Metrics
+        self.total_requests = 0
+        self.delayed_requests = 0
+        self.total_wait_time = 0.0
+        self.estimated_tokens = 0
+        self.actual_tokens = 0
+
+    def _shared_buckets(self, tokens: int = 0) -> List[Tuple[str, float, float]]:
+        buckets = []
+        if self.requests_per_minute:
+            buckets.append((f"{self.model_key}:requests", self.requests_per_minute, 1))
+        if self.tokens_per_minute:
+            buckets.append((f"{self.model_key}:tokens", self.tokens_per_minute, tokens))
+        return buckets
+
+    async def _try_take(self, tokens: int) -> float:
+        """Take one request and `tokens` from the buckets if both have room, else the seconds to wait"""
+        if self.store:
+            buckets = self._shared_buckets(tokens)
+            return await asyncio.to_thread(self.store.take_from_buckets, buckets) if buckets else 0.0
+
+        waits = [0.0]
+        if self.request_bucket:
+            waits.append(self.request_bucket.wait_time(1))
+        if self.token_bucket:
+            waits.append(self.token_bucket.wait_time(tokens))
+        wait = max(waits)
+        if wait == 0.0:
+            if self.request_bucket:
+                self.request_bucket.consume(1)
+            if self.token_bucket:
+                self.token_bucket.consume(tokens)
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait (only if needed) until the call fits in both buckets; returns seconds waited"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        waited = 0.0
+        # The lock keeps waiters FIFO across all sessions in this process sharing this model
+        async with self._lock:
+            wait = await self._try_take(tokens)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                waited += wait
+                wait = await self._try_take(tokens)
+
+        self.total_requests += 1
+        if waited > 0:
+            self.delayed_requests += 1
+            self.total_wait_time += waited
+        return waited
+
+    async def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """Swap a call's acquire() estimate for the prompt tokens the provider actually counted"""
+        if self.store and self.tokens_per_minute:
+            await asyncio.to_thread(self.store.adjust_bucket, f"{self.model_key}:tokens", self.tokens_per_minute,
+                                    actual_tokens - estimated_tokens)
+        elif self.token_bucket:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+        self.estimated_tokens += estimated_tokens
+        self.actual_tokens += actual_tokens
+
+    def _remaining(self, bucket: Optional[TokenBucket], name: str, capacity: Optional[float]) -> Optional[float]:
+        if self.store and capacity:
+            return max(0.0, self.store.bucket_level(f"{self.model_key}:{name}", capacity))
+        return bucket.remaining() if bucket else None
+
+    def get_metrics(self) -> Dict[str, float]:
+        return {
+            "model": self.model_key,
+            "shared": self.store is not None,
+            "remaining_requests": self._remaining(self.request_bucket, "requests", self.requests_per_minute),
+            "remaining_tokens": self._remaining(self.token_bucket, "tokens", self.tokens_per_minute),
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "total_requests": self.total_requests,
+            "delayed_requests": self.delayed_requests,
+            "total_wait_time": round(self.total_wait_time, 3),
+            "estimated_tokens": self.estimated_tokens,
+            "actual_tokens": self.actual_tokens
+        }
+
+# Shared by every AgentRunner / FastAPI session in this process (their buckets by every worker)
+_limiters: Dict[str, ModelRateLimiter] = {}
+
+def _shared_bucket_store():
+    try:
+        from utils.shared_store import get_shared_store
+        return get_shared_store()
+    except Exception as e:
+        print(f"⚠️ Rate limits fall back to per-process buckets: {e}")
+        return None
+
+def get_rate_limiter(model_key: str) -> ModelRateLimiter:
+    """Return the limiter for a model key from models.json (budget shared through the shared store)"""
+    limiter = _limiters.get(model_key)
+    if limiter is None:
+        limits = {}
+        try:
+            models = json.loads(MODELS_JSON.read_text())["models"]
+            limits = models.get(model_key, {}).get("rate_limits", {})
+        except Exception:
+            pass
+        limiter = ModelRateLimiter(
+            model_key,
+            requests_per_minute=limits.get("requests_per_minute"),
+            tokens_per_minute=limits.get("tokens_per_minute"),
+            store=_shared_bucket_store() if limits else None
+        )
+        _limiters[model_key] = limiter
+    return limiter
+
+def get_rate_limit_metrics() -> Dict[str, Dict[str, float]]:
+    """Remaining budget and wait statistics for every model used so far"""
+    return {key: limiter.get_metrics() for key, limiter in _limiters.items()}
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for bucket accounting"""
+    return max(1, len(text) // 4)
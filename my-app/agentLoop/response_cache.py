@@ -0,0 +1,198 @@
+"""
+Content-addressed cache of raw LLM responses
+
+Keyed by (model, generation parameters, normalized request, attached file
+digests). The request leaves out per-run identifiers (session_context) and the
+bookkeeping keys of upstream outputs, and refers to attached files by position
+instead of their per-upload paths (the stored response too, with this call's
+paths put back on a hit), so a replayed node, a retried session, a re-run job,
+a repeated identical form or a re-upload of the same file gets the earlier
+response without a model call. Two tiers: an in-process LRU in front of a storage tier shared by
+all workers (utils.cache.DiskLRUCache by default; anything with get/set works).
+Agents opt in with `cache: true` / `cache_ttl_seconds` in agent_config.yaml.
+"""
+
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from agentLoop.prompt_compaction import STEP_OUTPUT_MAPS, STEP_OUTPUT_VALUES, strip_internal_keys
+from utils.cache import DiskLRUCache, stable_hash
+
+# input_data entries that differ per run without changing what the model is asked
+# (session id, file manifest); attached files are keyed by content digest instead
+UNKEYED_INPUT_KEYS = frozenset({"session_context", "files", "image"})
+
+FILE_PLACEHOLDER = re.compile(r"<<FILE(_NAME)?_(\d+)>>")
+
+class MemoryLRU:
+    """Bounded by entry count and total response bytes"""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        self.delete(key)
+        self._entries[key] = entry
+        self.bytes += len(entry["response"])
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted["response"])
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry["response"])
+
+    def __len__(self):
+        return len(self._entries)
+
+def _file_substitutions(file_paths: List[str]) -> List[tuple]:
+    """(text, placeholder) pairs for each attached file's path and name, longest first so no text is cut short"""
+    pairs = []
+    for index, path in enumerate(file_paths):
+        pairs.append((str(path), f"<<FILE_{index}>>"))
+        if Path(path).suffix:  # Bare words would also match ordinary text
+            pairs.append((Path(path).name, f"<<FILE_NAME_{index}>>"))
+    return sorted(pairs, key=lambda pair: len(pair[0]), reverse=True)
+
+def abstract_file_paths(value, file_paths: List[str]):
+    """Replace attached files' paths and names (uploads land under per-run paths) with positional placeholders"""
+    if not file_paths:
+        return value
+    if isinstance(value, str):
+        for text, placeholder in _file_substitutions(file_paths):
+            value = value.replace(text, placeholder)
+        return value
+    if isinstance(value, dict):
+        return {key: abstract_file_paths(item, file_paths) for key, item in value.items()}
+    if isinstance(value, list):
+        return [abstract_file_paths(item, file_paths) for item in value]
+    return value
+
+def restore_file_paths(text: str, file_paths: List[str]) -> str:
+    """A cached response with this call's file paths and names put back"""
+    def restore(match):
+        index = int(match.group(2))
+        if index >= len(file_paths):
+            return match.group(0)
+        return Path(file_paths[index]).name if match.group(1) else str(file_paths[index])
+    return FILE_PLACEHOLDER.sub(restore, text) if file_paths else text
+
+def normalize_request(system_prompt: str, input_data: Dict[str, Any], input_token_budget: int = None,
+                      file_paths: List[str] = ()) -> Dict[str, Any]:
+    """What an agent call asks the model, minus per-run identifiers, upstream bookkeeping and file locations"""
+    request = {key: value for key, value in input_data.items() if key not in UNKEYED_INPUT_KEYS}
+    for key in STEP_OUTPUT_MAPS:
+        if isinstance(request.get(key), dict):
+            request[key] = {step_id: strip_internal_keys(output) for step_id, output in request[key].items()}
+    for key in STEP_OUTPUT_VALUES:
+        if key in request:
+            request[key] = strip_internal_keys(request[key])
+    return {"system_prompt": system_prompt, "input": abstract_file_paths(request, list(file_paths)),
+            "input_token_budget": input_token_budget}
+
+def file_digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ResponseCache:
+    def __init__(self, config: Dict[str, Any], storage=None):
+        self.enabled = config["enabled"]
+        self.memory = MemoryLRU(config["max_memory_entries"], config["max_memory_mb"] * 1024 * 1024)
+        # Entries carry their own expiry (per-agent TTLs), so the storage tier needs none
+        self.storage = storage if storage is not None else DiskLRUCache(config["directory"], max_entries=config["max_disk_entries"])
+
+        # Metrics
+        self.memory_hits = 0
+        self.storage_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bytes_saved = 0
+        self.seconds_saved = 0.0
+
+    @staticmethod
+    def make_key(model_key: str, model_id: str, generation_config: Dict[str, Any], request: Dict[str, Any],
+                 file_paths: Iterable[str] = ()) -> str:
+        # Files by content, in the order the request's <<FILE_i>> placeholders refer to them
+        return stable_hash(model_key, model_id, generation_config, request,
+                           [file_digest(path) if Path(path).exists() else None for path in file_paths])
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.memory.get(key)
+        tier = "memory"
+        if entry is None:
+            entry = self.storage.get(key)
+            tier = "storage"
+        if entry is not None and entry.get("expires_at") and entry["expires_at"] < time.time():
+            self.memory.delete(key)
+            self.storage.delete(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if tier == "storage":
+            self.storage_hits += 1
+            self.memory.set(key, entry)
+        else:
+            self.memory_hits += 1
+        self.bytes_saved += len(entry["response"])
+        self.seconds_saved += entry.get("generation_seconds", 0.0)
+        return entry["response"]
+
+    def set(self, key: str, response: str, ttl_seconds: Optional[float] = None, generation_seconds: float = 0.0):
+        entry = {
+            "response": response,
+            "expires_at": time.time() + ttl_seconds if ttl_seconds else None,
+            "generation_seconds": round(generation_seconds, 3)
+        }
+        self.memory.set(key, entry)
+        self.storage.set(key, entry)
+        self.stores += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.storage_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.bytes,
+            "memory_hits": self.memory_hits,
+            "storage_hits": self.storage_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.storage_hits) / lookups, 3) if lookups else None,
+            "stores": self.stores,
+            "bytes_saved": self.bytes_saved,
+            "seconds_saved": round(self.seconds_saved, 1)
+        }
+
+_response_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide response cache configured by profiles.yaml response_cache"""
+    global _response_cache
+    if _response_cache is None:
+        from agentLoop.flow import load_profile_section
+        _response_cache = ResponseCache(load_profile_section("response_cache", {
+            "enabled": False,
+            "directory": "memory/response_cache",
+            "max_memory_entries": 256,
+            "max_memory_mb": 32,
+            "max_disk_entries": 2000
+        }))
+    return _response_cache
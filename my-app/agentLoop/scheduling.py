@@ -0,0 +1,54 @@
+"""
+Ready-node prioritization for the DAG scheduler
+"""
+
+import json
+import statistics
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import networkx as nx
+
+from agentLoop.graph_validator import GraphValidator
+from agentLoop.session_serializer import SESSION_INDEX_DIR
+
+SCHEDULING_POLICIES = ("fifo", "critical_path")
+
+def load_agent_latencies(session_dir: Path = SESSION_INDEX_DIR, max_sessions: int = 200) -> Dict[str, float]:
+    """Median execution_time per agent over completed nodes of the most recent session files"""
+    session_files = sorted(Path(session_dir).glob("*/*/*/session_*.json"),
+                           key=lambda p: p.stat().st_mtime, reverse=True)[:max_sessions]
+
+    samples: Dict[str, List[float]] = {}
+    for session_file in session_files:
+        try:
+            with open(session_file, "r", encoding="utf-8") as f:
+                nodes = json.load(f).get("nodes", [])
+        except Exception:
+            continue
+        for node in nodes:
+            execution_time = node.get("execution_time")
+            if node.get("status") == "completed" and node.get("agent") and execution_time:
+                samples.setdefault(node["agent"], []).append(float(execution_time))
+
+    return {agent: statistics.median(times) for agent, times in samples.items()}
+
+def compute_node_priorities(graph: nx.DiGraph, agent_latencies: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    Remaining critical-path length per node.
+
+    With agent_latencies each node weighs its agent's historical median latency
+    (agents with no history get the overall median); without, every node weighs 1.
+    """
+    node_weights = None
+    if agent_latencies:
+        fallback = statistics.median(agent_latencies.values())
+        node_weights = {node_id: agent_latencies.get(data.get("agent"), fallback)
+                        for node_id, data in graph.nodes(data=True)}
+    return GraphValidator().compute_remaining_path_lengths(graph, node_weights)
+
+def order_ready_steps(ready_steps: List[str], priorities: Dict[str, float], policy: str = "critical_path") -> List[str]:
+    """FIFO keeps ready order; critical_path starts the longest remaining chain first (ties stay FIFO)"""
+    if policy != "critical_path" or not priorities:
+        return list(ready_steps)
+    return sorted(ready_steps, key=lambda step_id: -priorities.get(step_id, 0.0))
@@ -8,6 +8,9 @@ from pathlib import Path
 from datetime import datetime
 from typing import Optional
 
+SESSION_INDEX_DIR = Path("memory/session_summaries_index")
+CHECKPOINT_DIR = Path("memory/checkpoints")
+
 class SessionSerializer:
     """Centralized session serialization and loading"""
     
@@ -36,7 +39,7 @@ class SessionSerializer:
             session_file = Path(f"memory/debug_session_{original_id}_{timestamp}.json")
         else:
             # Regular session path with date structure
-            base_dir = Path("memory/session_summaries_index")
+            base_dir = SESSION_INDEX_DIR
             today = datetime.now()
             date_dir = base_dir / str(today.year) / f"{today.month:02d}" / f"{today.day:02d}"
             
@@ -71,6 +74,63 @@ class SessionSerializer:
         
         return nx.node_link_graph(graph_data, edges="links")
     
+    @staticmethod
+    def find_session_file(session_id: str) -> Optional[Path]:
+        """
+        Locate the most recently written session file for a session ID
+        
+        Args:
+            session_id: Session identifier
+            
+        Returns:
+            Optional[Path]: Session file, or None if the session never reached execution
+        """
+        matches = list(SESSION_INDEX_DIR.glob(f"*/*/*/session_{session_id}.json"))
+        if not matches:
+            return None
+        return max(matches, key=lambda p: p.stat().st_mtime)
+    
+    @staticmethod
+    def save_checkpoint(checkpoint: dict) -> Path:
+        """
+        Persist pipeline stage checkpoint (query, file profiles, plan, completed stages)
+        
+        Args:
+            checkpoint: Checkpoint dict containing at least 'session_id'
+            
+        Returns:
+            Path: The checkpoint file path
+        """
+        checkpoint_file = CHECKPOINT_DIR / f"checkpoint_{checkpoint['session_id']}.json"
+        checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+        checkpoint['updated_at'] = datetime.utcnow().isoformat()
+        
+        # Write then rename so a crash mid-write never leaves a truncated checkpoint
+        tmp_file = checkpoint_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, indent=2, default=str, ensure_ascii=False)
+        tmp_file.replace(checkpoint_file)
+        
+        return checkpoint_file
+    
+    @staticmethod
+    def load_checkpoint(session_id: str) -> Optional[dict]:
+        """
+        Load pipeline stage checkpoint for a session
+        
+        Args:
+            session_id: Session identifier
+            
+        Returns:
+            Optional[dict]: Checkpoint dict, or None if no checkpoint exists
+        """
+        checkpoint_file = CHECKPOINT_DIR / f"checkpoint_{session_id}.json"
+        if not checkpoint_file.exists():
+            return None
+        
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
     @staticmethod
     def get_session_info(graph: nx.DiGraph) -> dict:
         """Get session metadata for display"""
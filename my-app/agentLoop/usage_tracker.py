@@ -0,0 +1,108 @@
+"""
+Token and cost accounting from provider-reported usage
+
+ModelManager records every call here. Per-session/per-node counters live in
+memory until the step finishes (ExecutionContextManager copies them onto the
+graph node, so they persist with the session); per-day counters per model are
+incremented in the shared store, so every worker adds to one daily total. Those
+increments are summed in memory and written by a background thread, since
+record() runs on the event loop for every model call and a contended write can
+wait out busy_timeout.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cached_tokens", "thinking_tokens", "cost")
+
+def empty_usage() -> Dict[str, Any]:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "thinking_tokens": 0, "cost": 0.0}
+
+def add_usage(total: Dict[str, Any], usage: Dict[str, Any], calls: int = 1) -> Dict[str, Any]:
+    total["calls"] += calls
+    for field in USAGE_FIELDS:
+        total[field] += usage.get(field, 0)
+    return total
+
+def utc_day(when: datetime = None) -> str:
+    return (when or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+
+_usage_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="usage-writer")
+
+class UsageTracker:
+    def __init__(self, store=None, max_sessions: int = 200):
+        self._store = store
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, Dict[str, Any]]]" = OrderedDict()  # session -> step -> counters
+        self._unwritten: Dict[tuple, Dict[str, Any]] = {}  # (day, model) -> counters not yet in the store
+        self._unwritten_lock = threading.Lock()
+        self._flush_scheduled = False
+
+    @property
+    def store(self):
+        if self._store is None:
+            from utils.shared_store import get_shared_store
+            self._store = get_shared_store()
+        return self._store
+
+    def record(self, model_key: str, usage: Dict[str, Any], session_id: str = None, step_id: str = None):
+        if session_id:
+            nodes = self._sessions.setdefault(session_id, {})
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            add_usage(nodes.setdefault(step_id or "", empty_usage()), usage)
+        with self._unwritten_lock:
+            add_usage(self._unwritten.setdefault((utc_day(), model_key), empty_usage()), usage)
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                _usage_writer.submit(self._flush)
+
+    def _flush(self):
+        """Write the summed increments (background thread); calls recorded meanwhile go in the next flush"""
+        with self._unwritten_lock:
+            unwritten, self._unwritten = self._unwritten, {}
+            self._flush_scheduled = False
+        try:
+            with self.store.transaction():
+                for (day, model_key), counters in unwritten.items():
+                    self.store.add_daily_usage(day, model_key, counters, counters["calls"])
+        except Exception as e:
+            # Accounting must never fail the model calls it describes
+            print(f"⚠️ Daily token usage not recorded ({sum(c['calls'] for c in unwritten.values())} calls): {e}")
+
+    def node_usage(self, session_id: str, step_id: str) -> Optional[Dict[str, Any]]:
+        usage = self._sessions.get(session_id, {}).get(step_id)
+        return dict(usage) if usage else None
+
+    def session_usage(self, session_id: str) -> Dict[str, Dict[str, Any]]:
+        return {step_id: dict(usage) for step_id, usage in self._sessions.get(session_id, {}).items()}
+
+    def daily_usage(self, days: int = 1) -> Dict[str, Dict[str, Any]]:
+        """Totals per UTC day (today and the previous days-1), with a per-model breakdown"""
+        today = datetime.now(timezone.utc)
+        since, until = utc_day(today - timedelta(days=days - 1)), utc_day(today)
+        rows = self.store.daily_usage(since, until)
+        # Plus this process's increments still queued for the writer (a batch being written shows up once committed)
+        with self._unwritten_lock:
+            rows += [{"day": day, "model": model_key, **counters}
+                     for (day, model_key), counters in self._unwritten.items() if since <= day <= until]
+        daily = {}
+        for row in rows:
+            day = daily.setdefault(row["day"], {**empty_usage(), "models": {}})
+            counters = {field: row[field] for field in USAGE_FIELDS}
+            add_usage(day, counters, row["calls"])
+            add_usage(day["models"].setdefault(row["model"], empty_usage()), counters, row["calls"])
+        return daily
+
+_usage_tracker: Optional[UsageTracker] = None
+
+def get_usage_tracker() -> UsageTracker:
+    """Process-wide usage tracker (daily counters go to the shared store)"""
+    global _usage_tracker
+    if _usage_tracker is None:
+        _usage_tracker = UsageTracker()
+    return _usage_tracker
@@ -40,7 +40,7 @@ class ExecutionVisualizer:
             
             # Status symbols
             status_symbol = {
-                "pending": "🔲", "running": "🔄", "completed": "✅", "failed": "❌"
+                "pending": "🔲", "running": "🔄", "completed": "✅", "failed": "❌", "skipped": "⏭️"
             }[status]
             
             # Format label
@@ -57,6 +57,8 @@ class ExecutionVisualizer:
                 label.stylize("yellow") 
             elif status == "failed":
                 label.stylize("red")
+            elif status == "skipped":
+                label.stylize("dim strike")
             else:
                 label.stylize("dim")
             
@@ -123,6 +125,6 @@ class ExecutionVisualizer:
     def is_finished(self):
         """Check if execution is finished"""
         return all(
-            self.G.nodes[n]["status"] in ["completed", "failed"] 
+            self.G.nodes[n]["status"] in ["completed", "failed", "skipped"] 
             for n in self.G.nodes if n != "ROOT"
         )
@@ -1,12 +1,10 @@
-# agent_stream_service.py - Fixed version with ANSI color code cleaning and blank line filtering
+# agent_stream_service.py - SSE streaming of typed agent events from the in-process event bus
 import asyncio
 import json
-from typing import AsyncGenerator, Dict, Any
-from dataclasses import dataclass
-from enum import Enum
-import sys
+from typing import AsyncGenerator, Dict, Any, Optional
+from dataclasses import dataclass, field
+from collections import deque
 import io
-import re
 import time
 import traceback
 from pathlib import Path
@@ -16,167 +14,103 @@ from dotenv import load_dotenv
 # Import your existing modules
 from utils.utils import log_step, log_error
 from mcp_servers.multiMCP import MultiMCP
-from agentLoop.flow import AgentLoop4
+from agentLoop.flow import AgentLoop4, load_profile_section
+from agentLoop.contextManager import generate_session_id
 from agentLoop.output_analyzer import analyze_results
+from agentLoop.event_bus import AgentEvent, AgentEventType, EventHistory, Subscription, event_bus, event_writer
+from utils.log_routing import install_stdout_router, session_log_sink
+from utils.shared_store import SESSION_TERMINAL_STATUSES, WORKER_ID, get_shared_store
+from utils.sip_report_data import write_sip_report_sidecar
 
-class EventType(Enum):
-    BATCH_START = "batch_start"
-    AGENT_EXECUTING = "agent_executing" 
-    TASK_COMPLETED = "task_completed"
-    DAG_UPDATE = "dag_update"
-    LOG_UPDATE = "log_update"
-    EXECUTION_COMPLETE = "execution_complete"
-    ERROR = "error"
+# Event types streamed to the frontend are the bus's typed events
+EventType = AgentEventType
 
-@dataclass
-class StreamEvent:
-    event_type: EventType
-    data: Dict[str, Any]
-    timestamp: float
+class SessionAdmission:
+    """Global cap on concurrently executing sessions with a FIFO waiting line"""
+    def __init__(self, max_sessions: int):
+        self.max_sessions = max_sessions
+        self.active = 0
+        self.waiting = deque()  # Tickets (futures) of queued sessions, oldest first
+        self._changed = asyncio.Event()
 
-class StreamOutputCapture:
-    """Capture stdout and emit clean events to frontend"""
-    def __init__(self, event_callback):
-        self.event_callback = event_callback
-        self.buffer = []
-        self.original_stdout = sys.stdout
-        
-    def write(self, text):
-        # Write to original stdout (keep console output)
-        self.original_stdout.write(text)
-        self.original_stdout.flush()
-        
-        # Store for streaming processing
-        self.buffer.append(text)
-        
-        # Process line by line for streaming
-        if '\n' in text:
-            lines = ''.join(self.buffer).split('\n')
-            self.buffer = [lines[-1]]  # Keep incomplete line
-            
-            for line in lines[:-1]:
-                if line.strip():  # Only process non-empty lines
-                    asyncio.create_task(self._process_line(line.strip()))
-    
-    def flush(self):
-        self.original_stdout.flush()
-        
-    def clean_output(self, text: str) -> str:
-        """Remove ANSI color codes, emojis and replace with clean text for frontend"""
-        # Remove ANSI color codes and escape sequences
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        cleaned = ansi_escape.sub('', text)
-        
-        # Remove additional ANSI codes that might be missed
-        cleaned = re.sub(r'\[[\d;]*[mK]', '', cleaned)
-        
-        # Replace common emojis with text equivalents
-        emoji_replacements = {
-            '🟢': '>>',
-            '💬': '',
-            '📦': '',
-            '✅': 'COMPLETED',
-            '🚀': '>>',
-            '⚙️': '',
-            '🔧': '',
-            '🚨': 'ALERT',
-            '❌': 'ERROR',
-            '⚠️': 'WARNING',
-            '📄': '',
-            '📊': '',
-            '🔥': '>>',
-            '📸': '>>',
-            '🔍': '>>',
-            '💡': '>>',
-        }
-        
-        for emoji, replacement in emoji_replacements.items():
-            cleaned = cleaned.replace(emoji, replacement)
-            
-        # Remove any remaining emojis and non-ASCII characters
-        cleaned = re.sub(r'[^\x00-\x7F\s]+', '', cleaned)
+    def enqueue(self) -> asyncio.Future:
+        """Return a ticket that resolves once the session may start"""
+        ticket = asyncio.get_running_loop().create_future()
+        if self.active < self.max_sessions and not self.waiting:
+            self.active += 1
+            ticket.set_result(True)
+        else:
+            self.waiting.append(ticket)
+        return ticket
+
+    def position(self, ticket: asyncio.Future) -> int:
+        """1-based position in the waiting line (0 once admitted)"""
+        return self.waiting.index(ticket) + 1 if ticket in self.waiting else 0
+
+    async def wait_for_change(self, ticket: asyncio.Future):
+        """Block until this ticket is admitted or the line moves"""
+        changed = asyncio.ensure_future(self._changed.wait())
+        try:
+            await asyncio.wait({ticket, changed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            changed.cancel()
+
+    def leave(self, ticket: asyncio.Future):
+        """Release an admitted ticket (or drop a waiting one) and admit the next in line"""
+        if ticket in self.waiting:
+            self.waiting.remove(ticket)
+            ticket.cancel()
+        elif ticket.done() and not ticket.cancelled():
+            self.active -= 1
         
-        # Clean up extra spaces and return clean text
-        cleaned = ' '.join(cleaned.split())
+        while self.waiting and self.active < self.max_sessions:
+            self.active += 1
+            self.waiting.popleft().set_result(True)
         
-        return cleaned.strip()
-    
-    async def _process_line(self, line: str):
-        """Process a line and emit streaming events"""
-        try:
-            # Clean the line for frontend
-            clean_line = self.clean_output(line)
-            
-            # Skip if line is empty after cleaning
-            if not clean_line or len(clean_line.strip()) == 0:
-                return
-            
-            # Skip lines that are just whitespace or punctuation
-            if re.match(r'^[\s\-=_.*]+$', clean_line):
-                return
-                
-            # Skip lines with just symbols or minimal content
-            if len(clean_line.replace(' ', '')) < 3:
-                return
-            
-            # Detect agent execution
-            if 'Agent' in clean_line and ('(text only)' in clean_line or '(code)' in clean_line):
-                agent_match = re.search(r'(\w+Agent)', clean_line)
-                if agent_match:
-                    await self.event_callback('agent_executing', {
-                        'agent': agent_match.group(1),
-                        'message': clean_line
-                    })
-                    return
-            
-            # Detect task completion
-            if 'completed' in clean_line and re.search(r'T\d+', clean_line):
-                task_match = re.search(r'(T\d+)', clean_line)
-                if task_match:
-                    await self.event_callback('task_completed', {
-                        'task': task_match.group(1),
-                        'message': clean_line
-                    })
-                    return
-            
-            # Detect batch execution
-            if 'Executing batch:' in clean_line:
-                await self.event_callback('batch_start', {
-                    'message': clean_line
-                })
-                return
-            
-            # Skip debug/verbose messages that don't add value
-            skip_patterns = [
-                r'^Processing\s*$',
-                r'^Loading\s*$',
-                r'^Starting\s*$',
-                r'^Initializing\s*$',
-                r'^\s*\.\s*$',
-                r'^\s*-+\s*$',
-                r'^\s*=+\s*$',
-            ]
-            
-            for pattern in skip_patterns:
-                if re.match(pattern, clean_line, re.IGNORECASE):
-                    return
-            
-            # General log message - only if it has meaningful content
-            if clean_line and len(clean_line.strip()) >= 5:
-                await self.event_callback('log_update', {
-                    'message': clean_line,
-                    'level': 'info'
-                })
-                
-        except Exception as e:
-            print(f"Error processing line: {e}")
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+def format_sse(event: AgentEvent) -> str:
+    """SSE frame; events of recorded sessions carry an id line for Last-Event-ID resumption"""
+    id_line = f"id: {event.id}\n" if event.id is not None else ""
+    return f"{id_line}data: {json.dumps(event.to_dict())}\n\n"
+
+def parse_sse(frame: str) -> Dict[str, Any]:
+    """Event dict from an SSE frame produced by format_sse"""
+    for line in frame.splitlines():
+        if line.startswith("data: "):
+            return json.loads(line[len("data: "):])
+    return {}
+
+@dataclass
+class SessionState:
+    """Per-request execution state: own lifecycle task, independent of any client connection"""
+    session_id: str
+    task: Optional[asyncio.Task] = None
+    created_at: float = field(default_factory=time.time)
+
+    def publish(self, event_type: AgentEventType, data: Dict[str, Any]):
+        event_bus.publish(event_type, data, self.session_id)
 
 class AgentStreamService:
     def __init__(self):
         self.multi_mcp = None
         self.agent_loop = None
         self.initialized = False
-        self.active_callbacks = []
+        self.sessions: Dict[str, SessionState] = {}  # Running + queued sessions by session_id
+        self.admission = None
+        self.event_stream_config = load_profile_section("event_stream", {
+            "max_events": 1000,
+            "max_progress_events": 100,
+            "history_size": 2000,
+            "persist_events": True,
+            "remote_poll_interval_seconds": 0.5,
+            "remote_idle_timeout_seconds": 600
+        })
+        self.subscription_limits = {
+            "max_events": self.event_stream_config["max_events"],
+            "max_progress_events": self.event_stream_config["max_progress_events"]
+        }
 
     async def initialize(self):
         """Initialize the agent service"""
@@ -186,13 +120,17 @@ class AgentStreamService:
         try:
             load_dotenv()
             
+            # Per-session log sinks are routed through contextvars, not per-request stdout swaps
+            install_stdout_router()
+            
             # Load server configs and initialize MultiMCP
             server_configs = self.load_server_configs()
             self.multi_mcp = MultiMCP(server_configs)
             await self.multi_mcp.initialize()
             
-            # Initialize AgentLoop4
+            # Initialize AgentLoop4 (shared - all per-run state lives in the session's context)
             self.agent_loop = AgentLoop4(self.multi_mcp)
+            self.admission = SessionAdmission(self.agent_loop.execution_config["max_concurrent_sessions"])
             self.initialized = True
             print("Agent service initialized successfully")
             
@@ -213,16 +151,30 @@ class AgentStreamService:
         
         return config.get("mcp_servers", [])
 
-    async def stream_callback(self, event_type: str, data: Dict[str, Any]):
-        """Callback for streaming events"""
-        for callback in self.active_callbacks:
-            try:
-                await callback(event_type, data)
-            except:
-                pass  # Remove failed callbacks later
+    def get_sessions_status(self) -> Dict[str, Any]:
+        """Running/queued session counts for the admission queue"""
+        return {
+            "max_concurrent_sessions": self.admission.max_sessions if self.admission else None,
+            "active_sessions": self.admission.active if self.admission else 0,
+            "queued_sessions": len(self.admission.waiting) if self.admission else 0,
+            "session_ids": list(self.sessions),
+            "event_queues": {
+                session_id: [subscription.get_metrics() for subscription in event_bus.get_subscriptions(session_id)]
+                for session_id in self.sessions
+            },
+            "event_writer": event_writer.get_metrics(),
+            "worker_id": WORKER_ID,
+            "cluster_sessions": get_shared_store().list_sessions()
+        }
+
+    def has_session_events(self, session_id: str) -> bool:
+        """Events are replayable here: recorded in this process or, from any worker, in the shared store"""
+        if event_bus.get_history(session_id) is not None:
+            return True
+        return self.event_stream_config["persist_events"] and get_shared_store().get_session(session_id) is not None
 
-    async def process_query_stream(self, query: str, uploaded_files: list = None, file_manifest: list = None) -> AsyncGenerator[str, None]:
-        """Process query and yield clean streaming events"""
+    async def process_query_stream(self, query: str, uploaded_files: list = None, file_manifest: list = None, resume_session_id: str = None) -> AsyncGenerator[str, None]:
+        """Process query (or resume an interrupted session) and yield clean streaming events"""
         if not self.initialized:
             await self.initialize()
         
@@ -230,130 +182,184 @@ class AgentStreamService:
         uploaded_files = uploaded_files or []
         file_manifest = file_manifest or []
         
-        # Stream queue for this request
-        event_queue = asyncio.Queue()
+        session_id = resume_session_id or generate_session_id()
+        shared_session = get_shared_store().get_session(session_id) if resume_session_id else None
+        running_elsewhere = (shared_session and shared_session["worker_id"] != WORKER_ID and
+                             shared_session["status"] not in SESSION_TERMINAL_STATUSES)
+        if session_id in self.sessions or running_elsewhere:
+            error_event = {
+                "type": "error",
+                "data": {"error": f"Session {session_id} is already running"},
+                "timestamp": time.time()
+            }
+            yield f"data: {json.dumps(error_event)}\n\n"
+            return
         
-        async def queue_callback(event_type: str, data: Dict[str, Any]):
-            await event_queue.put({
-                'type': event_type,
-                'data': data,
-                'timestamp': time.time()
-            })
+        # Open the history and subscribe before anything can publish, so every event is numbered and seen
+        event_bus.open_history(session_id, self.event_stream_config["history_size"],
+                               get_shared_store() if self.event_stream_config["persist_events"] else None)
+        subscription = event_bus.subscribe(session_id, **self.subscription_limits)
+        session = SessionState(session_id)
+        self.sessions[session_id] = session
+        session.publish(AgentEventType.PROCESSING_START, {"message": "Starting agent processing"})
         
-        self.active_callbacks.append(queue_callback)
+        # The session runs to completion even if this client disconnects; it can reattach via stream_session_events
+        session.task = asyncio.create_task(
+            self._run_session_lifecycle(session, query, file_manifest, uploaded_files, resume_session_id)
+        )
         
-        try:
-            # Yield start event
-            start_event = {
-                "type": "processing_start",
-                "data": {"message": "Starting agent processing"},
-                "timestamp": time.time()
-            }
-            yield f"data: {json.dumps(start_event)}\n\n"
+        async for frame in self._stream_subscription(session_id, subscription):
+            yield frame
+
+    async def stream_session_events(self, session_id: str, last_event_id: int = 0) -> AsyncGenerator[str, None]:
+        """Replay a session's events after last_event_id, then tail it live until it finishes"""
+        history = event_bus.get_history(session_id)
+        if history is None:
+            # Running on another worker, or finished before this process started / aged out of memory
+            async for frame in self._tail_shared_events(session_id, last_event_id):
+                yield frame
+            return
+        
+        # No await between snapshot and subscribe, so no event can fall into the gap
+        subscription = event_bus.subscribe(session_id, **self.subscription_limits)
+        replay = history.since(last_event_id)
+        if history.closed:
+            subscription.end()
+        
+        async for frame in self._stream_subscription(session_id, subscription, replay):
+            yield frame
+
+    async def _tail_shared_events(self, session_id: str, last_event_id: int = 0) -> AsyncGenerator[str, None]:
+        """Replay persisted events, then poll the shared store until the owning worker finishes the session"""
+        if not self.event_stream_config["persist_events"]:
+            return
+        store = get_shared_store()
+        last_activity = time.time()
+        while True:
+            # Status first: once terminal, the read below is guaranteed to include the final events
+            session = store.get_session(session_id)
+            events = EventHistory.read_store(store, session_id, last_event_id)
+            for event in events:
+                yield format_sse(event)
+            if events:
+                last_event_id = events[-1].id
+                last_activity = time.time()
             
-            # Start processing in background
-            process_task = asyncio.create_task(
-                self._process_with_stream_capture(query, file_manifest, uploaded_files, queue_callback)
-            )
+            if session is None or session["status"] in SESSION_TERMINAL_STATUSES:
+                return
+            if time.time() - last_activity > self.event_stream_config["remote_idle_timeout_seconds"]:
+                log_error(f"Session {session_id} on {session['worker_id']} went silent, ending stream")
+                return
+            await asyncio.sleep(self.event_stream_config["remote_poll_interval_seconds"])
+
+    async def _stream_subscription(self, session_id: str, subscription: Subscription, replay: list = None) -> AsyncGenerator[str, None]:
+        """SSE frames for replayed events, then live ones until the session ends"""
+        try:
+            for event in replay or []:
+                yield format_sse(event)
             
-            # Stream events as they come
-            while not process_task.done():
-                try:
-                    # Wait for either an event or task completion
-                    event = await asyncio.wait_for(event_queue.get(), timeout=0.1)
-                    yield f"data: {json.dumps(event)}\n\n"
-                except asyncio.TimeoutError:
-                    continue
-                except Exception as e:
-                    print(f"Stream error: {e}")
-                    break
+            # Iteration blocks until the next event and ends once the session is done and the queue drained
+            async for event in subscription:
+                yield format_sse(event)
             
-            # Get remaining events
-            try:
-                while True:
-                    event = event_queue.get_nowait()
-                    yield f"data: {json.dumps(event)}\n\n"
-            except asyncio.QueueEmpty:
-                pass
+            if subscription.overflowed:
+                log_error(f"Event stream overflow for session {session_id}, client must reconnect with Last-Event-ID")
+        finally:
+            metrics = subscription.get_metrics()
+            if metrics["dropped"] or metrics["coalesced"]:
+                log_step(f"Session {session_id} event queue: {metrics['dropped']} dropped, "
+                         f"{metrics['coalesced']} coalesced, max depth {metrics['max_depth']}", symbol="📡")
+            subscription.close()
+
+    async def _run_session_lifecycle(self, session: SessionState, query: str, file_manifest: list, uploaded_files: list, resume_session_id: str = None):
+        """Admission, execution and final event of one session"""
+        store = get_shared_store()
+        ticket = self.admission.enqueue()
+        status = "failed"
+        try:
+            # Shared-store writes run off the loop: busy_timeout can hold them for seconds under contention
+            await asyncio.to_thread(store.upsert_session, session.session_id, "queued")
             
-            # Get final result
-            try:
-                result = await process_task
-                completion_event = {
-                    "type": "execution_complete",
-                    "data": result,
-                    "timestamp": time.time()
-                }
-                yield f"data: {json.dumps(completion_event)}\n\n"
-            except Exception as e:
-                error_event = {
-                    "type": "error",
-                    "data": {"error": str(e)},
-                    "timestamp": time.time()
-                }
-                yield f"data: {json.dumps(error_event)}\n\n"
+            # Wait for a free session slot, reporting our place in line
+            while not ticket.done():
+                session.publish(AgentEventType.QUEUED, {
+                    "message": "Waiting for a free session slot",
+                    "position": self.admission.position(ticket),
+                    "active_sessions": self.admission.active
+                })
+                await self.admission.wait_for_change(ticket)
             
+            await asyncio.to_thread(store.upsert_session, session.session_id, "running")
+            result = await self._run_session(session, query, file_manifest, uploaded_files, resume_session_id)
+            session.publish(AgentEventType.EXECUTION_COMPLETE, result)
+            status = "completed" if result.get("success") else "failed"
+        except asyncio.CancelledError:
+            status = "aborted"
+            session.publish(AgentEventType.ERROR, {"error": "Processing aborted", "aborted": True})
+            raise
         except Exception as e:
-            print(f"Process query stream error: {e}")
+            print(f"Session lifecycle error: {e}")
             traceback.print_exc()
-            error_event = {
-                "type": "error",
-                "data": {"error": str(e)},
-                "timestamp": time.time()
-            }
-            yield f"data: {json.dumps(error_event)}\n\n"
+            session.publish(AgentEventType.ERROR, {"error": str(e)})
         finally:
-            # Clean up
-            if queue_callback in self.active_callbacks:
-                self.active_callbacks.remove(queue_callback)
+            self.admission.leave(ticket)
+            self.sessions.pop(session.session_id, None)
+            event_bus.close_history(session.session_id)
+            # Last, so remote tails see every event before the terminal status
+            if not await event_writer.aflush(timeout=5.0):
+                log_error(f"Session {session.session_id}: events still being persisted when it finished")
+            await asyncio.to_thread(store.upsert_session, session.session_id, status)
+
+    async def process_resume_stream(self, session_id: str) -> AsyncGenerator[str, None]:
+        """Resume a checkpointed session and yield the same streaming events as a new query"""
+        async for event in self.process_query_stream(None, resume_session_id=session_id):
+            yield event
 
     async def process_query_stream_return_context(self, query: str):
         """Process query and return execution context for session ID extraction"""
         execution_context = await self.agent_loop.run(query, [], [])
         return execution_context
 
-    async def _process_with_stream_capture(self, query: str, file_manifest: list, uploaded_files: list, callback):
-        """Process query with streaming output capture"""
+    async def _run_session(self, session: SessionState, query: str, file_manifest: list, uploaded_files: list, resume_session_id: str = None):
+        """Run the pipeline; progress reaches the client as typed events published on the bus"""
+        callback = session.publish
         try:
-            # Setup output capture
-            output_capture = StreamOutputCapture(callback)
-            
             # Emit processing start
-            await callback('log_update', {
+            callback(AgentEventType.LOG_UPDATE, {
                 'message': 'Processing with AgentLoop4',
                 'level': 'info'
             })
             
-            # Redirect stdout to capture agent output
-            original_stdout = sys.stdout
-            try:
-                sys.stdout = output_capture
-                
-                # Run the agent loop
-                execution_context = await self.agent_loop.run(query, file_manifest, uploaded_files)
-                
-            finally:
-                # Restore stdout
-                sys.stdout = original_stdout
+            if resume_session_id:
+                execution_context = await self.agent_loop.resume(resume_session_id)
+            else:
+                execution_context = await self.agent_loop.run(query, file_manifest, uploaded_files,
+                                                              session_id=session.session_id)
             
             # Analyze results
-            await callback('log_update', {
+            callback(AgentEventType.LOG_UPDATE, {
                 'message': 'Analyzing results',
                 'level': 'info'
             })
             
             analysis_output = io.StringIO()
-            original_stdout = sys.stdout
-            try:
-                sys.stdout = analysis_output
+            with session_log_sink(analysis_output, echo=False):
                 analyze_results(execution_context)
-            finally:
-                sys.stdout = original_stdout
             
             analysis_result = analysis_output.getvalue()
             
+            # SIP sessions leave their report's inputs as JSON so fund recommendations can skip the HTML
+            session_id = execution_context.plan_graph.graph['session_id']
+            try:
+                sidecar = write_sip_report_sidecar(session_id, execution_context.plan_graph.graph['output_chain'])
+                if sidecar:
+                    log_step(f"Report data written: {sidecar}", symbol="🧾")
+            except OSError as e:
+                log_error(f"Could not write report data for {session_id}: {e}")
+            
             return {
                 "success": True,
+                "session_id": execution_context.plan_graph.graph['session_id'],
                 "message": "Query processed successfully",
                 "analysis_summary": analysis_result[:500] + "..." if len(analysis_result) > 500 else analysis_result
             }
@@ -361,7 +367,7 @@ class AgentStreamService:
         except Exception as e:
             print(f"Process error: {e}")
             traceback.print_exc()
-            await callback('error', {
+            callback(AgentEventType.ERROR, {
                 'error': str(e),
                 'message': 'Failed to process query'
             })
@@ -371,11 +377,30 @@ class AgentStreamService:
                 "message": "Failed to process query"
             }
 
+    async def abort_current_process(self, session_id: str = None, timeout: float = 10.0) -> Dict[str, int]:
+        """Cancel one session's (or every running session's) task tree and wait at most `timeout`s for it to unwind"""
+        sessions = [self.sessions[session_id]] if session_id in self.sessions else \
+                   ([] if session_id else list(self.sessions.values()))
+        tasks = [session.task for session in sessions if session.task and not session.task.done()]
+        for task in tasks:
+            task.cancel()
+        
+        still_running = 0
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            still_running = len(pending)
+            if still_running:
+                log_error(f"{still_running} task(s) did not stop within {timeout}s of abort")
+        
+        print(f"Aborted {len(tasks)} running process(es)")
+        return {"aborted": len(tasks), "still_running": still_running}
+
     async def shutdown(self):
         """Shutdown the agent service"""
         try:
             if self.multi_mcp:
                 await self.multi_mcp.shutdown()
+            await event_writer.aflush(timeout=5.0)
             self.initialized = False
             print("Agent service shutdown successfully")
         except Exception as e:
@@ -0,0 +1,123 @@
+"""
+Micro-benchmark: per-call ModelManager + client construction vs the shared ModelClientRegistry
+
+Starts a local stub that answers Gemini generateContent and Ollama /api/generate
+requests instantly, so the measured time is client overhead only: config parsing,
+client construction and new TCP connections. "per-call" builds a fresh registry
+for every request (what constructing ModelManager per agent call used to cost);
+"pooled" reuses the process-wide one.
+
+Usage (from my-app/):
+    python benchmarks/bench_model_clients.py
+    python benchmarks/bench_model_clients.py --calls 500 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+# Add parent directory to path so we can import modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from agentLoop.model_manager import ModelClientRegistry, ModelManager, PROFILE_YAML
+
+class StubServer:
+    """Instant Gemini/Ollama responses; counts distinct client connections"""
+
+    def __init__(self):
+        self.connections = set()
+        app = web.Application()
+        app.router.add_post("/api/generate", self.ollama_generate)
+        app.router.add_post("/{version}/models/{model}:generateContent", self.gemini_generate)
+        self.runner = web.AppRunner(app, access_log=None)
+
+    def _track(self, request):
+        self.connections.add(request.transport.get_extra_info("peername"))
+
+    async def ollama_generate(self, request):
+        self._track(request)
+        await request.read()
+        return web.json_response({"response": "ok"})
+
+    async def gemini_generate(self, request):
+        self._track(request)
+        await request.read()
+        return web.json_response({"candidates": [{"content": {"role": "model", "parts": [{"text": "ok"}]}}]})
+
+    async def start(self) -> int:
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+def write_stub_config(directory: Path, port: int) -> Path:
+    models = {
+        "defaults": {"text_generation": "stub-gemini"},
+        "models": {
+            "stub-gemini": {"type": "gemini", "model": "gemini-stub", "api_key_env": "GEMINI_API_KEY",
+                            "base_url": f"http://127.0.0.1:{port}"},
+            "stub-ollama": {"type": "ollama", "model": "stub",
+                            "url": {"generate": f"http://127.0.0.1:{port}/api/generate"}}
+        }
+    }
+    models_path = directory / "models.json"
+    models_path.write_text(json.dumps(models))
+    return models_path
+
+async def run_calls(model_key: str, calls: int, concurrency: int, registry_factory) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_call():
+        async with semaphore:
+            start = time.perf_counter()
+            registry, owned = registry_factory()
+            await ModelManager(model_key, clients=registry).generate_text("ping")
+            latencies.append((time.perf_counter() - start) * 1000)
+            if owned:
+                await registry.aclose()
+
+    await asyncio.gather(*(one_call() for _ in range(calls)))
+    return latencies
+
+async def run_benchmark(args):
+    os.environ.setdefault("GEMINI_API_KEY", "stub-key")
+    stub = StubServer()
+    port = await stub.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        models_path = write_stub_config(Path(tmp), port)
+        shared = ModelClientRegistry(models_path, PROFILE_YAML)
+        modes = {
+            "per-call": lambda: (ModelClientRegistry(models_path, PROFILE_YAML), True),
+            "pooled": lambda: (shared, False)
+        }
+
+        print(f"{args.calls} calls per run, concurrency {args.concurrency}, stub on port {port} "
+              f"(http2 {'on' if shared.http2_enabled else 'off - install h2'})\n")
+        print(f"{'model':<12} {'mode':<9} {'mean (ms)':>10} {'p50 (ms)':>9} {'p95 (ms)':>9} {'connections':>12}")
+        for model_key in ("stub-gemini", "stub-ollama"):
+            for mode, factory in modes.items():
+                await run_calls(model_key, min(args.calls, 10), args.concurrency, factory)  # Warm-up
+                stub.connections.clear()
+                latencies = sorted(await run_calls(model_key, args.calls, args.concurrency, factory))
+                print(f"{model_key:<12} {mode:<9} {statistics.mean(latencies):>10.2f} "
+                      f"{statistics.median(latencies):>9.2f} {latencies[int(len(latencies) * 0.95) - 1]:>9.2f} "
+                      f"{len(stub.connections):>12}")
+        await shared.aclose()
+
+    await stub.runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-call model client construction vs pooled clients")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1, help="calls in flight at once")
+    asyncio.run(run_benchmark(parser.parse_args()))
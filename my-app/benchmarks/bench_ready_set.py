@@ -0,0 +1,101 @@
+"""
+Micro-benchmark: incremental ready-set tracking vs. full topological sort per tick
+
+Usage (from my-app/):
+    python benchmarks/bench_ready_set.py
+    python benchmarks/bench_ready_set.py --sizes 1000 10000 --width 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+import networkx as nx
+
+# Add parent directory to path so we can import modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from agentLoop.contextManager import ExecutionContextManager
+
+def build_synthetic_plan_graph(num_nodes: int, width: int, fan_in: int = 3, seed: int = 7) -> nx.DiGraph:
+    """Layered DAG shaped like a wide planner output: each node reads 1..fan_in nodes of the previous layer"""
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    graph.graph.update({'session_id': 'bench', 'original_query': 'bench', 'file_manifest': [],
+                        'created_at': '', 'status': 'running', 'output_chain': {}})
+    graph.add_node("ROOT", description="Initial Query", agent="System", status='completed')
+
+    previous_layer = ["ROOT"]
+    for start in range(0, num_nodes, width):
+        layer = []
+        for i in range(start, min(start + width, num_nodes)):
+            node_id = f"T{i:05d}"
+            graph.add_node(node_id, agent="ThinkerAgent", description=node_id, reads=[], writes=[],
+                           status='pending', output=None, error=None, cost=0.0,
+                           start_time=None, end_time=None, execution_time=0.0, queue_wait_time=0.0)
+            for parent in rng.sample(previous_layer, min(len(previous_layer), rng.randint(1, fan_in))):
+                graph.add_edge(parent, node_id)
+            layer.append(node_id)
+        previous_layer = layer
+    return graph
+
+def legacy_get_ready_steps(graph: nx.DiGraph):
+    """Previous implementation: full topological sort + predecessor scan every tick"""
+    topo_order = list(nx.topological_sort(graph))
+    return [node for node in topo_order
+            if node != "ROOT" and
+            graph.nodes[node]['status'] == 'pending' and
+            all(graph.nodes[pred]['status'] == 'completed'
+                for pred in graph.predecessors(node))]
+
+def legacy_all_done(graph: nx.DiGraph):
+    return all(graph.nodes[node_id]['status'] in ['completed', 'failed']
+               for node_id in graph.nodes if node_id != "ROOT")
+
+async def drain(context: ExecutionContextManager, get_ready, all_done):
+    """Run the graph to completion one wave at a time; returns (ticks, seconds spent in scheduling calls)"""
+    ticks = 0
+    scheduling_time = 0.0
+    while True:
+        t0 = time.perf_counter()
+        finished = all_done()
+        ready = [] if finished else get_ready()
+        scheduling_time += time.perf_counter() - t0
+        if finished or not ready:
+            break
+
+        ticks += 1
+        for step_id in ready:
+            context.mark_running(step_id)
+            await context.mark_done(step_id, {"result": step_id})
+    return ticks, scheduling_time
+
+async def run_benchmark(sizes, width):
+    print(f"{'nodes':>8} {'ticks':>6} {'legacy (s)':>12} {'incremental (s)':>16} {'speedup':>8}")
+    for size in sizes:
+        # Suppress per-step logging so it doesn't dominate the measurement
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy_ctx = ExecutionContextManager.from_graph(build_synthetic_plan_graph(size, width), debug_mode=True)
+            ticks, legacy_time = await drain(
+                legacy_ctx,
+                lambda: legacy_get_ready_steps(legacy_ctx.plan_graph),
+                lambda: legacy_all_done(legacy_ctx.plan_graph)
+            )
+
+            ctx = ExecutionContextManager.from_graph(build_synthetic_plan_graph(size, width), debug_mode=True)
+            _, incremental_time = await drain(ctx, ctx.get_ready_steps, ctx.all_done)
+
+        speedup = legacy_time / incremental_time if incremental_time else float("inf")
+        print(f"{size:>8} {ticks:>6} {legacy_time:>12.4f} {incremental_time:>16.4f} {speedup:>7.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ready-set tracking micro-benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--width", type=int, default=50, help="nodes per layer (plan graph width)")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.sizes, args.width))
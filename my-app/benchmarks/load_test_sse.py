@@ -0,0 +1,133 @@
+"""
+Load test: concurrent SSE replay clients against 1..N uvicorn workers sharing one store
+
+Seeds a synthetic finished session with --events events in the shared store, then
+for each worker count starts `uvicorn fastapi_sip_service:app --workers N`, opens
+--clients concurrent GET /api/sessions/{id}/events streams and reports delivered
+events/s. Every stream is served from the shared store, so any worker can take
+any client and throughput should grow with workers up to the number of cores.
+
+Usage (from my-app/):
+    python benchmarks/load_test_sse.py
+    python benchmarks/load_test_sse.py --workers 1 2 4 8 --clients 400 --events 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+# Add parent directory to path so we can import modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.shared_store import get_shared_store
+
+def seed_session(session_id: str, num_events: int):
+    store = get_shared_store()
+    clear_session(session_id)
+    now = time.time()
+    store.append_events([
+        (session_id, event_id, "node_completed",
+         json.dumps({"step_id": f"T{event_id:03d}", "agent": "RetrieverAgent",
+                     "message": f"Step T{event_id:03d} completed", "execution_time": 1.5}), now)
+        for event_id in range(1, num_events + 1)
+    ])
+    store.upsert_session(session_id, "completed", "load-test")
+
+def clear_session(session_id: str):
+    store = get_shared_store()
+    store.conn.execute("DELETE FROM session_events WHERE session_id = ?", (session_id,))
+    store.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fastapi_sip_service:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=Path(__file__).parent.parent, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+async def wait_until_ready(base_url: str, timeout: float):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                if (await client.get(f"{base_url}/api/rate-limits", timeout=2)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"Server at {base_url} not ready after {timeout}s")
+
+async def stream_client(client: httpx.AsyncClient, url: str) -> tuple:
+    """(events received, seconds) for one full replay"""
+    start = time.perf_counter()
+    received = 0
+    async with client.stream("GET", url) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("id: "):
+                received += 1
+    return received, time.perf_counter() - start
+
+async def run_round(base_url: str, session_id: str, clients: int) -> dict:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+        url = f"{base_url}/api/sessions/{session_id}/events"
+        start = time.perf_counter()
+        results = await asyncio.gather(*(stream_client(client, url) for _ in range(clients)))
+        wall = time.perf_counter() - start
+
+    durations = sorted(seconds for _, seconds in results)
+    total_events = sum(received for received, _ in results)
+    return {
+        "wall": wall,
+        "events": total_events,
+        "events_per_s": total_events / wall,
+        "p50": statistics.median(durations),
+        "p95": durations[int(len(durations) * 0.95) - 1]
+    }
+
+async def run_load_test(args):
+    session_id = f"loadtest-{os.getpid()}"
+    seed_session(session_id, args.events)
+    print(f"Seeded {session_id} with {args.events} events; {args.clients} concurrent replay clients per run "
+          f"({os.cpu_count()} CPU cores)\n")
+    print(f"{'workers':>7} {'wall (s)':>9} {'events/s':>10} {'speedup':>8} {'p50 (s)':>8} {'p95 (s)':>8}")
+
+    baseline = None
+    try:
+        for workers in args.workers:
+            server = start_server(workers, args.port)
+            try:
+                base_url = f"http://127.0.0.1:{args.port}"
+                await wait_until_ready(base_url, args.startup_timeout)
+                await run_round(base_url, session_id, min(args.clients, 10))  # Warm-up
+                result = await run_round(base_url, session_id, args.clients)
+            finally:
+                server.terminate()
+                server.wait()
+
+            expected = args.clients * args.events
+            if result["events"] != expected:
+                print(f"  ⚠️ received {result['events']} of {expected} events")
+            baseline = baseline or result["events_per_s"]
+            print(f"{workers:>7} {result['wall']:>9.2f} {result['events_per_s']:>10.0f} "
+                  f"{result['events_per_s'] / baseline:>7.2f}x {result['p50']:>8.2f} {result['p95']:>8.2f}")
+    finally:
+        clear_session(session_id)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent SSE clients vs uvicorn worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=200, help="concurrent SSE clients per run")
+    parser.add_argument("--events", type=int, default=300, help="events replayed to each client")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=120.0,
+                        help="seconds to wait for workers (each starts its MCP servers)")
+    asyncio.run(run_load_test(parser.parse_args()))
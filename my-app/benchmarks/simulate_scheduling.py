@@ -0,0 +1,113 @@
+"""
+Replay recorded session graphs with their recorded node latencies and compare
+DAG makespan under FIFO vs critical-path-first scheduling at a fixed slot count
+
+Usage (from my-app/):
+    python benchmarks/simulate_scheduling.py
+    python benchmarks/simulate_scheduling.py --slots 1 2 3 --limit 100 --oracle
+"""
+
+import argparse
+import asyncio
+import contextlib
+import heapq
+import io
+import sys
+from pathlib import Path
+
+# Add parent directory to path so we can import modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from agentLoop.contextManager import ExecutionContextManager
+from agentLoop.scheduling import load_agent_latencies, compute_node_priorities, order_ready_steps
+from agentLoop.graph_validator import GraphValidator
+from agentLoop.session_serializer import SessionSerializer, SESSION_INDEX_DIR
+
+def load_recorded_sessions(session_dir: Path, limit: int):
+    """Fully completed sessions with a recorded execution_time on every node"""
+    sessions = []
+    for session_file in sorted(Path(session_dir).glob("*/*/*/session_*.json")):
+        try:
+            graph = SessionSerializer.load_session(session_file)
+        except Exception:
+            continue
+        nodes = [n for n in graph.nodes if n != "ROOT"]
+        if len(nodes) < 2 or not all(graph.nodes[n].get("status") == "completed" and
+                                     graph.nodes[n].get("execution_time") for n in nodes):
+            continue
+        sessions.append((session_file.stem, graph))
+        if len(sessions) >= limit:
+            break
+    return sessions
+
+async def simulate(graph, durations, slots, policy, priorities):
+    """Discrete-event replay through the real ready-set tracking; returns makespan in seconds"""
+    graph = graph.copy()
+    for node_id in graph.nodes:
+        if node_id != "ROOT":
+            graph.nodes[node_id].update(status="pending", start_time=None, end_time=None)
+    context = ExecutionContextManager.from_graph(graph, debug_mode=True)
+
+    clock = 0.0
+    running = []  # heap of (finish_time, step_id)
+    while True:
+        for step_id in order_ready_steps(context.get_ready_steps(), priorities, policy):
+            if len(running) >= slots:
+                break
+            context.mark_running(step_id)
+            heapq.heappush(running, (clock + durations[step_id], step_id))
+
+        if not running:
+            return clock
+
+        clock, step_id = heapq.heappop(running)
+        await context.mark_done(step_id)
+
+async def run_simulation(args):
+    sessions = load_recorded_sessions(args.session_dir, args.limit)
+    if not sessions:
+        print(f"No fully completed sessions found under {args.session_dir}")
+        return
+
+    agent_latencies = load_agent_latencies(args.session_dir, max_sessions=10_000)
+    validator = GraphValidator()
+    parallel = sum(1 for _, g in sessions
+                   if validator.compute_remaining_path_lengths(g)["ROOT"] < len(g) - 1)
+    print(f"Replaying {len(sessions)} recorded sessions ({parallel} with parallel branches), "
+          f"priorities from {'recorded node latencies (oracle)' if args.oracle else 'per-agent median latency'}\n")
+    print(f"{'slots':>5} {'FIFO (s)':>10} {'crit-path (s)':>14} {'saved':>7} {'better':>7} {'worse':>6}")
+
+    for slots in args.slots:
+        fifo_total = cp_total = 0.0
+        better = worse = 0
+        for _, graph in sessions:
+            durations = {n: float(graph.nodes[n]["execution_time"]) for n in graph.nodes if n != "ROOT"}
+            if args.oracle:
+                weights = {**durations, "ROOT": 0.0}
+                priorities = validator.compute_remaining_path_lengths(graph, weights)
+            else:
+                priorities = compute_node_priorities(graph, agent_latencies)
+
+            # Suppress per-step logging so replay output stays readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                fifo = await simulate(graph, durations, slots, "fifo", {})
+                cp = await simulate(graph, durations, slots, "critical_path", priorities)
+
+            fifo_total += fifo
+            cp_total += cp
+            better += cp < fifo - 1e-6
+            worse += cp > fifo + 1e-6
+
+        saved = (fifo_total - cp_total) / fifo_total * 100 if fifo_total else 0.0
+        print(f"{slots:>5} {fifo_total / len(sessions):>10.1f} {cp_total / len(sessions):>14.1f} "
+              f"{saved:>6.1f}% {better:>7} {worse:>6}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FIFO vs critical-path scheduling replay")
+    parser.add_argument("--session-dir", type=Path, default=SESSION_INDEX_DIR)
+    parser.add_argument("--slots", type=int, nargs="+", default=[1, 2, 3, 4],
+                        help="concurrent agent slots (e.g. what the rate limit sustains)")
+    parser.add_argument("--limit", type=int, default=500, help="max sessions to replay")
+    parser.add_argument("--oracle", action="store_true",
+                        help="prioritize with each node's actual recorded latency instead of per-agent medians")
+    asyncio.run(run_simulation(parser.parse_args()))
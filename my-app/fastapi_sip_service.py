@@ -5,14 +5,13 @@ from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field, validator
 from typing import Dict, Any, Optional, List, Union
 from datetime import datetime
+import glob
 import json
 import os
 import sys
-import glob
 import re
 from pathlib import Path
 from enum import Enum
-from jinja2 import Environment, FileSystemLoader
 import ast
 import time
 import asyncio
@@ -25,10 +24,26 @@ parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 
 from contextlib import asynccontextmanager
-from agentLoop.model_manager import ModelManager  # Your existing ModelManager
+from agentLoop.model_manager import ModelManager, get_model_clients  # Your existing ModelManager
+from agentLoop.rate_limiter import get_rate_limiter, get_rate_limit_metrics, estimate_tokens
+from agentLoop.session_serializer import SessionSerializer
+from agentLoop.prompt_templates import get_prompt_templates
+from agentLoop.response_cache import get_response_cache
+from agentLoop.usage_tracker import get_usage_tracker
 
 # Import the fixed agent service
-from agent_stream_service import agent_stream_service, EventType
+from agent_stream_service import agent_stream_service, EventType, parse_sse
+from agentLoop.event_bus import publish_event
+from job_service import JobService
+from utils.shared_store import get_shared_store
+from utils.report_registry import get_report_registry
+from utils.report_serving import report_response
+from utils.cache import DiskLRUCache, stable_hash
+from utils.sip_report_data import load_sip_report_data, populate_fund_template, sidecar_path
+from agentLoop.flow import load_profile_section
+
+# Agent runs that outlive the HTTP request (POST /api/jobs)
+job_service = JobService(agent_stream_service)
 
 # Initialize ModelManager for fund recommendation template processing
 try:
@@ -38,6 +53,43 @@ except Exception as e:
     print(f"⚠️ Warning: ModelManager initialization failed: {e}")
     model_manager = None
 
+# Populated fund templates keyed by (SIP report hash, template hash, model); entries on disk are shared by all workers
+FUND_TEMPLATE_CACHE_CONFIG = load_profile_section("fund_template_cache", {
+    "enabled": True,
+    "directory": "memory/fund_template_cache",
+    "max_entries": 100,
+    "ttl_hours": None
+})
+fund_template_cache = DiskLRUCache(
+    FUND_TEMPLATE_CACHE_CONFIG["directory"], max_entries=FUND_TEMPLATE_CACHE_CONFIG["max_entries"],
+    ttl_seconds=FUND_TEMPLATE_CACHE_CONFIG["ttl_hours"] * 3600 if FUND_TEMPLATE_CACHE_CONFIG["ttl_hours"] else None
+)
+
+# Generation of SIP_CONFIG this worker has loaded; bumped in the shared store by /api/reload-config
+config_generation = None
+
+async def watch_shared_config_generation(interval_seconds: float = 5.0):
+    """Reload SIP_CONFIG when /api/reload-config was handled by another worker"""
+    global SIP_CONFIG, config_generation
+    store = get_shared_store()
+    config_generation = store.get_setting("sip_config_generation")
+    while True:
+        await asyncio.sleep(interval_seconds)
+        generation = store.get_setting("sip_config_generation")
+        if generation == config_generation:
+            continue
+        config_generation = generation
+        try:
+            SIP_CONFIG = load_sip_config()
+            create_dynamic_enums()
+            await asyncio.to_thread(get_prompt_templates().reload)
+            get_model_clients().reload()
+            print("🔄 Configuration reloaded (requested on another worker)")
+        except HTTPException as e:
+            print(f"❌ Failed to reload configuration: {e.detail}")
+        except Exception as e:
+            print(f"❌ Failed to reload prompt templates: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan"""
@@ -49,14 +101,39 @@ async def lifespan(app: FastAPI):
         print(f"❌ Failed to initialize agent service: {e}")
         # Don't raise the exception - let the app start even if agent service fails
     
+    # Before the job workers start: the rebuild writes to the shared store and runs are looked up in the registry
+    try:
+        await asyncio.to_thread(get_report_registry().rebuild)
+    except Exception as e:
+        print(f"❌ Failed to build report registry: {e}")
+    
+    try:
+        await job_service.start()
+        print("✅ Job workers started")
+    except Exception as e:
+        print(f"❌ Failed to start job workers: {e}")
+    
+    config_watcher = asyncio.create_task(watch_shared_config_generation())
+    
     yield  # Application runs here
     
     # Shutdown
+    config_watcher.cancel()
+    try:
+        await job_service.shutdown()
+    except Exception as e:
+        print(f"❌ Error stopping job workers: {e}")
+    
     try:
         await agent_stream_service.shutdown()
         print("✅ Agent service shutdown successfully")
     except Exception as e:
         print(f"❌ Error during agent service shutdown: {e}")
+    
+    try:
+        await get_model_clients().aclose()
+    except Exception as e:
+        print(f"❌ Error closing model clients: {e}")
 
 # Create FastAPI app with lifespan
 app = FastAPI(
@@ -224,139 +301,46 @@ def construct_standard_file_path(session_id: str, filename: str) -> str:
 
 def find_latest_report_file_by_session(session_id: str = None) -> Optional[tuple]:
     """Find the most recently generated HTML report, optionally filtered by session ID"""
-    try:
-        if session_id:
-            # Look for specific session files first
-            session_pattern = f"media/generated/{session_id}/comprehensive_report.html"
-            session_files = glob.glob(session_pattern)
-            if session_files:
-                latest_file = max(session_files, key=os.path.getmtime)
-                filename = os.path.basename(latest_file)
-                return filename, latest_file
-        
-        # Fallback to general search
-        media_pattern = "media/generated/*/comprehensive_report.html"
-        html_files = glob.glob(media_pattern)
-        
-        if not html_files:
-            # Also try without media prefix in case of different structure
-            alt_pattern = "*/comprehensive_report.html"
-            html_files = glob.glob(alt_pattern)
-        
-        if not html_files:
-            return None
-        
-        # Get the most recently modified file
-        latest_file = max(html_files, key=os.path.getmtime)
-        filename = os.path.basename(latest_file)
-        
-        return filename, latest_file
-    except Exception as e:
-        print(f"Error finding report file: {e}")
-        return None
+    registry = get_report_registry()
+    entry = None
+    if session_id:
+        entry = registry.latest(session_id, filenames=("comprehensive_report.html",))
+    
+    # Fallback to the newest report of any session
+    entry = entry or registry.latest(filenames=("comprehensive_report.html",))
+    return (entry.filename, entry.path) if entry else None
 
-# def find_latest_fund_recommendation_file_by_session(session_id: str = None) -> Optional[tuple]:
-#     """Find the most recently generated fund recommendation HTML report with enhanced search"""
-#     try:
-#         patterns = []
-        
-#         if session_id:
-#             # Look for specific session files first with multiple possible names
-#             patterns.extend([
-#                 f"media/generated/{session_id}/fund_comprehensive_report.html",
-#                 f"media/generated/{session_id}/fund_recommendation_report.html",
-#                 f"media/generated/{session_id}/fund_recommendations.html",
-#                 f"media/generated/{session_id}/fund_recommendation*.html",
-#                 f"media/generated/{session_id}/*fund*.html",
-#                 f"media/generated/{session_id}/*recommendation*.html"
-#             ])
-        
-#         # General patterns
-#         patterns.extend([
-#             "media/generated/*/fund_comprehensive_report.html",
-#             "media/generated/*/fund_recommendation_report.html",
-#             "media/generated/*/fund_recommendations.html", 
-#             "media/generated/*/*fund*.html",
-#             "media/generated/*/*recommendation*.html",
-#             "*/fund_recommendation*.html"
-#         ])
-        
-#         html_files = []
-#         for pattern in patterns:
-#             html_files.extend(glob.glob(pattern))
-        
-#         # Remove duplicates while preserving order
-#         html_files = list(dict.fromkeys(html_files))
-        
-#         if not html_files:
-#             return None
-        
-#         # Get the most recently modified file
-#         latest_file = max(html_files, key=os.path.getmtime)
-#         filename = os.path.basename(latest_file)
-        
-#         print(f"Found fund recommendation file: {latest_file}")
-#         return filename, latest_file
-#     except Exception as e:
-#         print(f"Error finding fund recommendation file: {e}")
-#         return None
+# Fund reports: the fund_* names plus comprehensive_report.html, which the fund pipeline also writes
+FUND_REPORT_FILENAMES = ("fund_comprehensive_report.html", "fund_recommendation_report.html",
+                         "fund_recommendations.html", "comprehensive_report.html")
+
+# Any other fund report name, for reports written without going through a registering writer
+FUND_REPORT_GLOBS = ("*fund*.html", "*recommendation*.html")
 
 def find_latest_fund_recommendation_file_by_session(session_id: str = None) -> Optional[tuple]:
-    """Find the most recently generated fund recommendation HTML report with enhanced search"""
-    try:
-        patterns = []
-        
+    """Find the most recently generated fund recommendation HTML report"""
+    registry = get_report_registry()
+    
+    def lookup():
+        entry = None
         if session_id:
-            # Look for specific session files first - prioritize fund_comprehensive_report.html
-            patterns.extend([
-                f"media/generated/{session_id}/fund_comprehensive_report.html",  # Primary target
-                f"media/generated/{session_id}/fund_recommendation_report.html",
-                f"media/generated/{session_id}/fund_recommendations.html",
-                f"media/generated/{session_id}/comprehensive_report.html",  # Fallback
-                f"media/generated/{session_id}/fund_recommendation*.html",
-                f"media/generated/{session_id}/*fund*.html",
-                f"media/generated/{session_id}/*recommendation*.html"
-            ])
-        
-        # General patterns - prioritize fund_comprehensive_report.html
-        patterns.extend([
-            "media/generated/*/fund_comprehensive_report.html",  # Primary target
-            "media/generated/*/fund_recommendation_report.html",
-            "media/generated/*/fund_recommendations.html", 
-            "media/generated/*/comprehensive_report.html",  # Fallback
-            "media/generated/*/*fund*.html",
-            "media/generated/*/*recommendation*.html",
-            "*/fund_comprehensive_report.html",  # Alternative path structure
-            "*/fund_recommendation*.html"
-        ])
-        
-        html_files = []
-        for pattern in patterns:
-            found_files = glob.glob(pattern)
-            html_files.extend(found_files)
-        
-        # Remove duplicates while preserving order
-        html_files = list(dict.fromkeys(html_files))
-        
-        if not html_files:
-            print("No fund recommendation files found with any pattern")
-            return None
-        
-        # Prioritize fund_comprehensive_report.html files
-        priority_files = [f for f in html_files if "fund_comprehensive_report.html" in f]
-        if priority_files:
-            html_files = priority_files + [f for f in html_files if f not in priority_files]
-        
-        # Get the most recently modified file
-        latest_file = max(html_files, key=os.path.getmtime)
-        filename = os.path.basename(latest_file)
-        
-        print(f"Found fund recommendation file: {latest_file}")
-        return filename, latest_file
-        
-    except Exception as e:
-        print(f"Error finding fund recommendation file: {e}")
+            entry = registry.latest(session_id, filenames=FUND_REPORT_FILENAMES, report_types=("fund_recommendation",))
+        return entry or registry.latest(filenames=FUND_REPORT_FILENAMES, report_types=("fund_recommendation",))
+    
+    entry = lookup()
+    # Same fallback order as the lookup: this session's directory first, then every session
+    for scope in ((session_id, None) if session_id else (None,)):
+        if entry:
+            break
+        if registry.discover(FUND_REPORT_GLOBS, scope):
+            entry = lookup()
+    
+    if not entry:
+        print("No fund recommendation files found in the report registry")
         return None
+    
+    print(f"Found fund recommendation file: {entry.path}")
+    return entry.filename, entry.path
 
 # Pydantic models for request/response
 class FormDataBase(BaseModel):
@@ -463,25 +447,24 @@ def calculate_time_horizon(form_data: Dict[str, Any]) -> int:
     
     return 10  # default
 
-def load_orchestrator_template():
-    """Load agent config and orchestrator template from file"""    
-    # Set template path
-    template_path = Path("prompts/orchestrator_agent/SIP_Orchestrator_Prompt_Template_patched_v3.txt")
-    
-    try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            orchestrator_template = f.read()
-        
-        return orchestrator_template
-        
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail=f"Orchestrator template not found: {template_path}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error reading orchestrator template: {e}")
+# Form fields every SIP orchestrator render needs; the goal-specific ones are only read inside {% if %} blocks
+SIP_ORCHESTRATOR_TEMPLATE = Path("prompts/orchestrator_agent/SIP_Orchestrator_Prompt_Template_patched_v4.txt")
+SIP_ORCHESTRATOR_VARIABLES = ("goal_type", "current_age", "currency", "target_amount_min", "risk_appetite",
+                              "override_time_horizon_years", "total_months")
+
+def register_prompt_templates():
+    """Compile the orchestrator templates once; afterwards they reload on file change or /api/reload-config"""
+    get_prompt_templates().register("sip_orchestrator", SIP_ORCHESTRATOR_TEMPLATE, required=SIP_ORCHESTRATOR_VARIABLES)
+
+try:
+    register_prompt_templates()
+    print("✅ Orchestrator prompt templates compiled")
+except Exception as e:
+    print(f"⚠️ Warning: Orchestrator prompt template compilation failed: {e}")
 
 def load_and_populate_orchestrator_prompt(form_context: Dict) -> str:
     """
-    Loads the orchestrator template and populates it with the given form_context.
+    Renders the precompiled SIP orchestrator template with the given form_context.
 
     Args:
         form_context (Dict): A dictionary containing the user's goal details.
@@ -489,28 +472,12 @@ def load_and_populate_orchestrator_prompt(form_context: Dict) -> str:
     Returns:
         str: The populated prompt as a string.
     """
-    # Define the path to the directory containing the template file
-    template_dir = Path("prompts/orchestrator_agent")
-
-    # Set up the Jinja2 environment
-    env = Environment(loader=FileSystemLoader(template_dir))
-
-    # Load the template file
-    template_path = "SIP_Orchestrator_Prompt_Template_patched_v4.txt"
     try:
-        template = env.get_template(template_path)
-    except FileNotFoundError:
-        # Create the necessary directory and a dummy file if they don't exist
-        # This is for demonstration purposes and assumes the template is not actually available
-        template_dir.mkdir(parents=True, exist_ok=True)
-        with open(template_dir / template_path, "w") as f:
-            f.write("goal_type = {{ goal_type }}")
-
-        # Retry loading the template
-        template = env.get_template(template_path)
-
-    # Render the template with the provided form_context
-    return template.render(form_context)
+        return get_prompt_templates().render("sip_orchestrator", form_context)
+    except KeyError:
+        raise HTTPException(status_code=500, detail=f"Orchestrator template not loaded: {SIP_ORCHESTRATOR_TEMPLATE}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 def calculate_time_horizon_years(form_context: Dict) -> Union[int, None]:
     """
@@ -584,13 +551,21 @@ def read_html_report_content(file_path: str) -> str:
         print(f"❌ Error reading HTML report: {e}")
         raise HTTPException(status_code=500, detail=f"Error reading HTML report: {str(e)}")
 
-async def process_html_and_populate_template(html_content: str, template: str) -> str:
+async def process_html_and_populate_template(html_content: str, template: str, report_hash: str = None) -> str:
     """Use ModelManager to read HTML report and populate fund recommendation template - mimicking ChatGPT workflow"""
     try:
         if model_manager is None:
             print("⚠️ ModelManager not available, falling back to manual population")
             return populate_template_manually_from_html(template, html_content)
         
+        # Reports are immutable, so the same report + template + model always populates the same way
+        cache_key = stable_hash(report_hash or stable_hash(html_content), stable_hash(template), model_manager.text_model_key)
+        if FUND_TEMPLATE_CACHE_CONFIG["enabled"]:
+            cached_template = fund_template_cache.get(cache_key)
+            if cached_template is not None:
+                print(f"♻️ Fund template cache hit ({cache_key[:12]}), skipping template population call")
+                return cached_template
+        
         # Create a comprehensive prompt that mimics uploading HTML file to ChatGPT
         model_prompt = f"""
 I am providing you with an HTML report file (comprehensive_report.html) from a SIP investment calculation and a fund recommendation template that needs to be populated.
@@ -615,9 +590,16 @@ INSTRUCTIONS:
 Return ONLY the populated template with all placeholders replaced:
 """
         
+        # Share the process-wide rate limit budget with the agent sessions
+        await get_rate_limiter(model_manager.text_model_key).acquire(estimate_tokens(model_prompt))
+        
         # Generate content using ModelManager - this mimics what you did with ChatGPT
         populated_template = await model_manager.generate_text(model_prompt)
         
+        # Only model output is cached; the manual fallback below should get another chance at the model
+        if FUND_TEMPLATE_CACHE_CONFIG["enabled"] and populated_template:
+            fund_template_cache.set(cache_key, populated_template)
+        
         print(f"✅ Template populated successfully using ModelManager (ChatGPT-style processing)")
         return populated_template
         
@@ -695,14 +677,48 @@ def load_fund_recommendation_template() -> str:
     template_path = Path("prompts/orchestrator_agent/Fund_Recommendation_Orchestrator_Prompt_Template_v1.txt")
     
     try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
-        return template_content
+        return get_prompt_templates().text(template_path)
     except FileNotFoundError:
         raise HTTPException(status_code=500, detail=f"Fund recommendation template not found: {template_path}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading fund recommendation template: {e}")
 
+def build_sip_prompt(form_data: Dict[str, Any]) -> str:
+    """Orchestrator prompt for a SIP run from the submitted form (used by the stream and by jobs)"""
+    form_data["override_time_horizon_years"] = int(calculate_time_horizon_years(form_data))
+    form_data["total_months"] = int(form_data["override_time_horizon_years"]) * 12  
+    
+    form_context = json.dumps(form_data, indent=2)
+    form_context_dict = ast.literal_eval(form_context)
+    return load_and_populate_orchestrator_prompt(form_context_dict)
+
+async def build_fund_recommendation_prompt(fund_request: Dict[str, Any]) -> str:
+    """Fund recommendation orchestrator prompt populated from an existing SIP report"""
+    sip_report_path = fund_request.get("report_file_path")
+    if not extract_session_id_from_path(sip_report_path):
+        raise ValueError("Could not extract SIP session ID from report path")
+    
+    fund_template = load_fund_recommendation_template()
+    
+    # Deterministic path: the SIP run's structured outputs, no model call
+    report_data = load_sip_report_data(sip_report_path)
+    if report_data:
+        try:
+            populated_template = populate_fund_template(fund_template, report_data)
+            print(f"✅ Template populated from report data: {sidecar_path(sip_report_path)}")
+            return populated_template
+        except ValueError as e:
+            print(f"⚠️ Report data incomplete for the fund template, using the model: {e}")
+    
+    html_content = read_html_report_content(sip_report_path)
+    return await process_html_and_populate_template(html_content, fund_template,
+                                                    registered_report_hash(Path(sip_report_path)))
+
+# Background job kinds for POST /api/jobs
+job_service.register_handler("sip", build_sip_prompt, ("comprehensive_report.html",))
+job_service.register_handler("fund_recommendation", build_fund_recommendation_prompt,
+                             ("comprehensive_report.html", "fund_comprehensive_report.html"))
+
 # API Endpoints
 
 @app.get("/")
@@ -723,15 +739,21 @@ async def root():
 
 @app.post("/api/reload-config")
 async def reload_configuration():
-    """Reload configuration from JSON file"""
-    global SIP_CONFIG
+    """Reload configuration from JSON file (other workers follow via the shared store)"""
+    global SIP_CONFIG, config_generation
     try:
         SIP_CONFIG = load_sip_config()
         # Recreate enums with new configuration
         create_dynamic_enums()
+        # Built off the event loop and swapped in whole; in-flight renders keep the previous templates
+        template_count = await asyncio.to_thread(get_prompt_templates().reload)
+        get_model_clients().reload()
+        config_generation = str(time.time())
+        get_shared_store().set_setting("sip_config_generation", config_generation)
         return {
             "success": True,
             "message": "Configuration reloaded successfully",
+            "prompt_templates": template_count,
             "timestamp": datetime.now().isoformat()
         }
     except HTTPException as e:
@@ -740,6 +762,13 @@ async def reload_configuration():
             "message": f"Failed to reload configuration: {e.detail}",
             "timestamp": datetime.now().isoformat()
         }
+    except Exception as e:
+        # Template errors leave the previous templates in place
+        return {
+            "success": False,
+            "message": f"Failed to reload prompt templates: {e}",
+            "timestamp": datetime.now().isoformat()
+        }
 
 @app.get("/api/form-config")
 async def get_form_config():
@@ -822,14 +851,7 @@ async def calculate_sip_stream(request: Request, form_data: Dict[str, Any] = Bod
             yield f"data: {json.dumps(initial_event)}\n\n"
             
             # Generate the prompt
-            goal_type = form_data.get("goal_type")
-            orchestrator_template = load_orchestrator_template()
-            form_data["override_time_horizon_years"] = int(calculate_time_horizon_years(form_data))
-            form_data["total_months"] = int(form_data["override_time_horizon_years"]) * 12  
-            
-            form_context = json.dumps(form_data, indent=2)
-            form_context_dict = ast.literal_eval(form_context)
-            final_prompt = load_and_populate_orchestrator_prompt(form_context_dict)
+            final_prompt = build_sip_prompt(form_data)
             
             # Send prompt generated event
             prompt_event = {
@@ -849,72 +871,29 @@ async def calculate_sip_stream(request: Request, form_data: Dict[str, Any] = Bod
                 async for event_data in agent_stream_service.process_query_stream(final_prompt):
                     # Check if client disconnected
                     if await request.is_disconnected():
-                        print("Client disconnected, stopping stream")
+                        print(f"Client disconnected, session {session_id} continues - reattach via /api/sessions/{session_id}/events")
                         break
                     
-                    # Parse the event to check for file generation
-                    try:
-                        # Remove 'data: ' prefix if present
-                        clean_data = event_data.replace("data: ", "").strip()
-                        if clean_data:
-                            event_json = json.loads(clean_data)
-                            
-                            # Check if this is a file generation event from the agent
-                            if (event_json.get("type") == "agent_response" and 
-                                "comprehensive_report.html" in str(event_json.get("data", {}).get("message", ""))):
-                                
-                                # Extract file path from agent response
-                                message = event_json["data"]["message"]
-                                print(f"Detected file generation in message: {message}")
-                                
-                                # Enhanced: Look for file path patterns with session ID extraction
-                                path_patterns = [
-                                    r'media[\\\/]generated[\\\/]([^\\\/]+)[\\\/]comprehensive_report\.html',
-                                    r'([^\\\/]+[\\\/])*media[\\\/]generated[\\\/]([^\\\/]+)[\\\/]comprehensive_report\.html',
-                                    r'[\w\\/.-]+comprehensive_report\.html'
-                                ]
-                                
-                                for pattern in path_patterns:
-                                    path_match = re.search(pattern, message)
-                                    if path_match:
-                                        generated_file_path = path_match.group(0)
-                                        generated_filename = "comprehensive_report.html"
-                                        
-                                        # Extract session ID
-                                        session_id = extract_session_id_from_path(generated_file_path)
-                                        
-                                        # Normalize path for consistency
-                                        if session_id:
-                                            normalized_path = construct_standard_file_path(session_id, "comprehensive_report.html")
-                                            print(f"📁 Normalized path: {normalized_path}")
-                                        else:
-                                            normalized_path = generated_file_path
-                                        
-                                        # Emit file generated event with both original and normalized paths
-                                        file_event = {
-                                            "type": "file_generated",
-                                            "data": {
-                                                "filename": generated_filename,
-                                                "filepath": generated_file_path,
-                                                "normalized_path": normalized_path,
-                                                "session_id": session_id
-                                            },
-                                            "timestamp": time.time()
-                                        }
-                                        yield f"data: {json.dumps(file_event)}\n\n"
-                                        print(f"📄 Emitted file_generated event for: {generated_file_path}")
-                                        break
-                    except json.JSONDecodeError:
-                        pass  # Continue with normal event streaming
-                    except Exception as parse_error:
-                        print(f"Error parsing stream event: {parse_error}")
-                        pass  # Continue with normal event streaming
+                    # Typed events from the agent event bus - no log scraping needed
+                    event_json = parse_sse(event_data)
+                    event_session_id = event_json.get("data", {}).get("session_id")
+                    if event_json.get("type") == "processing_start":
+                        session_id = event_session_id
+                    elif (event_json.get("type") == "file_created" and
+                          event_json["data"].get("filename") == "comprehensive_report.html"):
+                        generated_file_path = event_json["data"]["path"]
+                        generated_filename = "comprehensive_report.html"
+                        session_id = event_session_id
+                        
+                        # Published on the bus (not yielded) so it is numbered and replayable; arrives next in this stream
+                        publish_event(EventType.FILE_GENERATED, session_id,
+                                      filename=generated_filename,
+                                      filepath=generated_file_path,
+                                      normalized_path=construct_standard_file_path(session_id, generated_filename))
+                        print(f"📄 Emitted file_generated event for: {generated_file_path}")
                     
                     yield event_data
                     
-                    # Add small delay to prevent overwhelming the client
-                    await asyncio.sleep(0.01)
-                    
             except Exception as stream_error:
                 print(f"Stream error: {stream_error}")
                 traceback.print_exc()
@@ -1026,9 +1005,7 @@ async def fund_recommendation_stream(request: Request, fund_request: Dict[str, A
             
             # Template processing
             try:
-                fund_template = load_fund_recommendation_template()
-                html_content = read_html_report_content(sip_report_path)
-                populated_template = await process_html_and_populate_template(html_content, fund_template)
+                populated_template = await build_fund_recommendation_prompt(fund_request)
                 
                 template_event = {
                     "type": "template_processed",
@@ -1060,48 +1037,20 @@ async def fund_recommendation_stream(request: Request, fund_request: Dict[str, A
                     # Forward all events for progress/spinner/logs
                     yield event_data
                     
-                    # Look for fund file generation - check both filename patterns
-                    try:
-                        clean_data = event_data.replace("data: ", "").strip()
-                        if clean_data:
-                            event_json = json.loads(clean_data)
-                            
-                            # Look for either comprehensive_report.html or fund_comprehensive_report.html
-                            message_str = str(event_json)
-                            if "comprehensive_report.html" in message_str:
-                                # Extract the path - handle both filename patterns
-                                patterns = [
-                                    r'media[\\\/]generated[\\\/]([^\\\/]+)[\\\/]comprehensive_report\.html',
-                                    r'media[\\\/]generated[\\\/]([^\\\/]+)[\\\/]fund_comprehensive_report\.html'
-                                ]
-                                
-                                for pattern in patterns:
-                                    match = re.search(pattern, message_str)
-                                    if match:
-                                        fund_session_id = match.group(1)
-                                        filename = "comprehensive_report.html" if "fund_comprehensive_report" not in message_str else "fund_comprehensive_report.html"
-                                        generated_fund_file_path = f"media/generated/{fund_session_id}/{filename}"
-                                        generated_fund_filename = filename
-                                        
-                                        # Emit file generated event
-                                        file_event = {
-                                            "type": "file_generated",
-                                            "data": {
-                                                "filename": generated_fund_filename,
-                                                "filepath": generated_fund_file_path,
-                                                "session_id": fund_session_id,
-                                                "file_type": "fund_recommendation"
-                                            },
-                                            "timestamp": time.time()
-                                        }
-                                        yield f"data: {json.dumps(file_event)}\n\n"
-                                        print(f"Fund file detected: {generated_fund_file_path}")
-                                        break
-                                        
-                    except (json.JSONDecodeError, Exception):
-                        pass
-                    
-                    await asyncio.sleep(0.01)
+                    # Fund report announced as a typed file_created event by the executor
+                    event_json = parse_sse(event_data)
+                    if (event_json.get("type") == "file_created" and
+                            event_json["data"].get("filename") in ("comprehensive_report.html", "fund_comprehensive_report.html")):
+                        fund_session_id = event_json["data"]["session_id"]
+                        generated_fund_file_path = event_json["data"]["path"]
+                        generated_fund_filename = event_json["data"]["filename"]
+                        
+                        # Emit file generated event (via the bus so it is replayable)
+                        publish_event(EventType.FILE_GENERATED, fund_session_id,
+                                      filename=generated_fund_filename,
+                                      filepath=generated_fund_file_path,
+                                      file_type="fund_recommendation")
+                        print(f"Fund file detected: {generated_fund_file_path}")
                 
             except Exception as stream_error:
                 error_event = {
@@ -1115,32 +1064,15 @@ async def fund_recommendation_stream(request: Request, fund_request: Dict[str, A
             if not fund_session_id:
                 print("Searching for fund recommendation files...")
                 
-                # Search for BOTH possible filenames
-                fund_patterns = [
-                    "media/generated/*/comprehensive_report.html",      # Actual filename being created
-                    "media/generated/*/fund_comprehensive_report.html"  # Previous expected filename
-                ]
-                
-                fund_files = []
-                for pattern in fund_patterns:
-                    fund_files.extend(glob.glob(pattern))
-                
-                # Filter out SIP session files and find newest
-                newest_fund_file = None
-                newest_time = 0
-                
-                for file_path in fund_files:
-                    session_id = extract_session_id_from_path(file_path)
-                    if session_id and session_id != sip_session_id:
-                        file_time = os.path.getmtime(file_path)
-                        if file_time > newest_time:
-                            newest_time = file_time
-                            newest_fund_file = file_path
-                            fund_session_id = session_id
-                
-                if newest_fund_file:
-                    generated_fund_file_path = newest_fund_file
-                    generated_fund_filename = os.path.basename(newest_fund_file)
+                # Newest report of either name from any session other than the SIP one
+                fund_entry = get_report_registry().latest(
+                    filenames=("comprehensive_report.html", "fund_comprehensive_report.html"),
+                    exclude_session_id=sip_session_id
+                )
+                if fund_entry:
+                    fund_session_id = fund_entry.session_id
+                    generated_fund_file_path = fund_entry.path
+                    generated_fund_filename = fund_entry.filename
                     
                     # Emit the file event
                     file_event = {
@@ -1285,8 +1217,15 @@ def compare_sessions_and_extract_fund_path(message: str, sip_session_id: str) ->
     except Exception as e:
         print(f"Error comparing sessions: {e}")
         return None
+def registered_report_hash(path: Path) -> Optional[str]:
+    """Content hash of a report as registered, or None when the file is unregistered or changed since"""
+    entry = get_report_registry().get(path.parent.name, path.name)
+    if entry and Path(entry.path).resolve() == path.resolve() and entry.mtime == path.stat().st_mtime:
+        return entry.sha256
+    return None
+
 @app.get("/api/download-report", response_class=HTMLResponse)
-async def download_report(filepath: str = Query(..., description="File path to the HTML report")):
+async def download_report(request: Request, filepath: str = Query(..., description="File path to the HTML report")):
     """Serve generated HTML reports with enhanced error handling and support for both SIP and fund recommendation reports"""
     try:
         # Convert to Path object and normalize
@@ -1321,59 +1260,48 @@ async def download_report(filepath: str = Query(..., description="File path to t
             print(f"❌ File not found: {filepath}")
             print(f"Tried paths: {[str(p) for p in possible_paths]}")
             
-            # List available files in media/generated for debugging
-            media_generated = Path("media/generated")
-            if media_generated.exists():
-                print("Available files in media/generated:")
-                for file in media_generated.rglob("*.html"):
-                    print(f"  - {file}")
+            print(f"Report registry: {get_report_registry().get_stats()}")
             
             raise HTTPException(status_code=404, detail=f"Report file not found: {filepath}")
         
-        # Read and return the HTML content
-        with open(resolved_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        
-        print(f"📄 Served HTML report: {resolved_path}")
-        return HTMLResponse(content=html_content, status_code=200)
+        # Streamed from disk with ETag / conditional GET / Range and pre-compressed variants
+        response = report_response(request, resolved_path, registered_report_hash(resolved_path))
+        print(f"📄 Served HTML report: {resolved_path} ({response.status_code})")
+        return response
         
+    except HTTPException:
+        raise
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Report file not found")
     except PermissionError:
         raise HTTPException(status_code=403, detail="Permission denied accessing report file")
-    except UnicodeDecodeError:
-        raise HTTPException(status_code=400, detail="Unable to decode HTML file - invalid encoding")
     except Exception as e:
         print(f"Error serving HTML report: {e}")
         raise HTTPException(status_code=500, detail=f"Error reading report file: {str(e)}")
 
 @app.get("/api/reports/{filename}")
-async def get_report_by_filename(filename: str):
+async def get_report_by_filename(request: Request, filename: str):
     """Alternative endpoint to get report by filename (searches in media directory) - supports both SIP and fund reports"""
     try:
         # Security check: ensure filename is HTML
         if not filename.endswith('.html'):
             raise HTTPException(status_code=400, detail="Only HTML files are allowed")
         
-        # Look in the media/generated directory
-        media_dir = Path("media/generated")
-        
-        if not media_dir.exists():
-            raise HTTPException(status_code=404, detail="Media directory not found")
-        
-        # Search for the file in subdirectories
-        for report_dir in media_dir.rglob("*"):
-            if report_dir.is_dir():
-                report_file = report_dir / filename
-                if report_file.exists():
-                    with open(report_file, 'r', encoding='utf-8') as f:
-                        html_content = f.read()
-                    
-                    print(f"📄 Served HTML report by filename: {filename}")
-                    return HTMLResponse(content=html_content, status_code=200)
+        registry = get_report_registry()
+        entry = registry.latest(filenames=(filename,))
+        # Written by something that never registered it (external tools, older runs): look on disk once
+        if not entry and registry.discover([glob.escape(filename)]):
+            entry = registry.latest(filenames=(filename,))
+        if entry and Path(entry.path).exists():
+            report_path = Path(entry.path)
+            response = report_response(request, report_path, registered_report_hash(report_path))
+            print(f"📄 Served HTML report by filename: {filename} ({response.status_code})")
+            return response
         
         raise HTTPException(status_code=404, detail=f"Report file {filename} not found")
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error serving HTML report by filename: {e}")
         raise HTTPException(status_code=500, detail=f"Error reading report: {str(e)}")
@@ -1465,6 +1393,172 @@ async def get_sample_data():
     
     return sample_data
 
+@app.get("/api/rate-limits")
+async def get_rate_limits():
+    """Remaining per-model request/token budget shared by all sessions and workers"""
+    return {
+        "rate_limits": get_rate_limit_metrics(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/usage")
+async def get_token_usage(days: int = 7):
+    """Provider-reported tokens and cost per UTC day and model, across all workers"""
+    return {
+        "daily_usage": await asyncio.to_thread(get_usage_tracker().daily_usage, max(1, min(days, 366))),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    """Hit/miss counters of this worker's caches (entries are shared on disk)"""
+    return {
+        "fund_template": {**fund_template_cache.get_stats(), "enabled": FUND_TEMPLATE_CACHE_CONFIG["enabled"]},
+        "prompt_templates": get_prompt_templates().get_stats(),
+        "model_clients": get_model_clients().get_stats(),
+        "llm_responses": get_response_cache().get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/sessions/{session_id}/resume")
+async def resume_session_stream(request: Request, session_id: str):
+    """Resume a crashed/terminated session from its last checkpoint, streaming the remaining execution"""
+    if SessionSerializer.load_checkpoint(session_id) is None:
+        raise HTTPException(status_code=404, detail=f"No checkpoint found for session {session_id}")
+    
+    async def event_generator():
+        try:
+            async for event_data in agent_stream_service.process_resume_stream(session_id):
+                if await request.is_disconnected():
+                    print("Client disconnected, stopping resume stream")
+                    break
+                yield event_data
+        finally:
+            final_event = {
+                "type": "stream_end",
+                "data": {"message": "Stream ended", "session_id": session_id},
+                "timestamp": time.time()
+            }
+            yield f"data: {json.dumps(final_event)}\n\n"
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Cache-Control",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.get("/api/sessions/{session_id}/events")
+async def session_events_stream(request: Request, session_id: str, last_event_id: Optional[int] = None):
+    """Replay a session's events after Last-Event-ID (header, or ?last_event_id= for fetch clients), then tail it live"""
+    if not agent_stream_service.has_session_events(session_id):
+        raise HTTPException(status_code=404, detail=f"No events recorded for session {session_id}")
+    
+    header_id = request.headers.get("last-event-id")
+    if last_event_id is None:
+        last_event_id = int(header_id) if header_id and header_id.isdigit() else 0
+    
+    async def event_generator():
+        try:
+            async for event_data in agent_stream_service.stream_session_events(session_id, last_event_id):
+                if await request.is_disconnected():
+                    break
+                yield event_data
+        finally:
+            final_event = {
+                "type": "stream_end",
+                "data": {"message": "Stream ended", "session_id": session_id},
+                "timestamp": time.time()
+            }
+            yield f"data: {json.dumps(final_event)}\n\n"
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Cache-Control, Last-Event-ID",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: Request, job_request: Dict[str, Any] = Body(...)):
+    """Queue a SIP or fund-recommendation run; it keeps going if the client disconnects or the worker restarts"""
+    if job_service.store is None:
+        raise HTTPException(status_code=503, detail="Job service is not running")
+    
+    user_id = job_request.get("user_id") or request.headers.get("x-user-id") or "anonymous"
+    try:
+        job = await job_service.submit(job_request.get("kind", "sip"), job_request.get("payload", {}), user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job['job_id']}",
+        "events_url": f"/api/jobs/{job['job_id']}/events"
+    }
+
+@app.get("/api/jobs")
+async def list_jobs(user_id: str = Query(None, description="Only this user's jobs"), limit: int = 50):
+    """Most recent jobs"""
+    if job_service.store is None:
+        raise HTTPException(status_code=503, detail="Job service is not running")
+    return {"jobs": job_service.list_jobs(user_id, limit)}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Job status, queue position, session id and report path"""
+    job = job_service.get_job(job_id) if job_service.store else None
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events_stream(request: Request, job_id: str, last_event_id: Optional[int] = None):
+    """job_status updates plus the job's session events; reconnect with Last-Event-ID to skip what was seen"""
+    if job_service.store is None or job_service.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    header_id = request.headers.get("last-event-id")
+    if last_event_id is None:
+        last_event_id = int(header_id) if header_id and header_id.isdigit() else 0
+    
+    async def event_generator():
+        async for event_data in job_service.stream_job_events(job_id, last_event_id):
+            if await request.is_disconnected():
+                break
+            yield event_data
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Cache-Control, Last-Event-ID",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.get("/api/sessions")
+async def get_sessions_status():
+    """Running and queued sessions in this worker"""
+    return {
+        **agent_stream_service.get_sessions_status(),
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.post("/api/terminate-process")
 async def terminate_process(termination_request: Dict[str, Any] = Body(...)):
     """Terminate running processes"""
@@ -1472,13 +1566,13 @@ async def terminate_process(termination_request: Dict[str, Any] = Body(...)):
         process_type = termination_request.get("type")
         print(f"🛑 Termination requested for: {process_type}")
         
-        # Stop the agent stream service if running
-        if hasattr(agent_stream_service, 'abort_current_process'):
-            await agent_stream_service.abort_current_process()
+        # Cancel the running session(s) (their node tasks, LLM calls and tool calls unwind with them)
+        abort_result = await agent_stream_service.abort_current_process(termination_request.get("session_id"))
         
         return {
             "success": True,
             "message": f"Termination request processed for {process_type}",
+            **abort_result,
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -1569,18 +1663,15 @@ def find_fund_file_different_from_sip_session(sip_session_id: str) -> Optional[D
         Dict with fund file info if found from different session
     """
     try:
-        pattern = "media/generated/*/comprehensive_report.html"
-        all_reports = glob.glob(pattern)
-        
-        for report_path in all_reports:
-            session_id = extract_session_id_from_path(report_path)
-            if session_id and session_id != sip_session_id:
-                # This is from a different session - likely the fund recommendation
-                return {
-                    "filepath": report_path,
-                    "filename": "comprehensive_report.html", 
-                    "session_id": session_id
-                }
+        entry = get_report_registry().latest(filenames=("comprehensive_report.html",),
+                                             exclude_session_id=sip_session_id)
+        if entry:
+            # This is from a different session - likely the fund recommendation
+            return {
+                "filepath": entry.path,
+                "filename": entry.filename,
+                "session_id": entry.session_id
+            }
         
         return None
         
@@ -1624,6 +1715,14 @@ if __name__ == "__main__":
     print("📁 Static Media: http://localhost:8000/media/")
     print("💰 Fund Recommendation: POST http://localhost:8000/api/fund-recommendation")
     print("📊 Check SIP Reports: GET http://localhost:8000/api/check-reports")
+    print("📊 Cache stats: GET http://localhost:8000/api/cache-stats")
+    print("🪙 Token usage: GET http://localhost:8000/api/usage?days=7")
     print("📈 Check Fund Reports: GET http://localhost:8000/api/check-fund-reports")
     
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Sessions, events, jobs, the report index and the LLM rate-limit buckets live in the shared store, so any
+    # number of workers can serve them; max_concurrent_agents_global is split by WEB_CONCURRENCY (set it too
+    # when starting uvicorn with --workers directly)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    print(f"👷 Workers: {workers} (set WEB_CONCURRENCY to change)")
+    
+    uvicorn.run("fastapi_sip_service:app" if workers > 1 else app, host="0.0.0.0", port=8000, workers=workers)
\ No newline at end of file
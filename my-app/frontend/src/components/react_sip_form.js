@@ -686,6 +686,24 @@ const SIPGoalPlanningForm = () => {
     setFundRecommendationLogs(prev => [...prev, logEntry]);
   };
 
+  // Live agent output: one log line per streaming step, updated in place as agent_token events arrive
+  const appendAgentTokens = (setLogs, data, timestamp) => {
+    const streamKey = `${data.session_id}:${data.step_id}`;
+    setLogs(prev => {
+      const index = prev.findIndex(log => log.streamKey === streamKey);
+      const text = (index >= 0 ? prev[index].text : '') + (data.delta || '');
+      const entry = {
+        id: index >= 0 ? prev[index].id : Date.now() + Math.random(),
+        streamKey,
+        text,
+        type: 'info',
+        message: `✍️ ${formatAgentName(data.agent)}: …${text.slice(-160).replace(/\s+/g, ' ')}`,
+        timestamp
+      };
+      return index >= 0 ? [...prev.slice(0, index), entry, ...prev.slice(index + 1)] : [...prev, entry];
+    });
+  };
+
   // Fetch HTML report content with error handling
   const fetchHtmlReport = async (filePath) => {
     try {
@@ -1194,6 +1212,10 @@ const SIPGoalPlanningForm = () => {
         }
         break;
         
+      case 'agent_token':
+        appendAgentTokens(setStreamLogs, data, timeStr);
+        break;
+        
       case 'agent_response':
         const message = data.message || '';
         if (parseAndFilterLogMessage(message)) {
@@ -1313,6 +1335,10 @@ const SIPGoalPlanningForm = () => {
         }
         break;
         
+      case 'agent_token':
+        appendAgentTokens(setFundRecommendationLogs, data, timeStr);
+        break;
+        
       case 'agent_response':
         const message = data.message || '';
         if (parseAndFilterLogMessage(message)) {
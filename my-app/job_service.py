@@ -0,0 +1,350 @@
+# job_service.py - Persistent background jobs for agent runs, decoupled from HTTP requests
+import asyncio
+import inspect
+import json
+import sqlite3
+import time
+import traceback
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Union
+
+from utils.utils import log_step, log_error
+from agentLoop.flow import load_profile_section
+from agentLoop.session_serializer import SessionSerializer
+from agent_stream_service import AgentStreamService, parse_sse
+from utils.shared_store import WORKER_ID, SharedStore, get_shared_store
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    session_id TEXT,
+    report_path TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    heartbeat_at REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_user_status ON jobs(user_id, status);
+"""
+
+def load_jobs_config():
+    """Load job queue settings from profiles.yaml, falling back to defaults"""
+    return load_profile_section("jobs", {
+        "workers": 2,
+        "max_attempts": 3,
+        "poll_interval_seconds": 2.0,
+        "lease_seconds": 60
+    })
+
+class JobStore:
+    """
+    Job queue table in the shared store; survives restarts, needs no outside
+    services, and every worker process claims from the same queue.
+    """
+
+    def __init__(self, store: SharedStore):
+        self.store = store
+        self.conn.executescript(JOBS_SCHEMA)
+
+    @property
+    def conn(self):
+        # Per-thread connection, so calls made through asyncio.to_thread never share a transaction
+        return self.store.conn
+
+    def _to_job(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        self.conn.execute(
+            "INSERT INTO jobs (job_id, kind, user_id, status, payload, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, kind, user_id, json.dumps(payload, default=str), time.time())
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._to_job(self.conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone())
+
+    def list(self, user_id: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+        if user_id:
+            rows = self.conn.execute("SELECT * FROM jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?", (user_id, limit))
+        else:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [self._to_job(row) for row in rows]
+
+    def update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """
+        Atomically move the fairest queued job to running.
+
+        Fair = the user with the fewest running jobs goes first, then the user
+        served least recently, then the oldest job - so one user's burst cannot
+        starve everyone else.
+        """
+        with self.store.transaction():
+            row = self.conn.execute("""
+                SELECT j.job_id FROM jobs j
+                WHERE j.status = 'queued'
+                ORDER BY
+                    (SELECT COUNT(*) FROM jobs r WHERE r.user_id = j.user_id AND r.status = 'running'),
+                    COALESCE((SELECT MAX(s.started_at) FROM jobs s WHERE s.user_id = j.user_id), 0),
+                    j.created_at
+                LIMIT 1
+            """).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', claimed_by = ?, heartbeat_at = ?, started_at = ?, "
+                "attempts = attempts + 1 WHERE job_id = ?",
+                (WORKER_ID, now, now, row["job_id"])
+            )
+        return self.get(row["job_id"])
+
+    def queue_position(self, job: Dict[str, Any]) -> Optional[int]:
+        """1-based position among queued jobs by age (fair scheduling may start it sooner)"""
+        if job["status"] != "queued":
+            return None
+        (ahead,) = self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (job["created_at"],)
+        ).fetchone()
+        return ahead + 1
+
+    def heartbeat(self, job_ids: List[str]):
+        """Renew this worker's lease on the jobs it is running"""
+        for job_id in job_ids:
+            self.conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND claimed_by = ?",
+                              (time.time(), job_id, WORKER_ID))
+
+    def release(self, job_ids: List[str]):
+        """Put this worker's unfinished jobs back in the queue (graceful shutdown)"""
+        for job_id in job_ids:
+            self.conn.execute("UPDATE jobs SET status = 'queued', claimed_by = NULL WHERE job_id = ? AND claimed_by = ?",
+                              (job_id, WORKER_ID))
+
+    def requeue_stale(self, lease_seconds: float) -> int:
+        """Jobs whose worker stopped renewing its lease (crash/restart) go back to the queue"""
+        return self.conn.execute(
+            "UPDATE jobs SET status = 'queued', claimed_by = NULL WHERE status = 'running' AND heartbeat_at < ?",
+            (time.time() - lease_seconds,)
+        ).rowcount
+
+@dataclass
+class JobHandler:
+    """How to run one kind of job: build the agent query from the payload, recognise its report"""
+    build_query: Callable[[Dict[str, Any]], Union[str, Awaitable[str]]]
+    report_filenames: tuple = ("comprehensive_report.html",)
+
+class JobService:
+    def __init__(self, agent_service: AgentStreamService, config: Dict[str, Any] = None):
+        self.agent_service = agent_service
+        self.config = config or load_jobs_config()
+        self.store: Optional[JobStore] = None
+        self.handlers: Dict[str, JobHandler] = {}
+        self.workers: List[asyncio.Task] = []
+        self.running_job_ids = set()  # Claimed by this process; their leases are renewed by _heartbeat
+        self._changed = asyncio.Event()
+
+    def register_handler(self, kind: str, build_query, report_filenames: tuple = ("comprehensive_report.html",)):
+        self.handlers[kind] = JobHandler(build_query, tuple(report_filenames))
+
+    def _notify(self):
+        """Wake workers and status streams (same replace-the-Event pattern as SessionAdmission)"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def start(self):
+        if self.workers:
+            return
+        self.store = JobStore(get_shared_store())
+        await self._requeue_stale()
+        self.workers = [asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+                        for i in range(self.config["workers"])]
+        self.workers.append(asyncio.create_task(self._heartbeat(), name="job-heartbeat"))
+        log_step(f"Job service started with {self.config['workers']} worker(s) on {WORKER_ID}", symbol="🧵")
+
+    async def shutdown(self):
+        """Stop workers and hand their running jobs back to the queue for any worker to pick up"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        if self.running_job_ids:
+            await asyncio.to_thread(self.store.release, list(self.running_job_ids))
+            log_step(f"Released {len(self.running_job_ids)} unfinished job(s) back to the queue", symbol="🔁")
+            self.running_job_ids.clear()
+
+    # Queue writes run in asyncio.to_thread (each thread has its own connection): claim_next takes the
+    # write lock up front and busy_timeout can hold any write for seconds while other workers commit
+
+    async def _requeue_stale(self):
+        requeued = await asyncio.to_thread(self.store.requeue_stale, self.config["lease_seconds"])
+        if requeued:
+            log_step(f"Requeued {requeued} job(s) whose worker stopped responding", symbol="🔁")
+            self._notify()
+
+    async def _heartbeat(self):
+        """Renew leases on our jobs and reclaim jobs of workers that died (crash, kill -9, OOM)"""
+        while True:
+            await asyncio.sleep(self.config["lease_seconds"] / 3)
+            await asyncio.to_thread(self.store.heartbeat, list(self.running_job_ids))
+            await self._requeue_stale()
+
+    async def submit(self, kind: str, payload: Dict[str, Any], user_id: str = "anonymous") -> Dict[str, Any]:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}' (known: {', '.join(self.handlers)})")
+        job = await asyncio.to_thread(self.store.enqueue, kind, payload, user_id)
+        self._notify()
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Client view of a job (no payload) with its queue position"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        job["queue_position"] = self.store.queue_position(job)
+        job.pop("payload")
+        return job
+
+    def list_jobs(self, user_id: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+        jobs = self.store.list(user_id, limit)
+        for job in jobs:
+            job.pop("payload")
+        return jobs
+
+    async def wait_for_change(self, timeout: float = None):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout or self.config["poll_interval_seconds"])
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self):
+        while True:
+            claim = asyncio.create_task(asyncio.to_thread(self.store.claim_next))
+            try:
+                job = await asyncio.shield(claim)
+            except asyncio.CancelledError:
+                # Shutdown mid-claim: a job the thread claimed anyway goes straight back to the queue
+                job = await claim
+                if job:
+                    await asyncio.to_thread(self.store.release, [job["job_id"]])
+                raise
+            if job is None:
+                # Poll interval also picks up jobs enqueued by other processes
+                await self.wait_for_change()
+                continue
+
+            self._notify()
+            self.running_job_ids.add(job["job_id"])
+            try:
+                await self._execute(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                await self._finish(job, error=str(e))
+            self.running_job_ids.discard(job["job_id"])
+
+    async def _execute(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await self._finish(job, error=f"No handler registered for job kind '{job['kind']}'")
+            return
+
+        log_step(f"Job {job_id} ({job['kind']}, user {job['user_id']}) attempt {job['attempts']}", symbol="🧵")
+
+        # A job interrupted mid-run continues from its session checkpoint instead of starting over
+        if job["session_id"] and SessionSerializer.load_checkpoint(job["session_id"]):
+            stream = self.agent_service.process_resume_stream(job["session_id"])
+        else:
+            query = handler.build_query(job["payload"])
+            if inspect.isawaitable(query):
+                query = await query
+            stream = self.agent_service.process_query_stream(query)
+
+        result = None
+        async for frame in stream:
+            event = parse_sse(frame)
+            event_type, data = event.get("type"), event.get("data", {})
+            if event_type == "processing_start":
+                job["session_id"] = data.get("session_id")
+                await asyncio.to_thread(self.store.update, job_id, session_id=job["session_id"])
+                self._notify()
+            elif event_type == "file_created" and data.get("filename") in handler.report_filenames:
+                job["report_path"] = data.get("path")
+                await asyncio.to_thread(self.store.update, job_id, report_path=job["report_path"])
+                self._notify()
+            elif event_type == "execution_complete":
+                result = data
+            elif event_type == "error" and data.get("aborted"):
+                result = {"success": False, "error": data.get("error")}
+
+        if result and result.get("success"):
+            await self._finish(job)
+        else:
+            await self._finish(job, error=(result or {}).get("error") or "Agent run ended without a result")
+
+    async def _finish(self, job: Dict[str, Any], error: str = None):
+        if error and job["attempts"] < self.config["max_attempts"] and not job.get("report_path"):
+            log_error(f"Job {job['job_id']} attempt {job['attempts']} failed, requeueing: {error}")
+            await asyncio.to_thread(self.store.update, job["job_id"], status="queued", error=error)
+        else:
+            await asyncio.to_thread(self.store.update, job["job_id"], status="failed" if error else "completed",
+                                    error=error, finished_at=time.time())
+        self._notify()
+
+    async def stream_job_events(self, job_id: str, last_event_id: int = 0) -> AsyncGenerator[str, None]:
+        """job_status frames on every change, the job's session events (replayable by id) while it runs, then the final status"""
+        def status_frame(job):
+            event = {"type": "job_status", "data": job, "timestamp": time.time()}
+            return f"data: {json.dumps(event)}\n\n"
+
+        async def session_frames(session_id):
+            nonlocal last_event_id
+            async for frame in self.agent_service.stream_session_events(session_id, last_event_id):
+                if frame.startswith("id: "):
+                    last_event_id = int(frame[len("id: "):frame.index("\n")])
+                yield frame
+
+        last_status = None
+        while True:
+            job = self.get_job(job_id)
+            session_id = job["session_id"]
+            if job["status"] in ("completed", "failed"):
+                # Late or reconnecting clients still get whatever session events they missed
+                if session_id and self.agent_service.has_session_events(session_id):
+                    async for frame in session_frames(session_id):
+                        yield frame
+                yield status_frame(job)
+                return
+
+            status = (job["status"], job["queue_position"], session_id)
+            if status != last_status:
+                last_status = status
+                yield status_frame(job)
+
+            # The session may run on any worker; stream_session_events tails it either way
+            streamed = False
+            if job["status"] == "running" and session_id and self.agent_service.has_session_events(session_id):
+                async for frame in session_frames(session_id):
+                    streamed = True
+                    yield frame
+            if not streamed:
+                await self.wait_for_change()
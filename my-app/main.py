@@ -2,6 +2,7 @@
 
 from utils.utils import log_step, log_error
 import asyncio
+import argparse
 import yaml
 from dotenv import load_dotenv
 
@@ -68,7 +69,7 @@ def get_user_query():
     log_step("📝 Your Question:", symbol="")
     return input().strip()
 
-async def main():
+async def main(resume_session_id=None):
     load_dotenv()
     print(BANNER)
     
@@ -82,6 +83,17 @@ async def main():
     # Initialize AgentLoop4
     agent_loop = AgentLoop4(multi_mcp)
     
+    # Resume an interrupted session first (skips profiling/planning already checkpointed)
+    if resume_session_id:
+        try:
+            log_step(f"♻️ Resuming session {resume_session_id}...")
+            execution_context = await agent_loop.resume(resume_session_id)
+            print("\n" + "="*60)
+            analyze_results(execution_context)
+            print("="*60)
+        except Exception as e:
+            log_error(f"Resume failed: {e}")
+    
     while True:
         try:
             # Get file input first
@@ -118,4 +130,7 @@ async def main():
     await multi_mcp.shutdown()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Agentic Query Assistant")
+    parser.add_argument("--resume", metavar="SESSION_ID", help="Resume an interrupted session from its checkpoint")
+    args = parser.parse_args()
+    asyncio.run(main(resume_session_id=args.resume))
@@ -86,8 +86,9 @@ class MCP:
         self.session_context = None
 
 class MultiMCP:
-    def __init__(self, server_configs: List[dict]):
+    def __init__(self, server_configs: List[dict], tool_timeout: float = 60.0):
         self.server_configs = server_configs
+        self.tool_timeout = tool_timeout  # Per-server override: tool_timeout_seconds in mcp_server_config.yaml
         self.tool_map: Dict[str, Dict[str, Any]] = {}
         self.server_tools: Dict[str, List[Any]] = {}
         self.client_cache: Dict[str, MCP] = {}
@@ -125,7 +126,11 @@ class MultiMCP:
 
         config = entry["config"]
         client = self.client_cache[config["id"]]
-        return await client.call_tool(tool_name, arguments)
+        timeout = config.get("tool_timeout_seconds", self.tool_timeout)
+        try:
+            return await asyncio.wait_for(client.call_tool(tool_name, arguments), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Tool '{tool_name}' on server '{config['id']}' timed out after {timeout}s")
 
     async def function_wrapper(self, tool_name: str, *args):
         if isinstance(tool_name, str) and len(args) == 0:
@@ -0,0 +1,89 @@
+"""
+On-disk JSON cache with LRU eviction and TTL expiry
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+def stable_hash(*parts) -> str:
+    """SHA-256 over the JSON form of all parts (dict keys sorted so equal inputs hash equally)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+class DiskLRUCache:
+    """One JSON file per entry; file mtime is the last-access time used for LRU eviction"""
+
+    def __init__(self, directory, max_entries: int = 200, ttl_seconds: Optional[float] = None):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+
+        if self.ttl_seconds and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            # Evicted or deleted by another worker since the read
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["value"]
+
+    def set(self, key: str, value: Any):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+
+        # Write then rename so concurrent readers never see a partial entry
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created_at": time.time(), "value": value}, f, default=str, ensure_ascii=False)
+        tmp_path.replace(path)
+
+        self._evict()
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+    def _evict(self):
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except OSError:
+                continue  # Removed by another worker's eviction meanwhile
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry[0])
+        for _, path in entries[:len(entries) - self.max_entries]:
+            path.unlink(missing_ok=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(list(self.directory.glob("*.json"))) if self.directory.exists() else 0,
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,59 @@
+"""
+Per-session stdout routing via contextvars
+
+sys.stdout is replaced once, process-wide, by a router that always writes to the
+real stdout and additionally forwards to the sink of the session whose asyncio
+task is printing. Tasks inherit the context they were created in, so every node,
+code variant and tool call spawned for a session logs to that session's sink.
+"""
+
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, TextIO
+
+# (sink, echo): echo=False keeps the text off the real console
+current_log_sink: ContextVar[Optional[tuple]] = ContextVar("current_log_sink", default=None)
+
+class ContextRoutedStdout:
+    """File-like stdout that fans writes out to the current session's sink"""
+
+    def __init__(self, original: TextIO):
+        self.original = original
+
+    def write(self, text):
+        route = current_log_sink.get()
+        if route is None:
+            return self.original.write(text)
+
+        sink, echo = route
+        if echo:
+            self.original.write(text)
+        try:
+            sink.write(text)
+        except Exception:
+            pass  # A broken session sink must never break logging for everyone else
+        return len(text)
+
+    def flush(self):
+        self.original.flush()
+
+    def __getattr__(self, name):
+        # encoding, isatty, fileno, ... come from the real stdout
+        return getattr(self.original, name)
+
+def install_stdout_router():
+    """Replace sys.stdout with the context router (idempotent)"""
+    if not isinstance(sys.stdout, ContextRoutedStdout):
+        sys.stdout = ContextRoutedStdout(sys.stdout)
+    return sys.stdout
+
+@contextmanager
+def session_log_sink(sink, echo: bool = True):
+    """Route everything printed in this context (and tasks created from it) to `sink`"""
+    install_stdout_router()
+    token = current_log_sink.set((sink, echo))
+    try:
+        yield sink
+    finally:
+        current_log_sink.reset(token)
@@ -0,0 +1,164 @@
+"""
+Session -> report index, filled when report files are written
+
+Writers (process_direct_files, write_session_file, the executor's new-file scan)
+register each HTML report once with its hash, size and mtime, which also queues
+its pre-compressed siblings (utils.report_serving) on a background thread, so a
+writer on the event loop never waits for gzip/brotli. Lookups are dict
+reads on an in-memory index that is rebuilt from the shared store at startup and
+topped up from it incrementally, so reports written by other workers show up
+without ever globbing media/generated.
+"""
+
+import hashlib
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from utils.report_serving import compressed_siblings_fresh, write_compressed_siblings
+from utils.shared_store import SharedStore, get_shared_store
+
+REPORTS_ROOT = Path("media/generated")
+
+# Newest entries kept per filename / report type; enough to skip a few excluded sessions
+RECENT_PER_KEY = 8
+
+FUND_REPORT_PATTERN = re.compile(r"fund|recommendation", re.IGNORECASE)
+
+# gzip-9 / brotli-11 of a large report takes long enough to stall every SSE stream if run inline;
+# one worker keeps startup's backlog from competing with request handling for CPU
+_compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-compress")
+
+def _write_siblings(path: Path, content: bytes):
+    try:
+        write_compressed_siblings(path, content)
+    except Exception as e:
+        print(f"⚠️ Could not pre-compress {path}: {e}")
+
+def classify_report(filename: str) -> str:
+    return "fund_recommendation" if FUND_REPORT_PATTERN.search(filename) else "report"
+
+@dataclass
+class ReportEntry:
+    session_id: str
+    filename: str
+    path: str
+    report_type: str
+    size: int
+    sha256: str
+    mtime: float
+
+class ReportRegistry:
+    def __init__(self, store: SharedStore):
+        self.store = store
+        self._by_session: Dict[str, Dict[str, ReportEntry]] = defaultdict(dict)
+        self._recent_by_filename: Dict[str, List[ReportEntry]] = defaultdict(list)
+        self._recent_by_type: Dict[str, List[ReportEntry]] = defaultdict(list)
+        self._last_rowid = 0
+
+    # Write side
+
+    def register(self, session_id: str, path, content: bytes = None) -> Optional[ReportEntry]:
+        """Index an HTML report; content (when the writer has it) avoids re-reading the file"""
+        path = Path(path)
+        if path.suffix != ".html":
+            return None
+        stat = path.stat()
+        known = self._by_session.get(session_id, {}).get(path.name)
+        if known and known.mtime == stat.st_mtime and known.size == stat.st_size:
+            return known
+
+        if content is None or len(content) != stat.st_size:
+            content = path.read_bytes()  # Also covers newline translation by text-mode writes
+        entry = ReportEntry(session_id, path.name, str(path), classify_report(path.name),
+                            stat.st_size, hashlib.sha256(content).hexdigest(), stat.st_mtime)
+        if not compressed_siblings_fresh(path):
+            _compressor.submit(_write_siblings, path, content)
+        self.store.record_report(entry.session_id, entry.filename, entry.path, entry.report_type,
+                                 entry.size, entry.sha256, entry.mtime)
+        self._sync()  # Indexes our row and advances the cursor past it (plus anything other workers added)
+        return entry
+
+    def _index(self, entry: ReportEntry):
+        self._by_session[entry.session_id][entry.filename] = entry
+        for recent in (self._recent_by_filename[entry.filename], self._recent_by_type[entry.report_type]):
+            recent[:] = [e for e in recent if (e.session_id, e.filename) != (entry.session_id, entry.filename)]
+            recent.append(entry)
+            recent.sort(key=lambda e: e.mtime, reverse=True)
+            del recent[RECENT_PER_KEY:]
+
+    # Startup / cross-worker sync
+
+    def rebuild(self, scan_root: Path = REPORTS_ROOT) -> int:
+        """Reload the index from the shared store, then register reports on disk that predate the registry"""
+        self._by_session.clear()
+        self._recent_by_filename.clear()
+        self._recent_by_type.clear()
+        self._last_rowid = 0
+        self._sync()
+
+        started = time.perf_counter()
+        added = 0
+        if scan_root.exists():
+            for path in scan_root.glob("*/*.html"):
+                if path.name not in self._by_session.get(path.parent.name, {}):
+                    self.register(path.parent.name, path)
+                    added += 1
+        indexed = sum(len(reports) for reports in self._by_session.values())
+        print(f"📇 Report registry: {indexed} reports indexed ({added} from disk scan, {time.perf_counter() - started:.2f}s)")
+        return indexed
+
+    def discover(self, patterns: Iterable[str], session_id: str = None) -> int:
+        """Register reports matching glob patterns that no writer registered (other pipelines, external tools)"""
+        added = 0
+        for pattern in patterns:
+            for path in REPORTS_ROOT.glob(f"{session_id or '*'}/{pattern}"):
+                if path.name not in self._by_session.get(path.parent.name, {}):
+                    self.register(path.parent.name, path)
+                    added += 1
+        return added
+
+    def _sync(self):
+        """Pick up reports registered by other workers since the last sync (one indexed query, usually empty)"""
+        for row in self.store.reports_since(self._last_rowid):
+            self._last_rowid = max(self._last_rowid, row["rowid"])
+            self._index(ReportEntry(row["session_id"], row["filename"], row["path"], row["report_type"],
+                                    row["size"], row["sha256"], row["mtime"]))
+
+    # Read side
+
+    def get(self, session_id: str, filename: str) -> Optional[ReportEntry]:
+        self._sync()
+        return self._by_session.get(session_id, {}).get(filename)
+
+    def latest(self, session_id: str = None, filenames: Iterable[str] = (), report_types: Iterable[str] = (),
+               exclude_session_id: str = None) -> Optional[ReportEntry]:
+        """Newest report matching any of filenames / report_types, within one session or across all"""
+        self._sync()
+        if session_id:
+            candidates = [entry for entry in self._by_session.get(session_id, {}).values()
+                          if entry.filename in filenames or entry.report_type in report_types]
+        else:
+            candidates = [entry for name in filenames for entry in self._recent_by_filename.get(name, [])]
+            candidates += [entry for kind in report_types for entry in self._recent_by_type.get(kind, [])]
+        candidates = [entry for entry in candidates if entry.session_id != exclude_session_id]
+        return max(candidates, key=lambda entry: entry.mtime, default=None)
+
+    def get_stats(self) -> dict:
+        return {
+            "sessions": len(self._by_session),
+            "reports": sum(len(reports) for reports in self._by_session.values())
+        }
+
+_report_registry: Optional[ReportRegistry] = None
+
+def get_report_registry() -> ReportRegistry:
+    """Process-wide registry over the shared store"""
+    global _report_registry
+    if _report_registry is None:
+        _report_registry = ReportRegistry(get_shared_store())
+    return _report_registry
@@ -0,0 +1,115 @@
+"""
+Conditional, pre-compressed serving of generated HTML reports
+
+Reports are immutable once written, so the expensive parts happen once at
+registration time: the content hash becomes a strong ETag and `.gz` (plus `.br`
+when the brotli package is installed) siblings are written next to the report.
+Requests are then answered with a 304 on a matching If-None-Match, or with a
+FileResponse streamed from disk (sendfile/pathsend where the server supports
+it) - the pre-compressed sibling when the client accepts it, the plain file for
+Range requests.
+"""
+
+import gzip
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Below this a compressed copy saves less than its extra round of headers
+MIN_COMPRESS_SIZE = 512
+
+# Preferred first; only encodings whose encoder is available are written
+COMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# Revalidate every time (report filenames are reused across sessions) - a cheap 304 via the ETag
+REPORT_CACHE_CONTROL = "no-cache"
+
+def _compress(encoding: str, content: bytes) -> Optional[bytes]:
+    if encoding == "gzip":
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(content, mode=brotli.MODE_TEXT, quality=11)
+    return None
+
+def is_compressed_sibling(path) -> bool:
+    return Path(path).suffix in COMPRESSED_SUFFIXES.values()
+
+def write_compressed_siblings(path, content: bytes):
+    """Write report.html.gz / report.html.br, stamped with the report's mtime so stale copies are detectable"""
+    path = Path(path)
+    if len(content) < MIN_COMPRESS_SIZE:
+        return
+    mtime = path.stat().st_mtime
+    for encoding, suffix in COMPRESSED_SUFFIXES.items():
+        compressed = _compress(encoding, content)
+        if compressed is None or len(compressed) >= len(content):
+            continue
+        sibling = path.with_name(path.name + suffix)
+        temp = sibling.with_name(sibling.name + ".tmp")
+        temp.write_bytes(compressed)
+        os.utime(temp, (mtime, mtime))
+        os.replace(temp, sibling)  # Readers never see a half-written sibling
+
+def compressed_siblings_fresh(path) -> bool:
+    """True when a pre-compressed copy at least as new as the report exists (nothing to recompress)"""
+    path = Path(path)
+    mtime = path.stat().st_mtime
+    for suffix in COMPRESSED_SUFFIXES.values():
+        sibling = path.with_name(path.name + suffix)
+        if sibling.exists() and sibling.stat().st_mtime >= mtime:
+            return True
+    return False
+
+def _accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.lower())
+    return accepted
+
+def _matches(if_none_match: str, etags: Dict[Optional[str], str]) -> bool:
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or bool(candidates & set(etags.values()))
+
+def report_response(request: Request, path, sha256: Optional[str] = None) -> Response:
+    """
+    Serve one report file; sha256 is the registered content hash (None for
+    unregistered files, which get Starlette's mtime/size ETag and no compression)
+    """
+    path = Path(path)
+    stat = path.stat()
+    headers = {"Cache-Control": REPORT_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if sha256 is None:
+        return FileResponse(path, media_type="text/html", headers=headers, stat_result=stat)
+
+    # One strong ETag per representation; any of them validates the (identical) content
+    etags = {None: f'"{sha256}"'}
+    etags.update({encoding: f'"{sha256}-{encoding}"' for encoding in COMPRESSED_SUFFIXES})
+
+    encoding = None
+    if "range" not in request.headers:  # Byte ranges always address the identity representation
+        accepted = _accepted_encodings(request)
+        for candidate, suffix in COMPRESSED_SUFFIXES.items():
+            sibling = path.with_name(path.name + suffix)
+            if candidate in accepted and sibling.exists() and sibling.stat().st_mtime == stat.st_mtime:
+                encoding, path, stat = candidate, sibling, sibling.stat()
+                break
+    headers["ETag"] = etags[encoding]
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etags):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    # FileResponse handles Range/If-Range and streams the file without reading it into memory
+    return FileResponse(path, media_type="text/html", headers=headers, stat_result=stat)
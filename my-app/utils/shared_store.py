@@ -0,0 +1,254 @@
+"""
+Cross-process state in one SQLite database (WAL mode)
+
+Every uvicorn/gunicorn worker opens its own connections to the same file, so
+session metadata, event logs, the report index, daily token usage, the LLM
+rate-limit buckets and the job queue are visible to whichever worker a request lands on. WAL lets readers
+proceed while one writer commits; busy_timeout absorbs short write contention
+between workers. Within a process each thread (event loop, asyncio.to_thread
+workers, background writers) gets its own connection, so one thread's
+transaction never picks up another thread's statements.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# Identifies this process in session/job ownership columns
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+SESSION_TERMINAL_STATUSES = ("completed", "failed", "aborted")
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    worker_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions(status);
+
+CREATE TABLE IF NOT EXISTS session_events (
+    session_id TEXT NOT NULL,
+    event_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    PRIMARY KEY (session_id, event_id)
+);
+
+CREATE TABLE IF NOT EXISTS reports (
+    session_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    report_type TEXT,
+    size INTEGER,
+    sha256 TEXT,
+    mtime REAL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, filename)
+);
+
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day TEXT NOT NULL,
+    model TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    thinking_tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, model)
+);
+
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    bucket TEXT PRIMARY KEY,
+    available REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+class SharedStore:
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SHARED_SCHEMA)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The calling thread's connection (opened on first use)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; multi-statement writes go through transaction()
+            conn = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; plenty for progress events
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction that takes the database write lock up front (atomic claim/compare-and-set)"""
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # Sessions
+
+    def upsert_session(self, session_id: str, status: str, worker_id: str = WORKER_ID):
+        now = time.time()
+        self.conn.execute("""
+            INSERT INTO sessions (session_id, status, worker_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET status = excluded.status, worker_id = excluded.worker_id,
+                                                  updated_at = excluded.updated_at
+        """, (session_id, status, worker_id, now, now))
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_sessions(self, statuses: tuple = ("queued", "running"), limit: int = 100) -> List[Dict[str, Any]]:
+        placeholders = ", ".join("?" for _ in statuses)
+        rows = self.conn.execute(
+            f"SELECT * FROM sessions WHERE status IN ({placeholders}) ORDER BY created_at DESC LIMIT ?",
+            (*statuses, limit)
+        )
+        return [dict(row) for row in rows]
+
+    # Session events
+
+    def append_events(self, rows: List[tuple]):
+        """Batch of (session_id, event_id, type, data JSON, timestamp) rows in one transaction"""
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO session_events (session_id, event_id, type, data, timestamp) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def read_events(self, session_id: str, after_id: int = 0) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT * FROM session_events WHERE session_id = ? AND event_id > ? ORDER BY event_id",
+            (session_id, after_id)
+        )
+        return [{**dict(row), "data": json.loads(row["data"])} for row in rows]
+
+    def last_event_id(self, session_id: str) -> int:
+        (last_id,) = self.conn.execute(
+            "SELECT COALESCE(MAX(event_id), 0) FROM session_events WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return last_id
+
+    # Report index
+
+    def record_report(self, session_id: str, filename: str, path: str, report_type: str = None,
+                      size: int = None, sha256: str = None, mtime: float = None):
+        # REPLACE gives the row a new rowid, so reports_since() also sees rewritten reports
+        self.conn.execute(
+            "INSERT OR REPLACE INTO reports (session_id, filename, path, report_type, size, sha256, mtime, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (session_id, filename, str(path), report_type, size, sha256, mtime, time.time())
+        )
+
+    def reports_since(self, rowid: int = 0) -> List[Dict[str, Any]]:
+        rows = self.conn.execute("SELECT rowid, * FROM reports WHERE rowid > ? ORDER BY rowid", (rowid,))
+        return [dict(row) for row in rows]
+
+    # Token usage
+
+    def add_daily_usage(self, day: str, model: str, usage: Dict[str, Any], calls: int = 1):
+        # Increment in SQL so concurrent workers never lose each other's calls
+        self.conn.execute("""
+            INSERT INTO usage_daily (day, model, calls, input_tokens, output_tokens, cached_tokens, thinking_tokens, cost)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(day, model) DO UPDATE SET calls = calls + excluded.calls,
+                input_tokens = input_tokens + excluded.input_tokens,
+                output_tokens = output_tokens + excluded.output_tokens,
+                cached_tokens = cached_tokens + excluded.cached_tokens,
+                thinking_tokens = thinking_tokens + excluded.thinking_tokens,
+                cost = cost + excluded.cost
+        """, (day, model, calls, usage.get("input_tokens", 0), usage.get("output_tokens", 0), usage.get("cached_tokens", 0),
+              usage.get("thinking_tokens", 0), usage.get("cost", 0.0)))
+
+    def daily_usage(self, since_day: str, until_day: str = None) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT * FROM usage_daily WHERE day >= ? AND day <= ? ORDER BY day, model",
+            (since_day, until_day or since_day)
+        )
+        return [dict(row) for row in rows]
+
+    # Rate-limit buckets (refill continuously to `capacity` per minute, wall clock so every worker agrees)
+
+    def _bucket_level(self, conn, bucket: str, capacity: float, now: float) -> float:
+        row = conn.execute("SELECT available, updated_at FROM rate_buckets WHERE bucket = ?", (bucket,)).fetchone()
+        if row is None:
+            return capacity
+        return min(capacity, row["available"] + max(0.0, now - row["updated_at"]) * capacity / 60.0)
+
+    def take_from_buckets(self, requests: List[tuple]) -> float:
+        """
+        Atomically take `amount` from every (bucket, capacity, amount) when all have room;
+        otherwise take nothing and return the seconds until they would (oversized amounts wait for a full bucket)
+        """
+        with self.transaction() as conn:
+            now = time.time()
+            levels, wait = [], 0.0
+            for bucket, capacity, amount in requests:
+                level, amount = self._bucket_level(conn, bucket, capacity, now), min(amount, capacity)
+                if level < amount:
+                    wait = max(wait, (amount - level) / (capacity / 60.0))
+                levels.append((bucket, level - amount))
+            if wait == 0.0:
+                conn.executemany("INSERT OR REPLACE INTO rate_buckets (bucket, available, updated_at) VALUES (?, ?, ?)",
+                                 [(bucket, available, now) for bucket, available in levels])
+            return wait
+
+    def adjust_bucket(self, bucket: str, capacity: float, amount: float):
+        """Take (or, when negative, give back) units after the fact; the bucket may go into debt"""
+        with self.transaction() as conn:
+            now = time.time()
+            available = min(capacity, self._bucket_level(conn, bucket, capacity, now) - amount)
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (bucket, available, updated_at) VALUES (?, ?, ?)",
+                         (bucket, available, now))
+
+    def bucket_level(self, bucket: str, capacity: float) -> float:
+        return self._bucket_level(self.conn, bucket, capacity, time.time())
+
+    # Settings
+
+    def get_setting(self, key: str, default: str = None) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_setting(self, key: str, value: str):
+        self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+
+_shared_store: Optional[SharedStore] = None
+
+def get_shared_store() -> SharedStore:
+    """This process's connection to the shared database (opened on first use)"""
+    global _shared_store
+    if _shared_store is None:
+        from agentLoop.flow import load_profile_section
+        config = load_profile_section("shared_store", {"database": "memory/shared_state.db"})
+        _shared_store = SharedStore(config["database"])
+    return _shared_store
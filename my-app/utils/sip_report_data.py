@@ -0,0 +1,185 @@
+"""
+Structured SIP report data (comprehensive_report.json) and deterministic fund template population
+
+A SIP session's SIPGoalPlannerAgent emits goal_input_json, inflation_adjusted_json,
+sip_calc_json and allocation_plan_json. When the session finishes they are
+normalized into the fund template's input structure and written next to
+comprehensive_report.html, so a fund recommendation fills its orchestrator
+template with plain string substitution instead of sending the whole report
+HTML to the model.
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from agentLoop.session_serializer import SessionSerializer
+
+REPORT_FILENAME = "comprehensive_report.html"
+SIDECAR_FILENAME = "comprehensive_report.json"
+SIDECAR_VERSION = 1
+
+SIP_OUTPUT_KEYS = ("goal_input_json", "inflation_adjusted_json", "sip_calc_json", "allocation_plan_json")
+
+# Fund ranking weights per risk policy (cagr, sharpe, expense, rating, consistency, liquidity_or_downside)
+RISK_FUND_WEIGHTS = {
+    "very_low": (0.10, 0.20, 0.20, 0.25, 0.15, 0.10),
+    "low": (0.15, 0.20, 0.20, 0.20, 0.15, 0.10),
+    "low_moderate": (0.20, 0.25, 0.15, 0.15, 0.15, 0.10),
+    "moderate": (0.25, 0.25, 0.15, 0.15, 0.10, 0.10),
+    "high_moderate": (0.30, 0.25, 0.15, 0.10, 0.10, 0.10),
+    "high": (0.35, 0.25, 0.10, 0.10, 0.10, 0.10),
+    "very_high": (0.40, 0.25, 0.10, 0.05, 0.10, 0.10),
+}
+WEIGHT_NAMES = ("cagr", "sharpe", "expense", "rating", "consistency", "liquidity_or_downside")
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+def sidecar_path(report_path) -> Path:
+    return Path(report_path).with_name(SIDECAR_FILENAME)
+
+def normalize_risk(risk_appetite: str) -> str:
+    """'High-Moderate' / 'high moderate' -> 'high_moderate'"""
+    return re.sub(r"[\s-]+", "_", str(risk_appetite).strip().lower())
+
+def _number(value):
+    """Agents emit numbers as numbers or numeric strings; integral floats become ints"""
+    if isinstance(value, str):
+        value = float(value.replace(",", ""))
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def find_sip_outputs(output_chain: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """First occurrence of each SIP_OUTPUT_KEYS object anywhere in a session's output chain"""
+    found = {}
+
+    def walk(value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key in SIP_OUTPUT_KEYS and isinstance(item, dict):
+                    found.setdefault(key, item)
+                else:
+                    walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    walk(output_chain)
+    return found
+
+def extract_sip_report_data(output_chain: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Fund template input structure from a SIP session's outputs; None for non-SIP or incomplete sessions"""
+    outputs = find_sip_outputs(output_chain)
+    if len(outputs) < len(SIP_OUTPUT_KEYS):
+        return None
+    goal, inflation, sip, allocation = (outputs[key] for key in SIP_OUTPUT_KEYS)
+
+    try:
+        monthly_sip = _number(sip["monthly_sip"])
+        equity_percent = _number(allocation["equity_percent"])
+        debt_percent = _number(allocation["debt_percent"])
+        data = {
+            "version": SIDECAR_VERSION,
+            "investment_profile": {
+                "goal_type": goal["goal_type"],
+                "current_age": _number(goal.get("current_age", 0)),
+                "event_age_or_target": _number(goal.get("event_age_or_target", 0)),
+                "risk_appetite": normalize_risk(goal["risk_appetite"]),
+                "time_horizon": _number(goal["time_horizon_years"]),
+                "monthly_sip_required": monthly_sip,
+                "target_amount_inflation_adjusted": _number(inflation["adjusted_target"]),
+                "assumed_annual_return": round(_number(sip["monthly_return_r"]) * 12 * 100, 2),
+                "unadjusted_target": _number(inflation["unadjusted_target"]),
+                "inflation_rate": _number(inflation["inflation_pct"]),
+            },
+            "asset_allocation": {
+                "equity_percent": equity_percent,
+                "debt_percent": debt_percent,
+                "allocation_strategy": f"{equity_percent}% Equity / {debt_percent}% Debt",
+                "recommended_fund_categories": allocation.get("recommended_fund_categories", {}),
+            },
+            "portfolio_requirements": {
+                "total_monthly_amount": monthly_sip,
+                "equity_monthly_amount": round(monthly_sip * equity_percent / 100, 2),
+                "debt_monthly_amount": round(monthly_sip * debt_percent / 100, 2),
+            },
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"⚠️ SIP outputs incomplete, no report data: {e}")
+        return None
+
+    note = allocation.get("notes", {}).get(data["investment_profile"]["risk_appetite"])
+    data["asset_allocation"]["notes"] = note
+    return data
+
+def write_sip_report_sidecar(session_id: str, output_chain: Dict[str, Any]) -> Optional[Path]:
+    """Write comprehensive_report.json beside the session's SIP report (no-op for sessions without one)"""
+    report_path = Path(f"media/generated/{session_id}/{REPORT_FILENAME}")
+    if not report_path.exists():
+        return None
+    data = extract_sip_report_data(output_chain)
+    if data is None:
+        return None
+    path = sidecar_path(report_path)
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    return path
+
+def load_sip_report_data(report_path, session_id: str = None) -> Optional[Dict[str, Any]]:
+    """Sidecar for a SIP report; reports that predate sidecars get one built from their session file"""
+    path = sidecar_path(report_path)
+    if path.exists():
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("version") == SIDECAR_VERSION:
+                return data
+        except json.JSONDecodeError as e:
+            print(f"⚠️ Unreadable report sidecar {path}: {e}")
+
+    session_id = session_id or Path(report_path).parent.name
+    session_file = SessionSerializer.find_session_file(session_id)
+    if not session_file:
+        return None
+    graph = json.loads(session_file.read_text(encoding="utf-8")).get("graph", {})
+    if write_sip_report_sidecar(session_id, graph.get("output_chain", {})):
+        return json.loads(path.read_text(encoding="utf-8"))
+    return None
+
+def fund_template_values(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Every fund template placeholder derived from report data"""
+    profile = data["investment_profile"]
+    allocation = data["asset_allocation"]
+    requirements = data["portfolio_requirements"]
+    risk = profile["risk_appetite"]
+    weights = dict(zip(WEIGHT_NAMES, RISK_FUND_WEIGHTS.get(risk, RISK_FUND_WEIGHTS["moderate"])))
+
+    categories = allocation.get("recommended_fund_categories") or {}
+    notes = [f"Optimized for {profile['goal_type']} with {profile['time_horizon']}-year horizon"]
+    if categories.get("equity") or categories.get("debt"):
+        notes.append("Categories: " + ", ".join(categories.get("equity", []) + categories.get("debt", [])))
+    if allocation.get("notes"):
+        notes.append(allocation["notes"])
+
+    return {
+        "GOAL_TYPE": profile["goal_type"].upper(),
+        "TIME_HORIZON": profile["time_horizon"],
+        "time_horizon": profile["time_horizon"],
+        "time_horizon_years": profile["time_horizon"],
+        **profile,
+        **{key: value for key, value in allocation.items() if not isinstance(value, (dict, type(None)))},
+        **requirements,
+        **{f"weight_{name}": weight for name, weight in weights.items()},
+        "early_phase_focus": "Growth and accumulation",
+        "mid_phase_focus": "Balanced growth and risk management",
+        "final_phase_focus": f"Capital preservation and liquidity ahead of the {profile['goal_type']} goal",
+        "goal_specific_notes": "; ".join(notes),
+    }
+
+def populate_fund_template(template: str, data: Dict[str, Any]) -> str:
+    """Fill the fund orchestrator template from report data; ValueError names any placeholder left unfilled"""
+    values = fund_template_values(data)
+    missing = sorted({name for name in PLACEHOLDER_PATTERN.findall(template) if name not in values})
+    if missing:
+        raise ValueError(f"No report data for template placeholders: {', '.join(missing)}")
+    return PLACEHOLDER_PATTERN.sub(lambda match: str(values[match.group(1)]), template)